@@ -11,6 +11,24 @@ class Settings(BaseModel):
     RAG_QUANTITY: int = int(os.getenv("RAG_QUANTITY", 5))
     RAG_THRESHOLD_SIMILARITY: float = float(os.getenv("RAG_THRESHOLD_SIMILARITY", 0.3))
     RAG_USE_CHUNK_CHAIN: bool = os.getenv("RAG_USE_CHUNK_CHAIN", "False")
+
+    # --- CONEXÕES E LIMITES DA RAG_TOOL
+    RAG_MAX_CONNECTIONS: int = int(os.getenv("RAG_MAX_CONNECTIONS", 50))
+    RAG_MAX_KEEPALIVE_CONNECTIONS: int = int(os.getenv("RAG_MAX_KEEPALIVE_CONNECTIONS", 20))
+    RAG_KEEPALIVE_EXPIRY: float = float(os.getenv("RAG_KEEPALIVE_EXPIRY", 30.0))
+    RAG_MAX_CONCURRENCY: int = int(os.getenv("RAG_MAX_CONCURRENCY", 50))
+    RAG_RATE_LIMIT: float = float(os.getenv("RAG_RATE_LIMIT", 20.0))  # requisições/s (0 = sem limite)
+    RAG_RATE_BURST: int = int(os.getenv("RAG_RATE_BURST", 50))
+
+    # --- CACHE DAS BUSCAS NO RAG
+    RAG_CACHE_ENABLED: bool = os.getenv("RAG_CACHE_ENABLED", "True").lower() in ("1", "true", "yes")
+    RAG_CACHE_TTL: float = float(os.getenv("RAG_CACHE_TTL", 86400.0))  # segundos (0 = não expira)
+    RAG_CACHE_MAX_ENTRIES: int = int(os.getenv("RAG_CACHE_MAX_ENTRIES", 1000))
+    RAG_CACHE_DIR: str = os.getenv("RAG_CACHE_DIR", "")  # vazio = só em memória
+
+    # --- REGISTRO DE INGESTÃO (conteúdo já enviado ao RAG)
+    RAG_INGESTION_REGISTRY: str = os.getenv("RAG_INGESTION_REGISTRY", ".rag_ingestion.json")
+    RAG_INGESTION_WORKERS: int = int(os.getenv("RAG_INGESTION_WORKERS", 8))
     
     # --- INDEXES DOS PROJETOS
     RAG_INDEX_ID_QUERY_ENGINE: str = os.getenv("RAG_INDEX_ID_QUERY_ENGINE")
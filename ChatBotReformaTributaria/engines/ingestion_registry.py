@@ -0,0 +1,81 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+from core.config import settings
+
+# Tamanho do bloco lido ao calcular o hash do arquivo
+CHUNK_BYTES = 1 << 20
+
+
+def content_fingerprint(file_path: str, **params) -> str:
+    """
+    Hash do conteúdo do arquivo junto com os parâmetros da ingestão (OCR,
+    chunk, modelo...): o mesmo texto com outro chunk_size, por exemplo,
+    gera embeddings diferentes e outra entrada.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(CHUNK_BYTES), b''):
+            digest.update(block)
+    digest.update(json.dumps(params, sort_keys=True, ensure_ascii=False).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def sources_fingerprint(sources_ids, **params) -> str:
+    """Hash de um conjunto de sources (sem ordem) com os parâmetros do indexer"""
+    text = json.dumps([sorted(sources_ids), params], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class IngestionRegistry:
+    """
+    Registro local do que já foi enviado ao RAG: fingerprint do conteúdo ->
+    document_id / source_id, e fingerprint dos sources + nome -> index_id.
+
+    Cada id é gravado assim que é criado, então uma ingestão interrompida
+    continua da etapa que faltou (o documento não é enviado de novo).
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path or settings.RAG_INGESTION_REGISTRY
+        self._lock = threading.Lock()
+        self._entries = self._load()
+
+    def _load(self) -> dict:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _save(self):
+        """Grava o registro (escrita atômica)"""
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        temp = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp, 'w', encoding='utf-8') as f:
+            json.dump(self._entries, f, ensure_ascii=False, indent=2)
+        os.replace(temp, self.path)
+
+    def get(self, fingerprint: str) -> dict:
+        """Ids já registrados para o conteúdo (dict vazio se nunca foi enviado)"""
+        with self._lock:
+            return dict(self._entries.get(fingerprint, {}))
+
+    def record(self, fingerprint: str, **values):
+        """Acrescenta ids (e metadados) à entrada do conteúdo e grava o registro"""
+        with self._lock:
+            entry = self._entries.setdefault(fingerprint, {})
+            entry.update(values)
+            entry["updated_at"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+            self._save()
+
+    def forget(self, fingerprint: str):
+        """Remove o conteúdo do registro (a próxima ingestão cria tudo de novo)"""
+        with self._lock:
+            if self._entries.pop(fingerprint, None) is not None:
+                self._save()
@@ -1,14 +1,121 @@
 import asyncio
+import os
+import time
 import requests
 import httpx
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 
 from core.config import settings
+from engines.rag_cache import RAGCache
+from engines.ingestion_registry import IngestionRegistry, content_fingerprint, sources_fingerprint
+
+class RateLimiter:
+    """
+    Limita a taxa de requisições (token bucket): até `burst` requisições
+    imediatas e depois `rate` por segundo. rate <= 0 desliga o limite.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._last = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """Espera até a próxima requisição poder sair"""
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            # Reserva o token já (saldo negativo = fila), a espera fica fora do lock
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait > 0:
+            await asyncio.sleep(wait)
+
 
 class RAGBridge:
     """Conecta com o RAG interno"""
     
-    def __init__(self,):
+    def __init__(self, cache: RAGCache = None, registry: IngestionRegistry = None):
         self.base_url = "https://libindexr.dev.saiapplications.com"
+
+        # Conteúdos já enviados (fingerprint -> document/source/index ids)
+        self.registry = registry if registry is not None else IngestionRegistry()
+
+        # Cache das buscas (padrão: configurado por RAG_CACHE_*; acertos/faltas em self.cache.stats())
+        self.cache = cache if cache is not None else RAGCache.from_settings()
+
+        # Sessão compartilhada (keep-alive) para as chamadas síncronas
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=settings.RAG_MAX_CONNECTIONS)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        # Cliente assíncrono, semáforo e limitador: criados no primeiro uso,
+        # pois ficam presos ao event loop em que foram criados
+        self._client = None
+        self._closer = None
+        self._semaphore = None
+        self._limiter = None
+        self._loop = None
+
+    async def _async_resources(self):
+        """
+        Cliente httpx (com pool de conexões), semáforo e limitador do event loop atual.
+
+        Eles pertencem ao loop em que foram criados. O cliente é fechado no
+        próprio loop, por aclose() ou, se ninguém chamar, quando o loop
+        termina (asyncio.run encerra os geradores assíncronos antes de
+        fechar); num loop novo os três são recriados.
+        """
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            self._client = httpx.AsyncClient(
+                timeout=settings.RAG_REQUEST_TIMEOUT,
+                limits=httpx.Limits(
+                    max_connections=settings.RAG_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.RAG_MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=settings.RAG_KEEPALIVE_EXPIRY,
+                ),
+            )
+            self._closer = self._close_with_loop(self._client)
+            await self._closer.__anext__()
+            self._semaphore = asyncio.Semaphore(settings.RAG_MAX_CONCURRENCY)
+            self._limiter = RateLimiter(settings.RAG_RATE_LIMIT, settings.RAG_RATE_BURST)
+            self._loop = loop
+        return self._client, self._semaphore, self._limiter
+
+    @staticmethod
+    async def _close_with_loop(client):
+        """Fica suspenso enquanto o cliente é usado; ao ser encerrado fecha o cliente"""
+        try:
+            yield
+        finally:
+            await client.aclose()
+
+    async def aclose(self):
+        """Fecha o cliente assíncrono (as conexões abertas do pool) e descarta semáforo e limitador"""
+        closer = self._closer if self._loop is asyncio.get_running_loop() else None
+        self._client = self._closer = self._semaphore = self._limiter = self._loop = None
+        if closer is not None:
+            await closer.aclose()
+
+    def close(self):
+        """Fecha a sessão síncrona"""
+        self.session.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+        self.close()
+        return False
     
     def create_document(self, file_path, use_ocr=False):
         """
@@ -25,7 +132,7 @@ class RAGBridge:
                 'file': (file_path.split('/')[-1], f)
             }
             data = {'useOCR': str(use_ocr).lower()}
-            response = requests.post(url, files=files, data=data)
+            response = self.session.post(url, files=files, data=data)
         try:
             return response.json()
         except Exception:
@@ -53,7 +160,7 @@ class RAGBridge:
             "usingAISummary": using_ai_summary,
             "model": model
         }
-        response = requests.post(url, json=payload, headers=headers)
+        response = self.session.post(url, json=payload, headers=headers)
         try:
             return response.json()
         except Exception:
@@ -74,12 +181,176 @@ class RAGBridge:
             "indexName": index_name,
             "sourcesIds": sources_ids
         }
-        response = requests.post(url, json=payload, headers=headers)
+        response = self.session.post(url, json=payload, headers=headers)
         try:
             return response.json()
         except Exception:
             return {'status_code': response.status_code, 'text': response.text}
 
+    def ingest(self, file_path, index_name, use_ocr=False, chunk_size=1000, using_ai_summary=False, model="TEXT-EMBEDDING-3-LARGE"):
+        """
+        Cria documento, source e indexer para o arquivo, pulando o que já foi
+        criado para o mesmo conteúdo (e os mesmos parâmetros).
+
+        Documento e source são registrados pelo conteúdo (o mesmo texto não é
+        enviado nem embedado de novo para outro índice); o indexer, pelo
+        source + index_name. Um conteúdo já registrado não faz nenhuma
+        chamada à API; se uma etapa falhou antes, continua dela. Se uma etapa
+        falhar agora, para e devolve os ids obtidos até ali com o erro.
+
+        Returns: dict com fingerprint, document_id, source_id, index_id, reused e error
+        """
+        document = self._ingest_source(file_path, use_ocr, chunk_size, using_ai_summary, model)
+        result = {
+            "fingerprint": document["fingerprint"],
+            "document_id": document["document_id"],
+            "source_id": document["source_id"],
+            "index_id": None,
+            "reused": document["reused"],
+            "error": document["error"],
+        }
+        if result["error"] is None:
+            index = self._ingest_index([result["source_id"]], index_name)
+            result["index_id"] = index["index_id"]
+            result["reused"] = result["reused"] and index["reused"]
+            result["error"] = index["error"]
+        return result
+
+    def _ingest_index(self, sources_ids, index_name):
+        """Indexer dos sources (registrado pelo conjunto de sources + index_name)"""
+        index = {"fingerprint": sources_fingerprint(sources_ids, index_name=index_name), "index_id": None}
+        index["index_id"] = self.registry.get(index["fingerprint"]).get("index_id")
+        index["reused"] = bool(index["index_id"])
+        steps = (("index_id", lambda: self.create_indexer(index_name=index_name, sources_ids=sources_ids)),)
+        index["error"] = self._create_missing(index, steps, index_name=index_name, sources_ids=sources_ids)
+        return index
+
+    def _create_missing(self, result, steps, **metadata):
+        """
+        Executa as etapas (id, função de criação) cujo id ainda falta em
+        result, registrando cada id criado. Para na primeira falha e
+        devolve a mensagem de erro (None se tudo foi criado).
+        """
+        for step, create in steps:
+            if result[step]:
+                continue
+            response = create()
+            created_id = response.get('id')
+            if not created_id:
+                error = f"Erro na ingestão ({step}): {response}"
+                print(error)
+                return error
+            result[step] = created_id
+            self.registry.record(result["fingerprint"], **metadata, **{step: created_id})
+        return None
+
+    @staticmethod
+    def _document_fingerprint(file_path, use_ocr, chunk_size, using_ai_summary, model):
+        """Fingerprint de documento + source (conteúdo e parâmetros de ingestão, sem o índice)"""
+        return content_fingerprint(
+            file_path, use_ocr=use_ocr, chunk_size=chunk_size, using_ai_summary=using_ai_summary, model=model
+        )
+
+    def _ingest_source(self, file_path, use_ocr, chunk_size, using_ai_summary, model, fingerprint=None):
+        """Documento + source de um arquivo (reaproveitando o registro), com o tempo gasto"""
+        start = time.perf_counter()
+        result = {"file_path": file_path, "fingerprint": fingerprint, "document_id": None, "source_id": None,
+                  "reused": False, "error": None}
+        try:
+            if result["fingerprint"] is None:
+                result["fingerprint"] = self._document_fingerprint(file_path, use_ocr, chunk_size, using_ai_summary, model)
+            result.update({
+                step: value
+                for step, value in self.registry.get(result["fingerprint"]).items()
+                if step in ("document_id", "source_id")
+            })
+            result["reused"] = bool(result["source_id"])
+            steps = (
+                ("document_id", lambda: self.create_document(file_path=file_path, use_ocr=use_ocr)),
+                ("source_id", lambda: self.create_source(
+                    document_id=result["document_id"], chunk_size=chunk_size, using_ai_summary=using_ai_summary, model=model
+                )),
+            )
+            result["error"] = self._create_missing(result, steps, file_name=os.path.basename(file_path))
+        except Exception as e:
+            result["error"] = f"Erro na ingestão: {e}"
+            print(f"{result['error']} ({file_path})")
+        result["seconds"] = round(time.perf_counter() - start, 3)
+        return result
+
+    def ingest_many(self, file_paths, index_name, use_ocr=False, chunk_size=1000, using_ai_summary=False, model="TEXT-EMBEDDING-3-LARGE", max_workers=None):
+        """
+        Envia vários arquivos em paralelo (documento e source de cada um em
+        até max_workers threads) e cria um único indexer com todos os sources.
+
+        Arquivos já enviados com os mesmos parâmetros reaproveitam documento
+        e source; arquivos de conteúdo igual na mesma chamada são enviados
+        uma vez só (os demais vêm com duplicate_of). O mesmo conjunto de
+        sources com o mesmo index_name reaproveita o indexer. Arquivos com
+        falha ficam fora do indexer.
+
+        Returns: dict com index_id, documents (por arquivo: ids, reused,
+        seconds, error), failed (arquivos com erro) e seconds (total)
+        """
+        start = time.perf_counter()
+        file_paths = list(file_paths)
+        max_workers = max_workers or settings.RAG_INGESTION_WORKERS
+
+        def fingerprint(path):
+            try:
+                return self._document_fingerprint(path, use_ocr, chunk_size, using_ai_summary, model), None
+            except Exception as e:
+                print(f"Erro na ingestão: {e} ({path})")
+                return None, f"Erro na ingestão: {e}"
+
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(file_paths) or 1))) as pool:
+            fingerprints = list(pool.map(fingerprint, file_paths))
+            # Primeiro arquivo de cada conteúdo: só ele vai para a API
+            first_path = {}
+            for path, (document_fingerprint, _) in zip(file_paths, fingerprints):
+                if document_fingerprint is not None:
+                    first_path.setdefault(document_fingerprint, path)
+            ingested = dict(zip(first_path, pool.map(
+                lambda item: self._ingest_source(item[1], use_ocr, chunk_size, using_ai_summary, model, fingerprint=item[0]),
+                first_path.items(),
+            )))
+
+        documents = []
+        for path, (document_fingerprint, error) in zip(file_paths, fingerprints):
+            if error is not None:
+                documents.append({"file_path": path, "fingerprint": None, "document_id": None, "source_id": None,
+                                  "reused": False, "error": error, "seconds": 0.0})
+            elif first_path[document_fingerprint] == path:
+                documents.append(ingested[document_fingerprint])
+            else:
+                documents.append(dict(ingested[document_fingerprint], file_path=path, seconds=0.0,
+                                      duplicate_of=first_path[document_fingerprint]))
+
+        failed = [doc["file_path"] for doc in documents if doc["error"]]
+        sources_ids = list(dict.fromkeys(doc["source_id"] for doc in documents if not doc["error"]))
+        report = {"index_id": None, "documents": documents, "failed": failed, "error": None}
+
+        if sources_ids:
+            index = self._ingest_index(sources_ids, index_name)
+            report["index_id"] = index["index_id"]
+            report["error"] = index["error"]
+
+        report["seconds"] = round(time.perf_counter() - start, 3)
+        print(f"Ingestão: {len(documents) - len(failed)}/{len(documents)} arquivo(s) em {report['seconds']}s, "
+              f"index_id={report['index_id']}")
+        for path in failed:
+            print(f"  [FALHA] {path}")
+        return report
+
+    def ingest_folder(self, folder, index_name, extensions=(".toon",), **kwargs):
+        """ingest_many com os arquivos da pasta que têm as extensões informadas (em ordem de nome)"""
+        file_paths = sorted(
+            os.path.join(folder, name)
+            for name in os.listdir(folder)
+            if name.lower().endswith(tuple(extensions)) and os.path.isfile(os.path.join(folder, name))
+        )
+        return self.ingest_many(file_paths, index_name, **kwargs)
+
     def query_indexer(self, pergunta: str, index_id) -> list:
         """
         Busca trechos no RAG
@@ -96,9 +367,14 @@ class RAGBridge:
             "maxChunkChainLink": 0,
             "searchQuery": pergunta
         }
+
+        if self.cache is not None:
+            cached = self.cache.get("query_indexer", payload)
+            if cached is not None:
+                return cached
         
         try:
-            response = requests.post(url, json=payload, timeout=30)
+            response = self.session.post(url, json=payload, timeout=30)
             print("Response RAG")
             print(response.status_code)
             print(response.text)
@@ -106,7 +382,10 @@ class RAGBridge:
             if response.status_code == 200:
                 data = response.json()
                 # Ajuste conforme formato real do seu RAG
-                return data.get('results', data.get('chunks', []))
+                results = data.get('results', data.get('chunks', []))
+                if self.cache is not None:
+                    self.cache.set("query_indexer", payload, results)
+                return results
             else:
                 print(f"Erro RAG: {response.status_code}")
                 return []
@@ -127,8 +406,6 @@ class RAGBridge:
             Retorna uma lista vazia em caso de erro de status HTTP.
             Levanta httpx.ConnectError em caso de falha de conexão.
         """
-        await asyncio.sleep(0.5)
-
         payload = {
             "indexId": index_id,
             "quantity": rag_quantity,
@@ -140,23 +417,33 @@ class RAGBridge:
         
         # log_extra = {"rag_query": search_query, "rag_url": settings.RAG_API_URL, "index_id": index_id}
 
+        if self.cache is not None:
+            cached = self.cache.get(f"call_rag_api {settings.RAG_API_URL}", payload)
+            if cached is not None:
+                return cached
+
+        client, semaphore, limiter = await self._async_resources()
         try:
-            async with httpx.AsyncClient(timeout=settings.RAG_REQUEST_TIMEOUT) as client:
+            async with semaphore:
+                await limiter.acquire()
                 response = await client.post(settings.RAG_API_URL, json=payload)
-                response.raise_for_status()
-                
-                data = response.json()
-                raw_contents = []
-
-                if "results" in data and isinstance(data["results"], list):
-                    for result in data["results"]:
-                        if "chunks" in result and isinstance(result["chunks"], list):
-                            for chunk_info in result["chunks"]:
-                                raw_content = chunk_info.get("chunk", {}).get("rawContent")
-                                if raw_content:
-                                    raw_contents.append(raw_content)
-                
-                return raw_contents
+            response.raise_for_status()
+
+            data = response.json()
+            raw_contents = []
+
+            if "results" in data and isinstance(data["results"], list):
+                for result in data["results"]:
+                    if "chunks" in result and isinstance(result["chunks"], list):
+                        for chunk_info in result["chunks"]:
+                            raw_content = chunk_info.get("chunk", {}).get("rawContent")
+                            if raw_content:
+                                raw_contents.append(raw_content)
+
+            # Só respostas com sucesso entram no cache
+            if self.cache is not None:
+                self.cache.set(f"call_rag_api {settings.RAG_API_URL}", payload, raw_contents)
+            return raw_contents
 
         except httpx.ConnectError as e:
             raise e
@@ -164,3 +451,27 @@ class RAGBridge:
             return []
         except Exception as e:
             return []
+
+    async def search_many(self, search_queries: list, index_id: str, rag_quantity: int = 3, threshold_similarity = 0.4, use_chunk_chain=False) -> list:
+        """
+        Executa várias buscas em paralelo (até RAG_MAX_CONCURRENCY ao mesmo
+        tempo, respeitando RAG_RATE_LIMIT) no mesmo cliente.
+
+        Returns:
+            Uma lista com o resultado de call_rag_api de cada busca, na ordem de search_queries.
+            Levanta httpx.ConnectError (depois de todas terminarem) se alguma não conectou.
+        """
+        # Perguntas repetidas na mesma leva vão uma vez só para a API
+        unique_queries = list(dict.fromkeys(search_queries))
+        results = await asyncio.gather(
+            *(
+                self.call_rag_api(query, index_id, rag_quantity, threshold_similarity, use_chunk_chain)
+                for query in unique_queries
+            ),
+            return_exceptions=True,
+        )
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+        by_query = dict(zip(unique_queries, results))
+        return [list(by_query[query]) for query in search_queries]
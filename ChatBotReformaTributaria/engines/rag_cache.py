@@ -0,0 +1,120 @@
+import copy
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from core.config import settings
+
+# Nome dos arquivos gravados pelo cache em disco (<sha256>.json)
+CACHE_FILE = re.compile(r"^[0-9a-f]{64}\.json$")
+
+class RAGCache:
+    """
+    Cache dos resultados de busca no RAG, com validade (TTL) e limite de
+    entradas em memória (LRU).
+
+    A chave é o hash do payload completo da requisição (índice, pergunta,
+    quantidade, threshold...) junto com o tipo de busca (cada método guarda
+    um formato de resultado). Os valores são copiados na entrada e na saída:
+    alterar o resultado recebido não altera o cache. Com `path`, cada
+    resultado também é gravado em <path>/<chave>.json, então outra execução
+    reaproveita as respostas sem ir à rede enquanto elas estiverem válidas.
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl: float = 86400.0, path: str = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path or None
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if self.path:
+            os.makedirs(self.path, exist_ok=True)
+
+    @classmethod
+    def from_settings(cls):
+        """Cache configurado pelas variáveis RAG_CACHE_* (None se desligado)"""
+        if not settings.RAG_CACHE_ENABLED:
+            return None
+        return cls(settings.RAG_CACHE_MAX_ENTRIES, settings.RAG_CACHE_TTL, settings.RAG_CACHE_DIR)
+
+    @staticmethod
+    def make_key(kind: str, payload: dict) -> str:
+        """Hash do tipo de busca + payload (a ordem das chaves não importa)"""
+        text = json.dumps([kind, payload], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def _expired(self, created: float) -> bool:
+        return self.ttl > 0 and time.time() - created > self.ttl
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self.path, f"{key}.json")
+
+    def _read_file(self, key: str):
+        """Entrada (criação, valor) gravada em disco, ou None"""
+        try:
+            with open(self._file(key), 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            return data['created'], data['value']
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _remember(self, key: str, entry):
+        """Guarda a entrada em memória, descartando a menos usada se passar do limite"""
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, kind: str, payload: dict):
+        """Resultado guardado para o payload (None se não houver ou tiver expirado)"""
+        key = self.make_key(kind, payload)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None and self.path:
+                entry = self._read_file(key)
+            if entry is None or self._expired(entry[0]):
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            self._remember(key, entry)
+            self.hits += 1
+            return copy.deepcopy(entry[1])
+
+    def set(self, kind: str, payload: dict, value):
+        """Guarda o resultado do payload (em memória e, se houver, em disco)"""
+        key = self.make_key(kind, payload)
+        entry = (time.time(), copy.deepcopy(value))
+        with self._lock:
+            self._remember(key, entry)
+            if self.path:
+                # Escrita atômica: outra execução nunca lê um arquivo pela metade
+                temp = f"{self._file(key)}.{os.getpid()}.tmp"
+                with open(temp, 'w', encoding='utf-8') as f:
+                    json.dump({'created': entry[0], 'payload': payload, 'value': value}, f, ensure_ascii=False)
+                os.replace(temp, self._file(key))
+
+    def clear(self):
+        """Apaga as entradas em memória e em disco (só os arquivos do cache) e zera os contadores"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+            if self.path:
+                for name in os.listdir(self.path):
+                    if CACHE_FILE.match(name):
+                        os.remove(os.path.join(self.path, name))
+
+    def stats(self) -> dict:
+        """Contadores de acertos e faltas"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self._entries),
+        }
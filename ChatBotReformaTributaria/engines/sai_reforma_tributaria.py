@@ -2,11 +2,127 @@ from typing import List, Dict, Any
 import os
 import sys
 import json
+import math
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
+try:
+    from toon_python import encode  # mesmo formato do .toon do gerar_relatorio_cenarios
+except ImportError:  # sem toon_python, as partes vão em JSON compacto
+    encode = None
+
 load_dotenv()
 
+# Orçamento de tokens (estimado) de cada parte enviada ao get_first_infos
+MAX_TOKENS_PARTE = int(os.getenv("SAI_MAX_TOKENS_PARTE", 20000))
+# Partes enviadas ao mesmo tempo
+MAX_PARTES_PARALELO = int(os.getenv("SAI_MAX_PARTES_PARALELO", 4))
+# Estimativa de caracteres por token
+CARACTERES_POR_TOKEN = 4
+# Separador entre as respostas (Markdown) das partes
+SEPARADOR_PARTES = "\n\n"
+# Envios de uma parte que falhou (além das tentativas de timeout do get_first_infos)
+TENTATIVAS_PARTE = int(os.getenv("SAI_TENTATIVAS_PARTE", 2))
+
+
+def codificar_dados(dados: Dict[str, Any]) -> str:
+    """Texto enviado ao modelo: TOON (menos tokens) ou, sem toon_python, JSON compacto"""
+    if encode is not None:
+        return encode(dados)
+    return json.dumps(dados, ensure_ascii=False, separators=(",", ":"))
+
+
+def estimar_tokens(texto: str) -> int:
+    """Estimativa de tokens do texto (CARACTERES_POR_TOKEN caracteres por token)"""
+    return math.ceil(len(texto) / CARACTERES_POR_TOKEN)
+
+
+def _partes_emitente(emitente: Dict[str, Any], max_tokens: int, total: int) -> List[Dict[str, Any]]:
+    """
+    O emitente inteiro ou, se passar do orçamento sozinho, cópias dele com
+    blocos consecutivos dos cenários (cada cenário fica inteiro numa parte).
+    """
+    if _tokens_parte([emitente], total) <= max_tokens or len(emitente.get("cenarios", [])) <= 1:
+        return [emitente]
+
+    # Custo de cada cenário medido já dentro da parte (com a mesma indentação)
+    cabecalho = {campo: valor for campo, valor in emitente.items() if campo != "cenarios"}
+    base = _tokens_parte([{**cabecalho, "cenarios": []}], total)
+    partes, atual, tokens = [], [], base
+    for cenario in emitente["cenarios"]:
+        custo = _tokens_parte([{**cabecalho, "cenarios": [cenario]}], total) - base
+        if atual and tokens + custo > max_tokens:
+            partes.append({**cabecalho, "cenarios": atual})
+            atual, tokens = [], base
+        atual.append(cenario)
+        tokens += custo
+    partes.append({**cabecalho, "cenarios": atual})
+    return partes
+
+
+def dividir_dados(dados: Dict[str, Any], max_tokens: int = MAX_TOKENS_PARTE) -> List[Dict[str, Any]]:
+    """
+    Divide a estrutura do gerar_relatorio_cenarios ({total_emitentes, emitentes})
+    em partes com o mesmo formato, cada uma dentro de max_tokens (estimado).
+
+    Os emitentes são agrupados na ordem original; um emitente maior que o
+    orçamento tem os cenários divididos entre partes seguidas. Cada parte
+    mantém o total_emitentes original e informa os da parte em
+    emitentes_na_parte.
+    """
+    total = dados.get("total_emitentes", len(dados.get("emitentes", [])))
+    pedacos = []
+    for emitente in dados.get("emitentes", []):
+        pedacos.extend(_partes_emitente(emitente, max_tokens, total))
+
+    base = _tokens_parte([], total)
+    partes, atual, tokens = [], [], base
+    for pedaco in pedacos:
+        custo = _tokens_parte([pedaco], total) - base
+        if atual and tokens + custo > max_tokens:
+            partes.append(atual)
+            atual, tokens = [], base
+        atual.append(pedaco)
+        tokens += custo
+    if atual or not partes:
+        partes.append(atual)
+
+    # Somar os pedaços é uma estimativa: partes que ainda passarem do
+    # orçamento são divididas ao meio
+    ajustadas = []
+    for parte in partes:
+        ajustadas.extend(_dividir_excedente(parte, max_tokens, total))
+    return [_montar_parte(parte, total) for parte in ajustadas]
+
+
+def _montar_parte(emitentes: List[Dict[str, Any]], total: int) -> Dict[str, Any]:
+    return {
+        "total_emitentes": total,
+        "emitentes_na_parte": len({e.get("cnpj_emissor") for e in emitentes}),
+        "emitentes": emitentes,
+    }
+
+
+def _tokens_parte(emitentes: List[Dict[str, Any]], total: int) -> int:
+    return estimar_tokens(codificar_dados(_montar_parte(emitentes, total)))
+
+
+def _dividir_excedente(emitentes: List[Dict[str, Any]], max_tokens: int, total: int) -> List[List[Dict[str, Any]]]:
+    """Divide ao meio (emitentes, ou cenários de um emitente só) até caber no orçamento"""
+    if _tokens_parte(emitentes, total) <= max_tokens:
+        return [emitentes]
+    if len(emitentes) > 1:
+        meio = len(emitentes) // 2
+        return (_dividir_excedente(emitentes[:meio], max_tokens, total)
+                + _dividir_excedente(emitentes[meio:], max_tokens, total))
+    cenarios = emitentes[0].get("cenarios", [])
+    if len(cenarios) <= 1:
+        return [emitentes]  # um cenário só não tem como dividir
+    meio = len(cenarios) // 2
+    return (_dividir_excedente([{**emitentes[0], "cenarios": cenarios[:meio]}], max_tokens, total)
+            + _dividir_excedente([{**emitentes[0], "cenarios": cenarios[meio:]}], max_tokens, total))
+
 class RTSAI:
     def __init__(self):
         self.api_key = os.getenv("SAI_API_KEY", "")
@@ -56,21 +172,59 @@ class RTSAI:
                     text = response.text
                     print(f"Conteúdo: {text}")
                 
-                if response.status_code != 200:
+                erro = response.status_code != 200
+                if erro:
                     text = f"Erro {response.status_code}: {response.text}"
                 
-                result = {"text": text.strip() if text else ""}
+                result = {"text": text.strip() if text else "", "erro": erro}
                 return [result]
                 
             except requests.exceptions.ReadTimeout:
                 print(f"\n⚠️  Timeout na tentativa {tentativa}")
                 if tentativa == max_retries:
                     print(f"\n❌ Falha após {max_retries} tentativas")
-                    return [{"text": f"Erro: Timeout após {max_retries} tentativas. A requisição demorou mais de {timeout} segundos."}]
+                    return [{"text": f"Erro: Timeout após {max_retries} tentativas. A requisição demorou mais de {timeout} segundos.", "erro": True}]
                 print("Tentando novamente...")
             except Exception as e:
                 print(f"\n❌ Erro: {e}")
-                return [{"text": f"Erro: {str(e)}"}]
+                return [{"text": f"Erro: {str(e)}", "erro": True}]
+
+    def get_first_infos_em_partes(self, dados: Dict[str, Any], max_tokens: int = MAX_TOKENS_PARTE,
+                                  max_paralelo: int = MAX_PARTES_PARALELO,
+                                  tentativas: int = TENTATIVAS_PARTE) -> List[Dict[str, Any]]:
+        """
+        get_first_infos para estruturas grandes: divide os emitentes em partes
+        de até max_tokens (em TOON), envia até max_paralelo partes ao mesmo
+        tempo e junta as respostas em Markdown na ordem das partes.
+
+        Partes com erro são reenviadas (até tentativas envios no total); as
+        que continuarem falhando ficam fora do texto e vão em partes_com_erro.
+
+        Retorna no formato do get_first_infos: [{"text", "erro", "partes", "partes_com_erro"}].
+        """
+        textos = [codificar_dados(parte) for parte in dividir_dados(dados, max_tokens)]
+        print(f"Enviando {len(textos)} parte(s) (até {max_paralelo} em paralelo)...")
+
+        respostas = [None] * len(textos)
+        pendentes = list(range(len(textos)))
+        with ThreadPoolExecutor(max_workers=max(1, min(max_paralelo, len(textos)))) as pool:
+            for envio in range(1, max(1, tentativas) + 1):
+                for indice, resposta in zip(pendentes, pool.map(self.get_first_infos, [textos[i] for i in pendentes])):
+                    respostas[indice] = resposta[0]
+                pendentes = [indice for indice in pendentes if respostas[indice].get("erro")]
+                if not pendentes:
+                    break
+                if envio < tentativas:
+                    print(f"Reenviando {len(pendentes)} parte(s) com erro...")
+
+        falhas = [{"parte": indice + 1, "erro": respostas[indice]["text"]} for indice in pendentes]
+        for falha in falhas:
+            print(f"❌ Parte {falha['parte']}/{len(textos)} sem resposta: {falha['erro']}")
+
+        texto = SEPARADOR_PARTES.join(
+            resposta["text"] for resposta in respostas if not resposta.get("erro") and resposta["text"]
+        )
+        return [{"text": texto, "erro": bool(falhas), "partes": len(textos), "partes_com_erro": falhas}]
 
 
 # Exemplo de uso rápido
@@ -83,8 +237,9 @@ if __name__ == "__main__":
     with open("output/relatorio_customizado_agrupado_v2.json", 'r', encoding='utf-8') as f:
         dados = json.load(f)
     
-    dados = str(dados)
-    resultado = rt.get_first_infos(dados)
+    resultado = rt.get_first_infos_em_partes(dados)
+    if resultado[0]["erro"]:
+        print(f"\n⚠️  {len(resultado[0]['partes_com_erro'])} de {resultado[0]['partes']} parte(s) sem resposta; o Markdown está incompleto")
     
     # Salvar resposta completa em arquivo Markdown
     with open("output/resposta_completa.md", 'w', encoding='utf-8') as f:
@@ -62,23 +62,19 @@ class BaseProcessor:
     def process_rag_code_z(self, temp_md_path):
         """
         Cria documento, source e indexer no RAG e retorna apenas o index_id.
+        Conteúdo já enviado antes reaproveita os ids do registro de ingestão.
         """
-        logger.info("[SESSION] Criando documento no RAG.")
-        doc_resp = self.rag.create_document(file_path=temp_md_path, use_ocr=False)
-        document_id = doc_resp.get('id')
-        logger.info(f"[SESSION] Documento criado no RAG: {doc_resp}")
-
-        logger.info("[SESSION] Criando source no RAG.")
-        source_resp = self.rag.create_source(document_id=document_id)
-        source_id = source_resp.get('id')
-        logger.info(f"[SESSION] Source criado no RAG: {source_resp}")
-
-        logger.info("[SESSION] Criando indexer no RAG.")
-        indexer_resp = self.rag.create_indexer(index_name="Codigo Z teste", sources_ids=[source_id])
-        index_id = indexer_resp.get('id')
-        logger.info(f"[SESSION] Indexer criado no RAG: {indexer_resp}")
-        
-        return index_id
+        logger.info("[SESSION] Ingerindo documento no RAG.")
+        ingestion = self.rag.ingest(file_path=temp_md_path, index_name="Codigo Z teste", use_ocr=False)
+        if ingestion["error"]:
+            logger.error(f"[SESSION] Falha na ingestão no RAG: {ingestion}")
+            raise RuntimeError(ingestion["error"])
+        if ingestion["reused"]:
+            logger.info(f"[SESSION] Conteúdo já ingerido, reaproveitando ids: {ingestion}")
+        else:
+            logger.info(f"[SESSION] Documento, source e indexer no RAG: {ingestion}")
+
+        return ingestion["index_id"]
 
     async def process(self, session, request, http_session):
         # 5. Buscar no RAG para cada pergunta melhorada
@@ -0,0 +1,260 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Optional, Tuple
+
+# ==============================================================================
+# CONFIGURAÇÃO
+# ==============================================================================
+
+# Colunas de saída com o total de itens e as notas de cada cenário
+COLUNA_QTD = 'qtd_agrupamentos'
+COLUNA_NFS = 'nfs_agrupadas'
+SEPARADOR_NFS = ', '
+
+# Colunas que identificam a nota no estado incremental: a chave de acesso ou,
+# sem ela, o emissor junto com o número da nota
+COLUNA_CHAVE = 'CHAVE_ACESSO'
+COLUNA_EMISSOR = 'CNPJ/CPF Emissor'
+
+# ==============================================================================
+# FUNÇÕES AUXILIARES
+# ==============================================================================
+
+def _inteiro_se_exato(valor):
+    """6102.0 -> 6102 (outros valores ficam como estão)"""
+    if isinstance(valor, (float, np.floating)) and np.isfinite(valor) and float(valor).is_integer():
+        return int(valor)
+    return valor
+
+
+def _codigos_coluna(serie: pd.Series, normalizar: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Códigos da coluna tratada como texto (nulos como '', astype(str), str.strip()),
+    numerados na ordem alfabética dos textos.
+
+    A conversão para texto é feita só nos valores distintos; colunas category
+    (ver esquema_relatorio) usam os códigos que já têm. Colunas object com
+    valores que não são texto (ex: True e 1, que o factorize juntaria) são
+    convertidas linha a linha, como no agrupamento original.
+
+    Com normalizar, floats inteiros viram texto sem a parte decimal ('6102',
+    não '6102.0'): o texto não depende de a coluna ter vindo como int64 ou
+    float64 (ex: xlsx com células vazias).
+    """
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        codigos, distintos = serie.cat.codes.to_numpy(dtype=np.intp), serie.cat.categories
+    else:
+        numerica = pd.api.types.is_numeric_dtype(serie.dtype) or pd.api.types.is_bool_dtype(serie.dtype)
+        codigos, distintos = pd.factorize(serie)
+        if not numerica and not all(isinstance(valor, str) for valor in distintos):
+            codigos, distintos = pd.factorize(serie.astype(object).where(serie.notna(), '').astype(str))
+
+    distintos = np.asarray(distintos, dtype=object)
+    if normalizar:
+        distintos = np.array([_inteiro_se_exato(valor) for valor in distintos], dtype=object)
+
+    # Nulos (-1) viram '' e textos iguais depois do strip são unidos
+    textos = np.append(distintos.astype(str), '')
+    codigos = np.where(codigos < 0, len(distintos), codigos)
+    remapeamento, valores = pd.factorize(pd.Series(textos, dtype=object).str.strip(), sort=True)
+    return remapeamento[codigos], np.asarray(valores, dtype=object)
+
+
+def _chave_cenario(codigos: List[np.ndarray]) -> np.ndarray:
+    """
+    Combina os códigos das colunas numa chave inteira por linha, numerada na
+    mesma ordem do groupby(sort=True) (ordem das colunas, depois dos valores).
+    """
+    chave = np.zeros(len(codigos[0]), dtype=np.int64)
+    for codigos_coluna in codigos:
+        # Compacta a chave antes de multiplicar para não estourar o int64
+        chave, _ = pd.factorize(chave, sort=True)
+        chave = chave.astype(np.int64) * (int(codigos_coluna.max(initial=0)) + 1) + codigos_coluna
+    chave, _ = pd.factorize(chave, sort=True)
+    return chave
+
+
+def _notas_por_cenario(chave: np.ndarray, numeros: pd.Series, total: int) -> np.ndarray:
+    """
+    Números de nota distintos de cada cenário, na ordem em que aparecem,
+    separados por SEPARADOR_NFS (valores não numéricos são ignorados).
+    """
+    numeros = pd.to_numeric(numeros, errors='coerce').to_numpy()
+    validos = ~pd.isna(numeros)
+    pares = pd.DataFrame({
+        'chave': chave[validos],
+        'numero': numeros[validos].astype(int),
+    }).drop_duplicates()
+
+    notas = np.full(total, '', dtype=object)
+    if len(pares):
+        unidas = pares['numero'].astype(str).groupby(pares['chave'].to_numpy(), sort=True).agg(SEPARADOR_NFS.join)
+        notas[unidas.index.to_numpy()] = unidas.to_numpy()
+    return notas
+
+# ==============================================================================
+# AGRUPAMENTO
+# ==============================================================================
+
+def _textos_coluna(serie: pd.Series) -> pd.Series:
+    """Valores da coluna como o texto normalizado usado nos cenários"""
+    codigos, valores = _codigos_coluna(serie, normalizar=True)
+    return pd.Series(valores[codigos], index=serie.index, dtype=object)
+
+
+def agrupar_cenarios(df: pd.DataFrame, colunas: List[str], coluna_nota: str = 'Numero Nota',
+                     normalizar: bool = False) -> pd.DataFrame:
+    """
+    Agrupa as linhas (itens) por cenário: uma linha por combinação distinta
+    das colunas, com COLUNA_QTD (itens com nota preenchida) e COLUNA_NFS
+    (números de nota distintos).
+
+    Mesmo resultado de converter as colunas para texto sem espaços e fazer
+    groupby(colunas, as_index=False, dropna=False) com count e a junção dos
+    números únicos, mas sem copiar o DataFrame: cada linha vira um código
+    inteiro e a agregação é feita com bincount e drop_duplicates, ocupando
+    memória proporcional ao número de cenários.
+
+    normalizar: floats inteiros como inteiros no texto (ver _codigos_coluna).
+    """
+    if not colunas:
+        raise ValueError("Nenhuma coluna de agrupamento informada")
+
+    codigos, valores = zip(*(_codigos_coluna(df[coluna], normalizar) for coluna in colunas))
+    chave = _chave_cenario(list(codigos))
+    total = int(chave.max(initial=-1)) + 1
+
+    # Primeira linha de cada cenário (para recuperar os valores das colunas)
+    _, primeira_linha = np.unique(chave, return_index=True)
+
+    resultado = {
+        coluna: valores_coluna[codigos_coluna[primeira_linha]]
+        for coluna, codigos_coluna, valores_coluna in zip(colunas, codigos, valores)
+    }
+    resultado[COLUNA_QTD] = np.bincount(chave[df[coluna_nota].notna().to_numpy()], minlength=total)
+    resultado[COLUNA_NFS] = _notas_por_cenario(chave, df[coluna_nota], total)
+    return pd.DataFrame(resultado)
+
+# ==============================================================================
+# AGRUPAMENTO INCREMENTAL
+# ==============================================================================
+
+class EstadoCenarios:
+    """
+    Estado persistente do agrupamento de cenários: para cada cenário (tupla
+    com os valores das colunas), a quantidade de itens e os números de nota
+    distintos na ordem em que apareceram, além das notas já incorporadas.
+
+    incorporar() agrupa só as linhas novas e as soma ao estado. Linhas de
+    notas que já estão no estado são ignoradas (a nota é identificada pela
+    COLUNA_CHAVE ou, sem ela, por COLUNA_EMISSOR + número), e os valores são
+    normalizados do mesmo jeito em todo lote; então o resultado de
+    dataframe() é o mesmo de agrupar_cenarios(..., normalizar=True) sobre
+    as linhas de todas as notas distintas já incorporadas, na ordem de
+    incorporação. Cada lote é registrado por um identificador (ex: hash do
+    arquivo) para não ser lido duas vezes.
+    """
+
+    VERSAO = 2
+
+    def __init__(self, colunas: List[str]):
+        self.colunas = list(colunas)
+        self.cenarios: Dict[Tuple[str, ...], list] = {}
+        self.lotes: List[str] = []
+        self.notas: set = set()
+
+    @classmethod
+    def carregar(cls, caminho: str) -> Optional['EstadoCenarios']:
+        """Lê o estado gravado em caminho (None se o arquivo não existir)"""
+        try:
+            with open(caminho, 'r', encoding='utf-8') as f:
+                dados = json.load(f)
+        except FileNotFoundError:
+            return None
+        if dados.get('versao') not in (1, cls.VERSAO):
+            raise ValueError(f"Estado de cenários com versão incompatível: {caminho}")
+
+        estado = cls(dados['colunas'])
+        estado.lotes = dados['lotes']
+        # Estados da versão 1 não guardavam as notas: a checagem começa agora
+        estado.notas = set(dados.get('notas', []))
+        for valores, qtd, notas in dados['cenarios']:
+            estado.cenarios[tuple(valores)] = [qtd, notas]
+        return estado
+
+    def salvar(self, caminho: str):
+        """Grava o estado (escrita atômica)"""
+        pasta = os.path.dirname(caminho)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+        dados = {
+            'versao': self.VERSAO,
+            'colunas': self.colunas,
+            'lotes': self.lotes,
+            'notas': sorted(self.notas),
+            'cenarios': [[list(valores), qtd, notas] for valores, (qtd, notas) in self.cenarios.items()],
+        }
+        temporario = f'{caminho}.{os.getpid()}.tmp'
+        with open(temporario, 'w', encoding='utf-8') as f:
+            json.dump(dados, f, ensure_ascii=False)
+        os.replace(temporario, caminho)
+
+    @staticmethod
+    def _identificar_notas(df: pd.DataFrame, coluna_nota: str) -> pd.Series:
+        """Identificador de cada linha ('' se a nota não tem como ser identificada)"""
+        if COLUNA_CHAVE in df.columns:
+            return _textos_coluna(df[COLUNA_CHAVE])
+        numeros = _textos_coluna(df[coluna_nota])
+        if COLUNA_EMISSOR not in df.columns:
+            return numeros
+        return (_textos_coluna(df[COLUNA_EMISSOR]) + '|' + numeros).where(numeros != '', '')
+
+    def incorporar(self, df: pd.DataFrame, lote: Optional[str] = None, coluna_nota: str = 'Numero Nota') -> Optional[int]:
+        """
+        Soma ao estado as linhas de df (só elas são agrupadas), menos as de
+        notas já incorporadas.
+
+        Retorna o número de linhas somadas, ou None, sem alterar o estado,
+        se o lote já foi incorporado.
+        """
+        if lote is not None and lote in self.lotes:
+            return None
+        faltando = [coluna for coluna in self.colunas if coluna not in df.columns]
+        if faltando:
+            raise ValueError(f"Colunas do estado ausentes no lote: {', '.join(faltando)}")
+
+        notas = self._identificar_notas(df, coluna_nota)
+        repetidas = (notas != '') & notas.isin(self.notas)
+        if repetidas.any():
+            print(f"  {int(repetidas.sum())} linha(s) de notas já incorporadas ignoradas")
+            df, notas = df[~repetidas.to_numpy()], notas[~repetidas]
+
+        if len(df):
+            novos = agrupar_cenarios(df, self.colunas, coluna_nota, normalizar=True)
+            valores = zip(*(novos[coluna].tolist() for coluna in self.colunas))
+            for chave, qtd, nfs in zip(valores, novos[COLUNA_QTD].tolist(), novos[COLUNA_NFS].tolist()):
+                cenario = self.cenarios.setdefault(chave, [0, []])
+                cenario[0] += qtd
+                if nfs:
+                    existentes = set(cenario[1])
+                    cenario[1].extend(numero for numero in nfs.split(SEPARADOR_NFS) if numero not in existentes)
+        self.notas.update(notas[notas != ''].unique().tolist())
+        if lote is not None:
+            self.lotes.append(lote)
+        return len(df)
+
+    def dataframe(self) -> pd.DataFrame:
+        """Cenários do estado no mesmo formato (e ordem) de agrupar_cenarios"""
+        chaves = sorted(self.cenarios)
+        resultado = {
+            coluna: np.array([chave[posicao] for chave in chaves], dtype=object)
+            for posicao, coluna in enumerate(self.colunas)
+        }
+        resultado[COLUNA_QTD] = np.array([self.cenarios[chave][0] for chave in chaves], dtype=np.int64)
+        resultado[COLUNA_NFS] = np.array(
+            [SEPARADOR_NFS.join(self.cenarios[chave][1]) for chave in chaves], dtype=object
+        )
+        return pd.DataFrame(resultado)
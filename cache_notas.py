@@ -0,0 +1,109 @@
+import hashlib
+import json
+import os
+import re
+
+# ==============================================================================
+# CONFIGURAÇÕES
+# ==============================================================================
+
+# Pasta com os resultados já extraídos (uma subpasta por versão do mapeamento)
+PASTA_CACHE = os.path.join('output', '.cache_notas')
+
+# Incrementar quando a lógica de extração mudar, para invalidar o cache existente
+VERSAO_CACHE = 1
+
+# Quantos bytes do início do arquivo são lidos procurando o Id da nota
+BYTES_BUSCA_ID = 1 << 14
+
+# Tamanho do bloco lido ao calcular o hash do conteúdo
+TAMANHO_BLOCO = 1 << 20
+
+# Chave de acesso (44 dígitos) no nome do arquivo ou no atributo Id da nota
+_CHAVE_NOME = re.compile(r'(?<!\d)(\d{44})(?!\d)')
+_CHAVE_ID = re.compile(rb'Id\s*=\s*["\'](?:NFe|CTe)(\d{44})["\']')
+
+# ==============================================================================
+# FUNÇÕES
+# ==============================================================================
+
+def hash_mapeamento(mapeamento):
+    """Hash do mapping_config.json (já carregado) junto com a versão do cache"""
+    texto = json.dumps([VERSAO_CACHE, mapeamento], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(texto.encode('utf-8')).hexdigest()[:16]
+
+
+def hash_arquivo(caminho):
+    """Hash do conteúdo do arquivo, lido em blocos"""
+    resumo = hashlib.blake2b(digest_size=16)
+    with open(caminho, 'rb') as f:
+        for bloco in iter(lambda: f.read(TAMANHO_BLOCO), b''):
+            resumo.update(bloco)
+    return resumo.hexdigest()
+
+
+def chave_acesso_arquivo(caminho):
+    """
+    Chave de acesso de 44 dígitos do arquivo (None se não encontrada).
+
+    Procura primeiro no nome do arquivo e depois no Id do <infNFe>/<infCte>
+    no início do conteúdo.
+    """
+    encontrada = _CHAVE_NOME.search(os.path.basename(caminho))
+    if encontrada:
+        return encontrada.group(1)
+
+    with open(caminho, 'rb') as f:
+        encontrada = _CHAVE_ID.search(f.read(BYTES_BUSCA_ID))
+    return encontrada.group(1).decode('ascii') if encontrada else None
+
+
+class CacheNotas:
+    """
+    Cache em disco das notas extraídas de cada arquivo XML.
+
+    Cada arquivo vira uma entrada <pasta>/<hash do mapeamento>/<chave>.json,
+    onde a chave é a chave de acesso (nome do arquivo ou Id da nota) ou, sem
+    ela, o hash do conteúdo. A entrada guarda o hash do conteúdo, então um
+    arquivo alterado é reprocessado; mudar o mapeamento troca a subpasta.
+    """
+
+    def __init__(self, mapeamento, pasta=PASTA_CACHE):
+        self.pasta = os.path.join(pasta, hash_mapeamento(mapeamento))
+        self.acertos = 0
+        self.faltas = 0
+
+    def identificar(self, caminho):
+        """Retorna (chave, hash do conteúdo) do arquivo"""
+        conteudo = hash_arquivo(caminho)
+        return chave_acesso_arquivo(caminho) or conteudo, conteudo
+
+    def _caminho_entrada(self, chave):
+        return os.path.join(self.pasta, chave + '.json')
+
+    def ler(self, identificacao):
+        """Retorna a lista de notas guardada para o arquivo, ou None se não houver (ou estiver desatualizada)"""
+        chave, conteudo = identificacao
+        try:
+            with open(self._caminho_entrada(chave), 'r', encoding='utf-8') as f:
+                entrada = json.load(f)
+        except (OSError, ValueError):
+            entrada = None
+
+        if entrada is None or entrada.get('hash_conteudo') != conteudo:
+            self.faltas += 1
+            return None
+
+        self.acertos += 1
+        return entrada['notas']
+
+    def gravar(self, identificacao, notas):
+        """Guarda as notas extraídas do arquivo (escrita atômica)"""
+        chave, conteudo = identificacao
+        os.makedirs(self.pasta, exist_ok=True)
+
+        destino = self._caminho_entrada(chave)
+        temporario = f'{destino}.{os.getpid()}.tmp'
+        with open(temporario, 'w', encoding='utf-8') as f:
+            json.dump({'hash_conteudo': conteudo, 'notas': notas}, f, ensure_ascii=False)
+        os.replace(temporario, destino)
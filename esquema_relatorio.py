@@ -0,0 +1,99 @@
+import numpy as np
+import pandas as pd
+from typing import Dict, Iterable, List, Optional
+
+from tabelas_fiscais import (
+    TABELA_CSOSN_ICMS,
+    TABELA_CST_ICMS,
+    TABELA_CST_IPI,
+    TABELA_CST_PIS_COFINS,
+    TABELA_MOD_FRETE,
+)
+
+# ==============================================================================
+# CONFIGURAÇÃO
+# ==============================================================================
+
+# Unidades federativas (+ EX para exterior)
+UFS = [
+    'AC', 'AL', 'AM', 'AP', 'BA', 'CE', 'DF', 'ES', 'GO', 'MA', 'MG', 'MS', 'MT', 'PA',
+    'PB', 'PE', 'PI', 'PR', 'RJ', 'RN', 'RO', 'RR', 'RS', 'SC', 'SE', 'SP', 'TO', 'EX',
+]
+
+# Colunas do relatório guardadas como category. Cada coluna aponta para a
+# função que devolve as categorias fixas (None = só os valores encontrados).
+# Valores fora das categorias fixas são acrescentados, nunca descartados.
+# CFOP fica só com os valores encontrados: as categorias fixas exigiriam ler
+# a base CFOP (e o gerador 2026 usa a sua própria tabela).
+COLUNAS_CATEGORICAS = {
+    'Tipo': None,
+    'UF Emissor': lambda: UFS,
+    'UF Destinatário': lambda: UFS,
+    'Operação': lambda: ['ENTRADA', 'SAIDA'],
+    'Consumidor Final': lambda: ['SIM', 'NAO'],
+    'Transporte': lambda: ['Não Informado'] + list(TABELA_MOD_FRETE.values()),
+    'CFOP': None,
+    'CST ICMS': lambda: list(TABELA_CST_ICMS) + list(TABELA_CSOSN_ICMS),
+    'CST IPI': lambda: list(TABELA_CST_IPI),
+    'CST PIS': lambda: list(TABELA_CST_PIS_COFINS),
+    'CST COFINS': lambda: list(TABELA_CST_PIS_COFINS),
+}
+
+# Categorias fixas já montadas (uma vez por processo)
+_CATEGORIAS: Dict[str, List[str]] = {}
+
+# ==============================================================================
+# FUNÇÕES
+# ==============================================================================
+
+def categorias_fixas(coluna: str) -> List[str]:
+    """Categorias fixas de uma coluna do esquema (montadas uma vez por processo)."""
+    if coluna not in _CATEGORIAS:
+        origem = COLUNAS_CATEGORICAS[coluna]
+        _CATEGORIAS[coluna] = list(dict.fromkeys(origem())) if origem is not None else []
+    return _CATEGORIAS[coluna]
+
+
+def como_categoria(serie: pd.Series, fixas: Iterable[str] = ()) -> pd.Series:
+    """
+    Converte a coluna para category com as categorias fixas e, depois delas,
+    os demais valores encontrados (em ordem alfabética).
+
+    Valores que não são texto viram texto (str), como no agrupamento de
+    cenários; nulos continuam nulos.
+    """
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        return serie
+    if pd.api.types.infer_dtype(serie, skipna=True) not in ('string', 'empty'):
+        serie = serie.astype(object).where(serie.isna(), serie.astype(str))
+
+    # Um único factorize: os códigos das categorias saem dos valores distintos
+    codigos, distintos = pd.factorize(serie)
+    fixas = list(fixas)
+    conhecidas = set(fixas)
+    categorias = fixas + sorted(valor for valor in distintos if valor not in conhecidas)
+    posicoes = pd.Index(categorias).get_indexer(distintos)
+    codigos = np.where(codigos < 0, -1, posicoes[codigos] if len(posicoes) else codigos)
+    return pd.Series(
+        pd.Categorical.from_codes(codigos, categories=categorias),
+        index=serie.index,
+        name=serie.name,
+    )
+
+
+def aplicar_esquema(df: pd.DataFrame, colunas: Optional[Iterable[str]] = None) -> pd.DataFrame:
+    """
+    Retorna o DataFrame com as colunas de COLUNAS_CATEGORICAS (as que
+    existirem nele) convertidas para category; as demais ficam como estão.
+
+    Os valores são os mesmos (to_excel grava o mesmo conteúdo), mas cada
+    coluna passa a ocupar um código inteiro por linha, e o agrupamento de
+    cenários usa esses códigos direto, sem comparar textos.
+    """
+    colunas = COLUNAS_CATEGORICAS if colunas is None else colunas
+    convertidas = {
+        coluna: como_categoria(df[coluna], categorias_fixas(coluna))
+        for coluna in colunas
+        if coluna in df.columns
+    }
+    return df.assign(**convertidas) if convertidas else df
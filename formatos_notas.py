@@ -0,0 +1,322 @@
+import json
+import os
+from itertools import islice
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet é opcional (pip install pyarrow)
+    pa = pq = None
+
+# ==============================================================================
+# CONFIGURAÇÕES
+# ==============================================================================
+
+# Indentação usada em output/resposta_notas*.json
+INDENTACAO_JSON = 4
+
+# Formato padrão da saída do processador e extensão de cada formato
+FORMATO_PADRAO = 'json'
+EXTENSOES = {
+    'json': '.json',
+    'ndjson': '.ndjson',
+    'parquet': '.parquet',
+}
+# Extensões aceitas na leitura de JSON Lines
+EXTENSOES_NDJSON = ('.ndjson', '.jsonl')
+
+# Saída Parquet: pasta com a tabela de notas e a de itens, ligadas pela chave de acesso
+ARQUIVO_NOTAS_PARQUET = 'notas.parquet'
+ARQUIVO_ITENS_PARQUET = 'itens.parquet'
+CHAVE_JUNCAO = 'CHAVE_ACESSO'
+# Coluna da tabela de notas com a quantidade de itens (fica na posição de ITEMS)
+COLUNA_QTD_ITENS = 'QTD_ITENS'
+# Notas acumuladas antes de gravar cada row group
+NOTAS_POR_GRUPO = 1000
+
+# ==============================================================================
+# ESCRITORES
+# ==============================================================================
+
+class EscritorJson:
+    """
+    Grava as notas num array JSON à medida que são processadas.
+
+    O arquivo final é idêntico ao de json.dump(notas, f, indent=4, ensure_ascii=False),
+    mas sem manter a lista de notas em memória.
+    """
+
+    def __init__(self, caminho, indent=INDENTACAO_JSON):
+        self.caminho = caminho
+        self.indent = indent
+        self.total = 0
+        self._arquivo = None
+        self._prefixo = ' ' * indent
+
+    def __enter__(self):
+        pasta = os.path.dirname(self.caminho)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+        self._arquivo = open(self.caminho, 'w', encoding='utf-8')
+        return self
+
+    def escrever(self, nota):
+        """Acrescenta uma nota ao array"""
+        texto = json.dumps(nota, indent=self.indent, ensure_ascii=False)
+        texto = '\n'.join(self._prefixo + linha for linha in texto.split('\n'))
+        self._arquivo.write(('[\n' if self.total == 0 else ',\n') + texto)
+        self.total += 1
+
+    def fechar(self):
+        """Fecha o array e o arquivo"""
+        if self._arquivo is None:
+            return
+        self._arquivo.write('\n]' if self.total else '[]')
+        self._arquivo.close()
+        self._arquivo = None
+
+    def __exit__(self, *exc):
+        self.fechar()
+        return False
+
+
+class EscritorNdjson:
+    """
+    Grava uma nota por linha (JSON Lines), com flush a cada nota.
+
+    Um consumidor pode ler o arquivo enquanto ele é gravado e, se o
+    processamento for interrompido, as notas já gravadas continuam válidas.
+    """
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self.total = 0
+        self._arquivo = None
+
+    def __enter__(self):
+        pasta = os.path.dirname(self.caminho)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+        self._arquivo = open(self.caminho, 'w', encoding='utf-8')
+        return self
+
+    def escrever(self, nota):
+        """Acrescenta a nota como uma linha"""
+        self._arquivo.write(json.dumps(nota, ensure_ascii=False) + '\n')
+        self._arquivo.flush()
+        self.total += 1
+
+    def fechar(self):
+        """Fecha o arquivo"""
+        if self._arquivo is None:
+            return
+        self._arquivo.close()
+        self._arquivo = None
+
+    def __exit__(self, *exc):
+        self.fechar()
+        return False
+
+
+def _exigir_pyarrow():
+    if pa is None:
+        raise ImportError("Formato parquet requer o pacote pyarrow (pip install pyarrow)")
+
+
+class EscritorParquet:
+    """
+    Grava as notas em formato colunar: uma pasta com notas.parquet (um
+    registro por nota) e itens.parquet (um registro por item, com a
+    CHAVE_ACESSO da nota).
+
+    As notas são gravadas em row groups de notas_por_grupo à medida que
+    chegam. O esquema (todas as colunas texto) vem da primeira nota; a coluna
+    QTD_ITENS ocupa a posição de ITEMS e permite remontar a nota na leitura.
+    """
+
+    def __init__(self, caminho, notas_por_grupo=NOTAS_POR_GRUPO):
+        _exigir_pyarrow()
+        self.caminho = caminho
+        self.notas_por_grupo = notas_por_grupo
+        self.total = 0
+        self._pendentes = []
+        self._colunas_nota = None
+        self._colunas_item = None
+        self._escritor_notas = None
+        self._escritor_itens = None
+
+    def __enter__(self):
+        os.makedirs(self.caminho, exist_ok=True)
+        return self
+
+    def escrever(self, nota):
+        """Acrescenta uma nota (gravada quando o row group completa)"""
+        self._pendentes.append(nota)
+        self.total += 1
+        if len(self._pendentes) >= self.notas_por_grupo:
+            self._descarregar()
+
+    def _definir_esquema(self, nota):
+        self._colunas_nota = [COLUNA_QTD_ITENS if campo == 'ITEMS' else campo for campo in nota]
+        itens = nota.get('ITEMS') or [{}]
+        self._colunas_item = [CHAVE_JUNCAO] + [campo for campo in itens[0] if campo != CHAVE_JUNCAO]
+
+        esquema_notas = pa.schema([
+            (coluna, pa.int32() if coluna == COLUNA_QTD_ITENS else pa.string())
+            for coluna in self._colunas_nota
+        ])
+        esquema_itens = pa.schema([(coluna, pa.string()) for coluna in self._colunas_item])
+        self._escritor_notas = pq.ParquetWriter(os.path.join(self.caminho, ARQUIVO_NOTAS_PARQUET), esquema_notas)
+        self._escritor_itens = pq.ParquetWriter(os.path.join(self.caminho, ARQUIVO_ITENS_PARQUET), esquema_itens)
+
+    def _descarregar(self):
+        """Grava as notas pendentes como um row group em cada tabela"""
+        if not self._pendentes:
+            return
+        if self._escritor_notas is None:
+            self._definir_esquema(self._pendentes[0])
+
+        colunas_nota = {coluna: [] for coluna in self._colunas_nota}
+        colunas_item = {coluna: [] for coluna in self._colunas_item}
+        for nota in self._pendentes:
+            extras = set(nota) - set(colunas_nota) - {'ITEMS'}
+            if extras:
+                raise ValueError(f"Campos fora do esquema do Parquet: {', '.join(sorted(extras))}")
+
+            itens = nota.get('ITEMS')
+            for coluna, valores in colunas_nota.items():
+                if coluna == COLUNA_QTD_ITENS:
+                    valores.append(len(itens) if itens is not None else None)
+                else:
+                    valores.append(nota.get(coluna))
+
+            for item in itens or []:
+                for coluna, valores in colunas_item.items():
+                    valores.append(nota.get(CHAVE_JUNCAO) if coluna == CHAVE_JUNCAO else item.get(coluna))
+
+        self._escritor_notas.write_table(pa.table(colunas_nota, schema=self._escritor_notas.schema))
+        self._escritor_itens.write_table(pa.table(colunas_item, schema=self._escritor_itens.schema))
+        self._pendentes = []
+
+    def fechar(self):
+        """Grava o último row group e fecha as tabelas"""
+        self._descarregar()
+        if self._escritor_notas is None:
+            # Nenhuma nota: grava tabelas vazias só com as colunas de junção
+            self._definir_esquema({CHAVE_JUNCAO: None, 'ITEMS': []})
+        self._escritor_notas.close()
+        self._escritor_itens.close()
+
+    def __exit__(self, *exc):
+        self.fechar()
+        return False
+
+
+ESCRITORES = {
+    'json': EscritorJson,
+    'ndjson': EscritorNdjson,
+    'parquet': EscritorParquet,
+}
+
+
+def caminho_saida(caminho, formato):
+    """Troca a extensão do arquivo de saída pela do formato (ex: .json -> .parquet)"""
+    return os.path.splitext(caminho)[0] + EXTENSOES[formato]
+
+
+def criar_escritor(caminho, formato=FORMATO_PADRAO):
+    """Escritor de notas do formato pedido"""
+    if formato not in ESCRITORES:
+        raise ValueError(f"Formato de saída desconhecido: {formato} (use {', '.join(ESCRITORES)})")
+    return ESCRITORES[formato](caminho)
+
+# ==============================================================================
+# LEITORES
+# ==============================================================================
+
+def _linhas_parquet(caminho, colunas):
+    """Gera os registros (dicts) de um arquivo Parquet, row group a row group"""
+    arquivo = pq.ParquetFile(caminho)
+    for lote in arquivo.iter_batches(columns=colunas):
+        yield from lote.to_pylist()
+
+
+def ler_notas_parquet(caminho, colunas_nota=None, colunas_item=None):
+    """
+    Gera as notas de uma saída Parquet no mesmo formato do JSON (dict com ITEMS).
+
+    colunas_nota / colunas_item: campos a carregar (None = todos). Só as
+    colunas pedidas são lidas do disco; com colunas_item=[] os itens nem
+    são lidos e as notas vêm sem ITEMS.
+    """
+    _exigir_pyarrow()
+    if colunas_nota is not None:
+        colunas_nota = [coluna for coluna in colunas_nota if coluna != 'ITEMS'] + [COLUNA_QTD_ITENS]
+    ler_itens = colunas_item is None or len(colunas_item) > 0
+
+    itens = None
+    if ler_itens:
+        arquivo_itens = os.path.join(caminho, ARQUIVO_ITENS_PARQUET)
+        if colunas_item is None:
+            colunas_item = [coluna for coluna in pq.read_schema(arquivo_itens).names if coluna != CHAVE_JUNCAO]
+        itens = _linhas_parquet(arquivo_itens, list(colunas_item))
+
+    for linha in _linhas_parquet(os.path.join(caminho, ARQUIVO_NOTAS_PARQUET), colunas_nota):
+        nota = {}
+        for coluna, valor in linha.items():
+            if coluna != COLUNA_QTD_ITENS:
+                nota[coluna] = valor
+            elif valor is not None and ler_itens:
+                nota['ITEMS'] = list(islice(itens, valor))
+        yield nota
+
+
+def ler_tabelas_parquet(caminho, colunas_nota=None, colunas_item=None):
+    """
+    Lê as tabelas de uma saída Parquet como DataFrames (notas, itens), sem
+    remontar as notas. Colunas pedidas que não existirem no arquivo são ignoradas.
+    """
+    _exigir_pyarrow()
+    tabelas = []
+    for arquivo, colunas in ((ARQUIVO_NOTAS_PARQUET, colunas_nota), (ARQUIVO_ITENS_PARQUET, colunas_item)):
+        arquivo = os.path.join(caminho, arquivo)
+        if colunas is not None:
+            existentes = set(pq.read_schema(arquivo).names)
+            colunas = [coluna for coluna in colunas if coluna in existentes]
+        tabelas.append(pq.read_table(arquivo, columns=colunas).to_pandas())
+    return tuple(tabelas)
+
+
+def ler_notas_ndjson(caminho):
+    """
+    Gera as notas de um arquivo JSON Lines, uma linha por vez.
+
+    Uma última linha incompleta (gravação interrompida) é ignorada.
+    """
+    with open(caminho, 'r', encoding='utf-8') as f:
+        for linha in f:
+            if not linha.strip():
+                continue
+            try:
+                yield json.loads(linha)
+            except ValueError:
+                if linha.endswith('\n'):
+                    raise
+                print(f"  [AVISO] Última linha incompleta ignorada em {caminho}")
+
+
+def ler_notas(caminho, colunas_nota=None, colunas_item=None):
+    """
+    Lê a saída do processador em qualquer formato (pela extensão).
+
+    NDJSON e Parquet são lidos de forma preguiçosa (Parquet só com as colunas
+    pedidas); no JSON o arquivo inteiro é carregado. As colunas são ignoradas
+    fora do Parquet.
+    """
+    if caminho.endswith(EXTENSOES['parquet']):
+        return ler_notas_parquet(caminho, colunas_nota, colunas_item)
+    if caminho.endswith(EXTENSOES_NDJSON):
+        return ler_notas_ndjson(caminho)
+
+    with open(caminho, 'r', encoding='utf-8') as f:
+        return json.load(f)
@@ -3,109 +3,135 @@ import os
 import json
 from toon_python import encode
 
+from agregacao_cenarios import EstadoCenarios, agrupar_cenarios
+from cache_notas import hash_arquivo
+from esquema_relatorio import aplicar_esquema
+from planilha_excel import ler_xlsx, salvar_xlsx
+
+def _coluna_texto(df, coluna, padrao=''):
+    """Valores da coluna como str (padrao em todas as linhas se a coluna não existir)."""
+    if coluna not in df.columns:
+        return [padrao] * len(df)
+    return [str(valor) for valor in df[coluna].tolist()]
+
 def criar_estrutura_hierarquica(df_agrupado):
     """
     Converte DataFrame agrupado em estrutura hierárquica para formato TOON.
+
+    Cada coluna é convertida para texto uma única vez e as linhas são
+    percorridas em paralelo (sem montar uma Series por linha); os emitentes
+    ficam na ordem em que aparecem.
     """
+    def coluna(nome):
+        return _coluna_texto(df_agrupado, nome)
+
+    # Garantir que o CNPJ seja string e sem espaços
+    cnpjs_emit = [cnpj.strip() for cnpj in _coluna_texto(df_agrupado, 'CNPJ/CPF Emissor', 'DESCONHECIDO')]
+
+    linhas = zip(
+        cnpjs_emit, coluna('Razão Social Emissor'), coluna('UF Emissor'), coluna('Tipo'),
+        coluna('CNPJ/CPF Destinatário'), coluna('Razão Social Destinatário'), coluna('UF Destinatário'),
+        coluna('Operação'), coluna('Consumidor Final'), coluna('NCM'), coluna('CFOP'), coluna('DESC CFOP'),
+        coluna('NATOP'), coluna('Transporte'),
+        coluna('CST ICMS'), coluna('CST IPI'), coluna('CST PIS'), coluna('CST COFINS'),
+        coluna('Outros Impostos'), coluna('Sujeito a ISS?'), coluna('DIFAL'),
+        coluna('nfs_agrupadas'),
+    )
+
     estrutura = {}
-    
-    for _, row in df_agrupado.iterrows():
-        # Garantir que o CNPJ seja string e sem espaços
-        cnpj_emit = str(row.get('CNPJ/CPF Emissor', 'DESCONHECIDO')).strip()
-        
-        if cnpj_emit not in estrutura:
-            estrutura[cnpj_emit] = {
+    for (cnpj_emit, razao_emit, uf_emit, tipo, cnpj_dest, razao_dest, uf_dest,
+         operacao, consumidor_final, ncm, cfop, desc_cfop, natureza, transporte,
+         icms_cst, ipi_cst, pis_cst, cofins_cst, outros, sujeito_iss, difal,
+         nfs_agrupadas) in linhas:
+        emitente = estrutura.get(cnpj_emit)
+        if emitente is None:
+            emitente = estrutura[cnpj_emit] = {
                 'cnpj_emissor': cnpj_emit,
-                'razao_social_emissor': str(row.get('Razão Social Emissor', '')),
-                'uf_emissor': str(row.get('UF Emissor', '')),
+                'razao_social_emissor': razao_emit,
+                'uf_emissor': uf_emit,
                 'cenarios': []
             }
         
-        cenario = {
-            'tipo': str(row.get('Tipo', '')),
+        emitente['cenarios'].append({
+            'tipo': tipo,
             'destinatario': {
-                'cnpj': str(row.get('CNPJ/CPF Destinatário', '')),
-                'razao_social': str(row.get('Razão Social Destinatário', '')),
-                'uf': str(row.get('UF Destinatário', ''))
+                'cnpj': cnpj_dest,
+                'razao_social': razao_dest,
+                'uf': uf_dest
             },
             'fiscal': {
-                'operacao': str(row.get('Operação', '')),
-                'consumidor_final': str(row.get('Consumidor Final', '')),
-                'ncm': str(row.get('NCM', '')),
-                'cfop': str(row.get('CFOP', '')),
-                'desc_cfop': str(row.get('DESC CFOP', '')),
-                'natureza': str(row.get('NATOP', '')), # Corrigido para NATOP conforme lista de colunas
-                'transporte': str(row.get('Transporte', ''))
+                'operacao': operacao,
+                'consumidor_final': consumidor_final,
+                'ncm': ncm,
+                'cfop': cfop,
+                'desc_cfop': desc_cfop,
+                'natureza': natureza, # Corrigido para NATOP conforme lista de colunas
+                'transporte': transporte
             },
             'impostos': {
-                'icms_cst': str(row.get('CST ICMS', '')),
-                'ipi_cst': str(row.get('CST IPI', '')),
-                'pis_cst': str(row.get('CST PIS', '')),
-                'cofins_cst': str(row.get('CST COFINS', '')),
-                'outros': str(row.get('Outros Impostos', '')),
-                'sujeito_iss': str(row.get('Sujeito a ISS?', '')),
-                'difal': str(row.get('DIFAL', ''))
+                'icms_cst': icms_cst,
+                'ipi_cst': ipi_cst,
+                'pis_cst': pis_cst,
+                'cofins_cst': cofins_cst,
+                'outros': outros,
+                'sujeito_iss': sujeito_iss,
+                'difal': difal
             },
-            'nfs_agrupadas': str(row.get('nfs_agrupadas', ''))
-        }
-        
-        estrutura[cnpj_emit]['cenarios'].append(cenario)
+            'nfs_agrupadas': nfs_agrupadas
+        })
     
     return {
         'total_emitentes': len(estrutura),
         'emitentes': list(estrutura.values())
     }
 
-def agrupar_cenarios_nfs(caminho_entrada, caminho_saida):
-    # 1. Carregar o DataFrame
-    if caminho_entrada.endswith('.xlsx'):
-        df = pd.read_excel(caminho_entrada)
+# Colunas de agrupamento
+COLUNAS_AGRUPAMENTO = [
+    'Cenario', 'Tipo', 
+    'CNPJ/CPF Emissor', 'Razão Social Emissor', 
+    'CNPJ/CPF Destinatário', 'Razão Social Destinatário', 
+    'UF Emissor', 'UF Destinatário', 'Operação', 'Consumidor Final', 
+    'Transporte', 'NCM', 'Classificação/Produto', 'NATOP',
+    'CFOP', 'DESC CFOP', 
+    'CST ICMS', 'DESC CST ICMS', "%ICMS Normal", "ICMS VBC",
+    'CST IPI', 'ENQUADRAMENTO IPI', '%IPI', 'TIPI',
+    'CST PIS', 'DESC CST PIS', '%PIS',
+    'CST COFINS', 'DESC CST COFINS', '%CONFINS',
+    'Sujeito a ISS?', 
+    'DIFAL', "DIFAL motivo", "DIFAL interestadual", "DIFAL consumidor final","DIFAL ind_ie_dest", "DIFAL cfop"
+    'Outros Impostos'
+]
+
+def carregar_relatorio(entrada):
+    """
+    Relatório customizado a agrupar: caminho (.xlsx ou .csv) ou o próprio
+    DataFrame de montar_dataframe_notas (sem passar pelo Excel). None se
+    estiver vazio.
+    """
+    if isinstance(entrada, pd.DataFrame):
+        # Cópia rasa: o strip dos nomes não altera o DataFrame de quem chamou
+        df = entrada.copy(deep=False)
+    elif entrada.endswith('.xlsx'):
+        df = ler_xlsx(entrada)
     else:
-        df = pd.read_csv(caminho_entrada)
+        df = pd.read_csv(entrada)
 
     if df.empty:
         print("ERRO: O arquivo de entrada está vazio.")
-        return
+        return None
 
     # Limpeza básica: remover espaços extras nos nomes das colunas
     df.columns = df.columns.str.strip()
 
-    # 2. Colunas de agrupamento
-    colunas_agrupamento = [
-        'Cenario', 'Tipo', 
-        'CNPJ/CPF Emissor', 'Razão Social Emissor', 
-        'CNPJ/CPF Destinatário', 'Razão Social Destinatário', 
-        'UF Emissor', 'UF Destinatário', 'Operação', 'Consumidor Final', 
-        'Transporte', 'NCM', 'Classificação/Produto', 'NATOP',
-        'CFOP', 'DESC CFOP', 
-        'CST ICMS', 'DESC CST ICMS', "%ICMS Normal", "ICMS VBC",
-        'CST IPI', 'ENQUADRAMENTO IPI', '%IPI', 'TIPI',
-        'CST PIS', 'DESC CST PIS', '%PIS',
-        'CST COFINS', 'DESC CST COFINS', '%CONFINS',
-        'Sujeito a ISS?', 
-        'DIFAL', "DIFAL motivo", "DIFAL interestadual", "DIFAL consumidor final","DIFAL ind_ie_dest", "DIFAL cfop"
-        'Outros Impostos'
-    ]
-
-    # Filtrar apenas as colunas que existem no arquivo
-    colunas_existentes = [col for col in colunas_agrupamento if col in df.columns]
-    
-    # --- TRATAMENTO CRÍTICO PARA NÃO RETORNAR VAZIO ---
-    # Convertemos tudo para string e tratamos nulos antes de agrupar
-    df_process = df.copy()
-    for col in colunas_existentes:
-        df_process[col] = df_process[col].fillna('').astype(str).str.strip()
-
-    # 3. Agrupar
-    df_agrupado = df_process.groupby(colunas_existentes, as_index=False, dropna=False).agg(
-        qtd_agrupamentos=('Numero Nota', 'count'),
-        nfs_agrupadas=('Numero Nota', lambda x: ', '.join(pd.to_numeric(x, errors='coerce').dropna().astype(int).astype(str).unique()))
-    )
+    # Colunas fiscais de poucos valores como category (ver esquema_relatorio)
+    return aplicar_esquema(df)
 
-    # 4. Salvar Excel/CSV de conferência
-    df_agrupado.to_excel(caminho_saida, index=False)
+def salvar_saidas(df_agrupado, caminho_saida, total_linhas):
+    """Grava o Excel de conferência e os arquivos JSON e TOON do agrupamento."""
+    # Salvar Excel/CSV de conferência
+    salvar_xlsx(caminho_saida, df_agrupado)
     
-    # 5. Gerar JSON e TOON
+    # Gerar JSON e TOON
     data_hierarquica = criar_estrutura_hierarquica(df_agrupado)
     
     caminho_base = caminho_saida.rsplit('.', 1)[0]
@@ -120,17 +146,81 @@ def agrupar_cenarios_nfs(caminho_entrada, caminho_saida):
         with open(f"{caminho_base}.toon", 'w', encoding='utf-8') as f:
             f.write(toon_data)
         
-        print(f"✅ Sucesso! Original: {len(df)} linhas | Agrupado: {len(df_agrupado)} cenários.")
+        print(f"✅ Sucesso! Original: {total_linhas} linhas | Agrupado: {len(df_agrupado)} cenários.")
         
     except Exception as e:
         print(f"❌ Erro na geração dos arquivos: {e}")
 
+def agrupar_cenarios_nfs(entrada, caminho_saida):
+    # 1. Carregar o DataFrame (entrada: caminho do relatório ou DataFrame)
+    df = carregar_relatorio(entrada)
+    if df is None:
+        return
+
+    # 2. Filtrar apenas as colunas de agrupamento que existem no arquivo
+    colunas_existentes = [col for col in COLUNAS_AGRUPAMENTO if col in df.columns]
+    
+    # 3. Agrupar
+    # Os valores são comparados como texto sem espaços (nulos = ''), para não
+    # perder linhas com colunas vazias; ver agregacao_cenarios.agrupar_cenarios
+    df_agrupado = agrupar_cenarios(df, colunas_existentes, 'Numero Nota')
+
+    # 4/5. Salvar Excel, JSON e TOON
+    salvar_saidas(df_agrupado, caminho_saida, len(df))
+    return df_agrupado
+
+def caminho_estado(caminho_saida):
+    """Arquivo de estado do modo incremental (ao lado da saída: <saida>.estado.json)"""
+    return caminho_saida.rsplit('.', 1)[0] + '.estado.json'
+
+def agrupar_cenarios_incremental(entrada, caminho_saida, arquivo_estado=None):
+    """
+    Modo incremental: entrada (caminho ou DataFrame) traz só as notas novas
+    (ex: o relatório customizado do dia). Elas são somadas ao estado gravado
+    em arquivo_estado (cenário, quantidade e números de nota) e as saídas são
+    regravadas a partir do estado, sem reler os relatórios anteriores.
+
+    Um arquivo de entrada já incorporado (mesmo conteúdo) é ignorado; de um
+    DataFrame (ou arquivo novo) só entram as notas que ainda não estão no estado.
+    """
+    arquivo_estado = arquivo_estado or caminho_estado(caminho_saida)
+    lote = None if isinstance(entrada, pd.DataFrame) else hash_arquivo(entrada)
+
+    estado = EstadoCenarios.carregar(arquivo_estado)
+    if estado is not None and lote is not None and lote in estado.lotes:
+        print(f"Arquivo já incorporado ao estado, nada a fazer: {entrada}")
+        return
+
+    # 1. Carregar só as notas novas
+    df = carregar_relatorio(entrada)
+    if df is None:
+        return
+
+    # 2. Colunas: as do estado existente, ou as do primeiro arquivo
+    if estado is None:
+        estado = EstadoCenarios([col for col in COLUNAS_AGRUPAMENTO if col in df.columns])
+        print(f"Novo estado de cenários: {arquivo_estado}")
+
+    # 3. Somar ao estado e gravá-lo
+    linhas = estado.incorporar(df, lote, 'Numero Nota')
+    estado.salvar(arquivo_estado)
+
+    # 4/5. Saídas regravadas a partir do estado
+    df_agrupado = estado.dataframe()
+    print(f"Incorporadas {linhas} linhas novas ({len(estado.lotes)} arquivos no estado)")
+    salvar_saidas(df_agrupado, caminho_saida, linhas)
+
 # --- Execução ---
 if __name__ == "__main__":
     entrada = 'output/relatorio_customizado_moet.xlsx'
     saida = 'output/relatorio_agrupado_moet.xlsx'
+    # True: entrada traz só as notas novas, somadas ao estado de <saida>.estado.json
+    incremental = False
     
     if os.path.exists(entrada):
-        agrupar_cenarios_nfs(entrada, saida)
+        if incremental:
+            agrupar_cenarios_incremental(entrada, saida)
+        else:
+            agrupar_cenarios_nfs(entrada, saida)
     else:
         print(f"Arquivo não encontrado: {entrada}")
\ No newline at end of file
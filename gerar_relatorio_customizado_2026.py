@@ -1,14 +1,38 @@
 import json
 import pandas as pd
-from typing import Dict, Any, List
+from typing import Dict, Any, Iterable, Iterator, List, Optional
+
+from esquema_relatorio import aplicar_esquema
+from formatos_notas import ler_notas
+from planilha_excel import ABA_PADRAO, EscritorXlsx, salvar_xlsx
+from tabelas_fiscais import TABELA_CST_IPI, TABELA_CST_PIS_COFINS, TABELA_MOD_FRETE
 
 # ==============================================================================
 # CONFIGURAÇÃO
 # ==============================================================================
 
+# Saída do processador_notas_v2 (.json, .ndjson ou pasta .parquet)
 ARQUIVO_JSON = "output/resposta_notas_envision.json"
 ARQUIVO_EXCEL = "output/relatorio_customizado_envision.xlsx"
 
+# JSON completo da nota no relatório:
+#   "linha"  - coluna "JSON da nota" repetida em cada item (formato antigo)
+#   "aba"    - uma vez por nota, na aba ABA_JSON_NOTAS, ligada pela coluna "ID Nota"
+#   "omitir" - não grava o JSON (só a coluna "ID Nota")
+# Padrão "linha": o mesmo layout de sempre (uma aba, coluna "JSON da nota").
+# "aba" é opcional e muda o layout: a aba principal vira ABA_RELATORIO
+# (continuada em "<aba> (2)", ... no limite de linhas) e a coluna "JSON da
+# nota" dá lugar a "ID Nota".
+MODO_JSON_NOTA = "linha"
+MODOS_JSON_NOTA = ("linha", "aba", "omitir")
+ABA_RELATORIO = "Relatorio"
+ABA_JSON_NOTAS = "JSON das notas"
+
+# Grava o Excel linha a linha (planilha_excel.EscritorXlsx) em vez de
+# DataFrame.to_excel: a memória não cresce com o relatório e, passando do
+# limite de linhas do Excel, o relatório continua em "Relatorio (2)", ...
+EXCEL_STREAMING = True
+
 # ==============================================================================
 # TABELAS DE DE-PARA
 # ==============================================================================
@@ -31,49 +55,7 @@ TABELA_CFOP = {
     "6102": "Venda de mercadoria adquirida ou recebida de terceiros",
 }
 
-# CST IPI
-TABELA_CST_IPI = {
-    "00": "Entrada com recuperação de crédito",
-    "01": "Entrada tributada com alíquota zero",
-    "02": "Entrada isenta",
-    "03": "Entrada não-tributada",
-    "04": "Entrada imune",
-    "05": "Entrada com suspensão",
-    "49": "Outras entradas",
-    "50": "Saída tributada",
-    "51": "Saída tributada com alíquota zero",
-    "52": "Saída isenta",
-    "53": "Saída não-tributada",
-    "54": "Saída imune",
-    "55": "Saída com suspensão",
-    "99": "Outras saídas",
-}
-
-# CST PIS/COFINS
-TABELA_CST_PIS_COFINS = {
-    "01": "Operação Tributável com Alíquota Básica",
-    "02": "Operação Tributável com Alíquota Diferenciada",
-    "03": "Operação Tributável com Alíquota por Unidade de Medida de Produto",
-    "04": "Operação Tributável Monofásica - Revenda a Alíquota Zero",
-    "05": "Operação Tributável por Substituição Tributária",
-    "06": "Operação Tributável a Alíquota Zero",
-    "07": "Operação Isenta da Contribuição",
-    "08": "Operação sem Incidência da Contribuição",
-    "09": "Operação com Suspensão da Contribuição",
-    "49": "Outras Operações de Saída",
-    "50": "Operação com Direito a Crédito - Vinculada Exclusivamente a Receita Tributada no Mercado Interno",
-    "99": "Outras Operações",
-}
-
-# Modalidades de Frete
-TABELA_MOD_FRETE = {
-    "0": "Por Conta do Emitente",
-    "1": "Por Conta do Destinatário",
-    "2": "Por Conta de Terceiro",
-    "3": "Por Conta de Terceiro (Comodato)",
-    "4": "Sem Movimento Físico",
-    "9": "Sem Frete",
-}
+# CST IPI, CST PIS/COFINS e modalidades de frete: tabelas_fiscais
 
 # ==============================================================================
 # FUNÇÕES AUXILIARES
@@ -572,19 +554,49 @@ def identificar_difal(nota: Dict[str, Any], item: Dict[str, Any]) -> Dict[str, A
 # ==============================================================================
 
 
-def montar_dataframe_notas(notas: List[Dict[str, Any]]) -> pd.DataFrame:
-    """Monta DataFrame com ID, Numero Nota e JSON completo da nota."""
-    dados = []
+def gerar_linhas_notas(
+    notas: Iterable[Dict[str, Any]],
+    modo_json_nota: str = "linha",
+    notas_json: Optional[List[Dict[str, Any]]] = None,
+) -> Iterator[Dict[str, Any]]:
+    """Gera as linhas do relatório, um dict por item (ID, Numero Nota, JSON da nota...).
+
+    Aceita qualquer iterável de notas (ex: ler_notas de um .ndjson, lido sob demanda).
+    modo_json_nota (ver MODOS_JSON_NOTA): em "linha" cada item leva o JSON da
+    nota; nos demais os itens levam só o "ID Nota" e, em "aba", notas_json
+    recebe uma linha por nota (ver montar_dataframe_json_notas).
+    """
+    if modo_json_nota not in MODOS_JSON_NOTA:
+        raise ValueError(
+            f"modo_json_nota inválido: {modo_json_nota} "
+            f"(use {', '.join(MODOS_JSON_NOTA)})"
+        )
 
     index = 0
     for idx, nota in enumerate(notas, 1):
         items = nota.get("ITEMS", [])
 
+        # JSON serializado uma única vez por nota
+        if modo_json_nota == "linha":
+            coluna_json = {
+                "JSON da nota": json.dumps(nota, ensure_ascii=False, indent=2)
+            }
+        else:
+            coluna_json = {"ID Nota": idx}
+            if modo_json_nota == "aba" and notas_json is not None:
+                notas_json.append(
+                    {
+                        "ID Nota": idx,
+                        "Numero Nota": nota.get("NUMERO_NF", ""),
+                        "JSON da nota": json.dumps(nota, ensure_ascii=False, indent=2),
+                    }
+                )
+
         for item_idx, item in enumerate(items):
             info_nota = {
                 "ID": index,
                 "Numero Nota": nota.get("NUMERO_NF", ""),
-                "JSON da nota": json.dumps(nota, ensure_ascii=False, indent=2),
+                **coluna_json,
                 "Tipo": nota.get("TIPO_DOCUMENTO", ""),
                 "CNPJ/CPF Emissor": (
                     nota.get("EMIT_CNPJ")
@@ -635,10 +647,69 @@ def montar_dataframe_notas(notas: List[Dict[str, Any]]) -> pd.DataFrame:
 
             # resultado = {**info_nota, **info_produto, **info_icms}
             resultado = {**info_nota, **info_produto}
-            dados.append(resultado)
+            yield resultado
             index += 1
 
-    return pd.DataFrame(dados)
+
+def montar_dataframe_notas(
+    notas: Iterable[Dict[str, Any]],
+    modo_json_nota: str = "linha",
+    notas_json: Optional[List[Dict[str, Any]]] = None,
+) -> pd.DataFrame:
+    """Monta o DataFrame do relatório com as linhas de gerar_linhas_notas."""
+    return pd.DataFrame(list(gerar_linhas_notas(notas, modo_json_nota, notas_json)))
+
+
+def montar_dataframe_json_notas(notas_json: List[Dict[str, Any]]) -> pd.DataFrame:
+    """Monta a aba com o JSON de cada nota (uma linha por nota, chave "ID Nota")."""
+    return pd.DataFrame(
+        notas_json, columns=["ID Nota", "Numero Nota", "JSON da nota"]
+    )
+
+
+def gravar_relatorio_streaming(
+    notas: Iterable[Dict[str, Any]], caminho: str, modo_json_nota: str
+) -> int:
+    """Gera as linhas do relatório e grava cada uma no Excel assim que é produzida.
+
+    Retorna o total de linhas.
+    """
+    print(f"\n2. Gerando e salvando relatorio em: {caminho}")
+    notas_json = []
+    with EscritorXlsx(caminho) as escritor:
+        aba = ABA_RELATORIO if modo_json_nota == "aba" else ABA_PADRAO
+        total = escritor.escrever_dicts(
+            aba, gerar_linhas_notas(notas, modo_json_nota, notas_json)
+        )
+        if modo_json_nota == "aba":
+            escritor.escrever_dataframe(
+                ABA_JSON_NOTAS, montar_dataframe_json_notas(notas_json)
+            )
+    print(f"   OK - {total} linhas gravadas")
+    return total
+
+
+def salvar_relatorio(
+    df: pd.DataFrame,
+    caminho: str,
+    modo_json_nota: str = "linha",
+    notas_json: Optional[List[Dict[str, Any]]] = None,
+    streaming: bool = True,
+):
+    """Grava o relatório no Excel (em 'aba', com a aba do JSON das notas)."""
+    if modo_json_nota == "aba":
+        abas = {
+            ABA_RELATORIO: df,
+            ABA_JSON_NOTAS: montar_dataframe_json_notas(notas_json or []),
+        }
+    else:
+        abas = {ABA_PADRAO: df}
+    if streaming:
+        salvar_xlsx(caminho, abas)
+    else:
+        with pd.ExcelWriter(caminho) as writer:
+            for nome, df_aba in abas.items():
+                df_aba.to_excel(writer, sheet_name=nome, index=False)
 
 
 # ==============================================================================
@@ -646,29 +717,49 @@ def montar_dataframe_notas(notas: List[Dict[str, Any]]) -> pd.DataFrame:
 # ==============================================================================
 
 
-def main():
+def _cabecalho():
     print("=" * 80)
     print("GERADOR DE RELATÓRIO CUSTOMIZADO V2")
     print("=" * 80)
 
     # 1. Carregar dados
     print(f"\n1. Carregando dados de: {ARQUIVO_JSON}")
-    with open(ARQUIVO_JSON, "r", encoding="utf-8") as f:
-        notas = json.load(f)
-    print(f"   OK - {len(notas)} notas carregadas")
+
+
+def main_streaming() -> int:
+    """Grava as linhas direto no Excel, sem montar o DataFrame.
+
+    Retorna o total de linhas.
+    """
+    _cabecalho()
+    return gravar_relatorio_streaming(
+        ler_notas(ARQUIVO_JSON), ARQUIVO_EXCEL, MODO_JSON_NOTA
+    )
+
+
+def main() -> pd.DataFrame:
+    _cabecalho()
+    notas = ler_notas(ARQUIVO_JSON)
 
     # 2. Montar DataFrame
     print("\n2. Montando DataFrame...")
-    df = montar_dataframe_notas(notas)
+    notas_json = []
+    df = montar_dataframe_notas(notas, MODO_JSON_NOTA, notas_json)
+    # Colunas fiscais de poucos valores como category (ver esquema_relatorio)
+    df = aplicar_esquema(df)
     print(f"   OK - {len(df)} linhas criadas")
 
     # 3. Salvar em Excel
     print(f"\n3. Salvando relatorio em: {ARQUIVO_EXCEL}")
-    df.to_excel(ARQUIVO_EXCEL, index=False)
+    salvar_relatorio(df, ARQUIVO_EXCEL, MODO_JSON_NOTA, notas_json, EXCEL_STREAMING)
     print("   OK - Relatorio salvo com sucesso!")
 
     return df
 
 
 if __name__ == "__main__":
-    df = main()
+    # Streaming: as linhas vão direto para o Excel, sem montar o DataFrame
+    if EXCEL_STREAMING:
+        main_streaming()
+    else:
+        df = main()
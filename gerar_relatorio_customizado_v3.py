@@ -1,95 +1,61 @@
 import json
 import pandas as pd
-from typing import Dict, Any, List
+from typing import Dict, Any, Iterable, Iterator, List, Optional
+
+from formatos_notas import ler_notas
+from planilha_excel import ABA_PADRAO, EscritorXlsx, salvar_xlsx
+from esquema_relatorio import aplicar_esquema
+from referencia_cfop import descricao_cfop, ler_planilha_cfop, montar_tabela_cfop
+from tabelas_fiscais import (
+    TABELA_CSOSN_ICMS,
+    TABELA_CST_ICMS,
+    TABELA_CST_IPI,
+    TABELA_CST_PIS_COFINS,
+    TABELA_MOD_FRETE,
+)
 
 # ==============================================================================
 # CONFIGURAÇÃO
 # ==============================================================================
 
+# Saída do processador_notas_v2 (.json, .ndjson ou pasta .parquet)
 ARQUIVO_JSON = 'output/resposta_notas_moet.json'
 ARQUIVO_EXCEL = 'output/relatorio_customizado_moet.xlsx'
 ARQUIVO_BASE_CFOP = 'base/base_cfop.xlsx'
 
-# Carregar base CFOP
-DF_BASE_CFOP = pd.read_excel(ARQUIVO_BASE_CFOP)
+# JSON completo da nota no relatório:
+#   'linha'  - coluna "JSON da nota" repetida em cada item (formato antigo)
+#   'aba'    - uma vez por nota, na aba ABA_JSON_NOTAS, ligada pela coluna "ID Nota"
+#   'omitir' - não grava o JSON (só a coluna "ID Nota")
+# Padrão 'linha': o mesmo layout de sempre (uma aba, coluna "JSON da nota").
+# 'aba' é opcional e muda o layout: a aba principal vira ABA_RELATORIO
+# (continuada em "<aba> (2)", ... no limite de linhas) e a coluna "JSON da
+# nota" dá lugar a "ID Nota".
+MODO_JSON_NOTA = 'linha'
+MODOS_JSON_NOTA = ('linha', 'aba', 'omitir')
+ABA_RELATORIO = 'Relatorio'
+ABA_JSON_NOTAS = 'JSON das notas'
+
+# Monta o DataFrame por colunas (relatorio_vetorizado) em vez de linha a linha;
+# o resultado é o mesmo. Com saída Parquet e MODO_JSON_NOTA='omitir' as notas
+# nem são remontadas em dicts.
+MONTAGEM_VETORIZADA = False
+
+# Grava o Excel linha a linha (planilha_excel.EscritorXlsx) em vez de
+# DataFrame.to_excel: a memória não cresce com o relatório e, passando do
+# limite de linhas do Excel, o relatório continua em "Relatorio (2)", ...
+EXCEL_STREAMING = True
+
+# Base CFOP: carregada só no primeiro uso (ver _base_cfop), a partir do cache
+# binário ao lado da planilha quando ele está em dia
+_DF_BASE_CFOP = None
+# Índice {codigo: descricao} para busca O(1) por CFOP
+_TABELA_CFOP = None
 
 # ==============================================================================
 # TABELAS DE DE-PARA
 # ==============================================================================
-
-
-# CST IPI
-TABELA_CST_IPI = {
-    '00': 'Entrada com recuperação de crédito',
-    '01': 'Entrada tributada com alíquota zero',
-    '02': 'Entrada isenta',
-    '03': 'Entrada não-tributada',
-    '04': 'Entrada imune',
-    '05': 'Entrada com suspensão',
-    '49': 'Outras entradas',
-    '50': 'Saída tributada',
-    '51': 'Saída tributada com alíquota zero',
-    '52': 'Saída isenta',
-    '53': 'Saída não-tributada',
-    '54': 'Saída imune',
-    '55': 'Saída com suspensão',
-    '99': 'Outras saídas',
-}
-
-# CST PIS/COFINS
-TABELA_CST_PIS_COFINS = {
-    '01': 'Operação Tributável com Alíquota Básica',
-    '02': 'Operação Tributável com Alíquota Diferenciada',
-    '03': 'Operação Tributável com Alíquota por Unidade de Medida de Produto',
-    '04': 'Operação Tributável Monofásica - Revenda a Alíquota Zero',
-    '05': 'Operação Tributável por Substituição Tributária',
-    '06': 'Operação Tributável a Alíquota Zero',
-    '07': 'Operação Isenta da Contribuição',
-    '08': 'Operação sem Incidência da Contribuição',
-    '09': 'Operação com Suspensão da Contribuição',
-    '49': 'Outras Operações de Saída',
-    '50': 'Operação com Direito a Crédito - Vinculada Exclusivamente a Receita Tributada no Mercado Interno',
-    '99': 'Outras Operações',
-}
-
-# CST ICMS (Regime Normal - NF-e/NFC-e)
-TABELA_CST_ICMS = {
-    '00': 'Tributada integralmente',
-    '10': 'Tributada e com cobrança do ICMS por substituição tributária',
-    '20': 'Com redução da base de cálculo',
-    '30': 'Isenta ou não tributada e com cobrança do ICMS por substituição tributária',
-    '40': 'Isenta',
-    '41': 'Não tributada',
-    '50': 'Suspensão',
-    '51': 'Diferimento',
-    '60': 'ICMS cobrado anteriormente por substituição tributária',
-    '70': 'Com redução de base de cálculo e cobrança do ICMS por substituição tributária',
-    '90': 'Outras',
-}
-
-# CSOSN ICMS (Simples Nacional)
-TABELA_CSOSN_ICMS = {
-    '101': 'Tributada pelo Simples Nacional com permissão de crédito',
-    '102': 'Tributada pelo Simples Nacional sem permissão de crédito',
-    '103': 'Isenção do ICMS no Simples Nacional para faixa de receita bruta',
-    '201': 'Tributada pelo Simples Nacional com permissão de crédito e com cobrança do ICMS por substituição tributária',
-    '202': 'Tributada pelo Simples Nacional sem permissão de crédito e com cobrança do ICMS por substituição tributária',
-    '203': 'Isenção do ICMS no Simples Nacional para faixa de receita bruta e com cobrança do ICMS por substituição tributária',
-    '300': 'Imune',
-    '400': 'Não tributada pelo Simples Nacional',
-    '500': 'ICMS cobrado anteriormente por substituição tributária (substituído) ou por antecipação',
-    '900': 'Outros (a critério da UF)',
-}
-
-# Modalidades de Frete
-TABELA_MOD_FRETE = {
-    '0': 'Por Conta do Emitente',
-    '1': 'Por Conta do Destinatário',
-    '2': 'Por Conta de Terceiro',
-    '3': 'Por Conta de Terceiro (Comodato)',
-    '4': 'Sem Movimento Físico',
-    '9': 'Sem Frete',
-}
+# CST IPI, CST PIS/COFINS, CST/CSOSN ICMS e modalidades de frete: tabelas_fiscais
 
 # ==============================================================================
 # FUNÇÕES AUXILIARES
@@ -136,17 +102,35 @@ def get_transporte_info(nota: Dict[str, Any]) -> Dict[str, Any]:
     
     return {'tem_transporte': tem_transporte}
 
+def _base_cfop() -> pd.DataFrame:
+    """DataFrame da base CFOP, carregado uma única vez por processo."""
+    global _DF_BASE_CFOP
+    if _DF_BASE_CFOP is None:
+        _DF_BASE_CFOP = ler_planilha_cfop(ARQUIVO_BASE_CFOP)
+    return _DF_BASE_CFOP
+
+def _tabela_cfop() -> Dict[str, Any]:
+    """Índice {codigo: descricao} da base CFOP, montado uma única vez por processo."""
+    global _TABELA_CFOP
+    if _TABELA_CFOP is None:
+        _TABELA_CFOP = montar_tabela_cfop(_base_cfop())
+    return _TABELA_CFOP
+
+def __getattr__(nome):
+    """Mantém DF_BASE_CFOP e TABELA_CFOP acessíveis como atributos do módulo (carga sob demanda)."""
+    if nome == 'DF_BASE_CFOP':
+        return _base_cfop()
+    if nome == 'TABELA_CFOP':
+        return _tabela_cfop()
+    raise AttributeError(f"module {__name__!r} has no attribute {nome!r}")
+
 def _get_desc_cfop(cfop):
     """Retorna a descrição do CFOP."""
     if not cfop or cfop == '':
         return 'CFOP não informado'
     
-    cfop_str = str(cfop).strip()
-    # Compara convertendo ambos os lados para string e removendo espaços
-    resultado = DF_BASE_CFOP[DF_BASE_CFOP['Codigo CFOP'].astype(str).str.strip() == cfop_str]
-    if not resultado.empty:
-        return resultado.iloc[0]['Descricao']
-    return f'CFOP {cfop}'
+    # Busca no índice (ambos os lados como string, sem espaços)
+    return descricao_cfop(_tabela_cfop(), cfop, f'CFOP {cfop}')
 
 def get_cfop_info(item: Dict[str, Any]) -> Dict[str, Any]:
     """Extrai CFOP e descrição."""
@@ -388,8 +372,8 @@ def analisar_icms_itens(item: Dict[str, Any]) -> Dict[str, Any]:
     return resultado_item
 
 
-def gerar_cenario(nota: Dict[str, Any], item: Dict[str, Any]) -> str:
-    """Gera uma descrição resumida do cenário da operação para visão geral rápida."""
+def _partes_cenario_nota(nota: Dict[str, Any], tipo_op: str, transporte: str) -> List[str]:
+    """Partes do cenário que dependem só da nota (calculadas uma vez por nota)."""
     partes = []
     
     # 1. Tipo de documento
@@ -398,7 +382,6 @@ def gerar_cenario(nota: Dict[str, Any], item: Dict[str, Any]) -> str:
         partes.append(tipo_doc.upper())
     
     # 2. Tipo de operação
-    tipo_op = get_tipo_operacao(nota).get('tipo_operacao', 'N/A')
     partes.append(tipo_op)
     
     # 3. Consumidor final ou B2B
@@ -406,7 +389,6 @@ def gerar_cenario(nota: Dict[str, Any], item: Dict[str, Any]) -> str:
     # partes.append('CONS.FINAL' if cons_final == 'SIM' else 'B2B')
     
     # 4. Transporte
-    transporte = get_transporte_info(nota).get('tem_transporte', '')
     if transporte and transporte != 'Não Informado':
         # Abrevia o tipo de transporte
         if 'Emitente' in transporte:
@@ -425,6 +407,12 @@ def gerar_cenario(nota: Dict[str, Any], item: Dict[str, Any]) -> str:
         natop_resumida = natop[:25] + '...' if len(natop) > 25 else natop
         partes.append(natop_resumida)
     
+    return partes
+
+def _partes_cenario_item(item: Dict[str, Any], tem_difal: bool) -> List[str]:
+    """Partes do cenário que dependem do item."""
+    partes = []
+    
     # 6. CFOP
     # cfop = item.get('CFOP', '')
     # if cfop:
@@ -455,7 +443,6 @@ def gerar_cenario(nota: Dict[str, Any], item: Dict[str, Any]) -> str:
     #     partes.append('COM-IPI')
     
     # 10. DIFAL
-    tem_difal = identificar_difal(nota, item).get('tem_difal', False)
     if tem_difal:
         partes.append('COM-DIFAL')
     
@@ -464,6 +451,16 @@ def gerar_cenario(nota: Dict[str, Any], item: Dict[str, Any]) -> str:
     # if tem_iss == 'SIM':
     #     partes.append('COM-ISS')
     
+    return partes
+
+def gerar_cenario(nota: Dict[str, Any], item: Dict[str, Any]) -> str:
+    """Gera uma descrição resumida do cenário da operação para visão geral rápida."""
+    partes = _partes_cenario_nota(
+        nota,
+        get_tipo_operacao(nota).get('tipo_operacao', 'N/A'),
+        get_transporte_info(nota).get('tem_transporte', ''),
+    )
+    partes += _partes_cenario_item(item, identificar_difal(nota, item).get('tem_difal', False))
     return ' | '.join(partes)
 
 
@@ -471,64 +468,114 @@ def gerar_cenario(nota: Dict[str, Any], item: Dict[str, Any]) -> str:
 # FUNÇÃO PRINCIPAL: EXPANDIR ITENS E GERAR RELATÓRIO
 # ==============================================================================
 
-def montar_dataframe_notas(notas: List[Dict[str, Any]]) -> pd.DataFrame:
-    """Monta DataFrame com ID, Numero Nota e JSON completo da nota."""
-    dados = []
+def gerar_linhas_notas(
+    notas: Iterable[Dict[str, Any]],
+    modo_json_nota: str = 'linha',
+    notas_json: Optional[List[Dict[str, Any]]] = None,
+) -> Iterator[Dict[str, Any]]:
+    """Gera as linhas do relatório, um dict por item (ID, Numero Nota, JSON da nota...).
+
+    Aceita qualquer iterável de notas (ex: ler_notas de um .ndjson, lido sob demanda).
+    modo_json_nota (ver MODOS_JSON_NOTA): em 'linha' cada item leva o JSON da
+    nota; nos demais os itens levam só o "ID Nota" e, em 'aba', notas_json
+    recebe uma linha por nota (ver montar_dataframe_json_notas).
+    """
+    if modo_json_nota not in MODOS_JSON_NOTA:
+        raise ValueError(f"modo_json_nota inválido: {modo_json_nota} (use {', '.join(MODOS_JSON_NOTA)})")
+
     
     index = 0
     for idx, nota in enumerate(notas, 1):
         items = nota.get('ITEMS', [])
+
+        # JSON serializado uma única vez por nota
+        if modo_json_nota == 'linha':
+            coluna_json = {"JSON da nota": json.dumps(nota, ensure_ascii=False, indent=2)}
+        else:
+            coluna_json = {"ID Nota": idx}
+            if modo_json_nota == 'aba' and notas_json is not None:
+                notas_json.append(
+                    {
+                        "ID Nota": idx,
+                        "Numero Nota": nota.get('NUMERO_NF', ''),
+                        "JSON da nota": json.dumps(nota, ensure_ascii=False, indent=2),
+                    }
+                )
+        
+        # Valores do nível da nota: calculados uma vez e repetidos em cada item
+        tipo_operacao = get_tipo_operacao(nota)
+        transporte = get_transporte_info(nota)
+        partes_cenario_nota = _partes_cenario_nota(
+            nota,
+            tipo_operacao.get('tipo_operacao', 'N/A'),
+            transporte.get('tem_transporte', ''),
+        )
+        colunas_nota = {
+            'Numero Nota': nota.get('NUMERO_NF', ''),
+            **coluna_json,
+            "Tipo": nota.get('TIPO_DOCUMENTO', ''),
+            "CNPJ/CPF Emissor": nota.get('EMIT_CNPJ') if nota.get('EMIT_CNPJ') else nota.get('EMIT_CPF', ''),
+            "Razão Social Emissor": nota.get('EMIT_RAZAO_SOCIAL', ''),
+            "CNPJ/CPF Destinatário": nota.get('DEST_CNPJ') if nota.get('DEST_CNPJ') else nota.get('DEST_CPF', ''),
+            "Razão Social Destinatário": nota.get('DEST_RAZAO_SOCIAL', ''),
+            "UF Emissor": nota.get('EMIT_UF', ''),
+            "UF Destinatário": nota.get('DEST_UF', ''),
+            "Operação": tipo_operacao.get('tipo_operacao', ''),
+            "Consumidor Final": get_consumidor_final(nota).get('consumidor_final', ''),
+            "Transporte": transporte.get('tem_transporte', ''),
+        }
+        natop = nota.get('NATUREZA_OPERACAO', '')
         
         for item_idx, item in enumerate(items):
+            # Cada classificador é calculado uma única vez por item
+            difal = identificar_difal(nota, item)
+            difal_debug = difal.get('debug', {})
+            cfop_info = get_cfop_info(item)
+            cst_icms = item.get('ICMS_CST') or item.get('ICMS_CSOSN', '')
+            ipi_status = get_ipi_status(item)
+            cofins_status = get_cofins_status(item)
+            cenario = ' | '.join(
+                partes_cenario_nota + _partes_cenario_item(item, difal.get('tem_difal', False))
+            )
+            
             info_nota = {
                 'ID': index,
-                "Cenario": gerar_cenario(nota, item),
-                'Numero Nota': nota.get('NUMERO_NF', ''),
-                'JSON da nota': json.dumps(nota, ensure_ascii=False, indent=2),
-                "Tipo": nota.get('TIPO_DOCUMENTO', ''),
-                "CNPJ/CPF Emissor": nota.get('EMIT_CNPJ') if nota.get('EMIT_CNPJ') else nota.get('EMIT_CPF', ''),
-                "Razão Social Emissor": nota.get('EMIT_RAZAO_SOCIAL', ''),
-                "CNPJ/CPF Destinatário": nota.get('DEST_CNPJ') if nota.get('DEST_CNPJ') else nota.get('DEST_CPF', ''),
-                "Razão Social Destinatário": nota.get('DEST_RAZAO_SOCIAL', ''),
-                "UF Emissor": nota.get('EMIT_UF', ''),
-                "UF Destinatário": nota.get('DEST_UF', ''),
-                "Operação": get_tipo_operacao(nota).get('tipo_operacao', ''),
-                "Consumidor Final": get_consumidor_final(nota).get('consumidor_final', ''),
-                "Transporte": get_transporte_info(nota).get('tem_transporte', ''),
+                "Cenario": cenario,
+                **colunas_nota,
             }
             info_produto = {
                 'NCM': item.get('NCM', ''),
                 'Classificação/Produto': item.get('XPROD', ''),
-                "NATOP": nota.get('NATUREZA_OPERACAO', ''),               
-                'CFOP': get_cfop_info(item).get('cfop', ''),
-                'DESC CFOP': get_cfop_info(item).get('desc_cfop', ''),
+                "NATOP": natop,
+                'CFOP': cfop_info.get('cfop', ''),
+                'DESC CFOP': cfop_info.get('desc_cfop', ''),
 
-                "CST ICMS": item.get('ICMS_CST') or item.get('ICMS_CSOSN', ''),
-                "DESC CST ICMS": _get_desc_cst_icms(item.get('ICMS_CST') or item.get('ICMS_CSOSN', '')),
+                "CST ICMS": cst_icms,
+                "DESC CST ICMS": _get_desc_cst_icms(cst_icms),
                 "%ICMS Normal": item.get('ICMS_PICMS', '0'),
                 "ICMS VBC": item.get('ICMS_VBC', '0'),
                 
-                "CST IPI": get_ipi_status(item).get('cst_ipi', ''),
-                "ENQUADRAMENTO IPI": get_ipi_status(item).get('ipi_status', ''),
-                "%IPI": get_ipi_status(item).get('valor_ipi', ''),
+                "CST IPI": ipi_status.get('cst_ipi', ''),
+                "ENQUADRAMENTO IPI": ipi_status.get('ipi_status', ''),
+                "%IPI": ipi_status.get('valor_ipi', ''),
                 "TIPI": get_tipi_aplicavel(item).get('tipi', 'NAO'),
 
                 "CST PIS": item.get('PIS_CST', ''),
                 "DESC CST PIS": _get_desc_cst_pis_cofins(item.get('PIS_CST', '')),
                 "%PIS": item.get('PIS_PPIS', ''),
                 
-                "CST COFINS": get_cofins_status(item).get('cst_cofins', ''),
-                "DESC CST COFINS": get_cofins_status(item).get('tem_cofins', ''),
+                "CST COFINS": cofins_status.get('cst_cofins', ''),
+                "DESC CST COFINS": cofins_status.get('tem_cofins', ''),
                 "%CONFINS": item.get('COFINS_PCOFINS', ''),
                 
                 "Sujeito a ISS?": get_issqn_info(item).get('tem_issqn', ''),
                 
-                "DIFAL": identificar_difal(nota, item).get('tem_difal', False),
-                "DIFAL motivo": identificar_difal(nota, item).get('motivo', ''),
-                "DIFAL interestadual": identificar_difal(nota, item).get('debug', {}).get('interestadual', False),
-                "DIFAL consumidor final": identificar_difal(nota, item).get('debug', {}).get('consumidor_final', ''),
-                "DIFAL ind_ie_dest": identificar_difal(nota, item).get('debug', {}).get('ind_ie_dest', ''),
-                "DIFAL cfop": identificar_difal(nota, item).get('debug', {}).get('cfop', ''),
+                "DIFAL": difal.get('tem_difal', False),
+                "DIFAL motivo": difal.get('motivo', ''),
+                "DIFAL interestadual": difal_debug.get('interestadual', False),
+                "DIFAL consumidor final": difal_debug.get('consumidor_final', ''),
+                "DIFAL ind_ie_dest": difal_debug.get('ind_ie_dest', ''),
+                "DIFAL cfop": difal_debug.get('cfop', ''),
                 
                 "Outros Impostos": item.get('OUTROS_IMPOSTOS', ''),
                 "Todos Impostos": item.get('TODOS_IMPOSTOS', ''),
@@ -541,39 +588,118 @@ def montar_dataframe_notas(notas: List[Dict[str, Any]]) -> pd.DataFrame:
             
             # resultado = {**info_nota, **info_produto, **info_icms}
             resultado = {**info_nota, **info_produto}
-            dados.append(resultado)
+            yield resultado
             index += 1
+
+
+def montar_dataframe_notas(
+    notas: Iterable[Dict[str, Any]],
+    modo_json_nota: str = 'linha',
+    notas_json: Optional[List[Dict[str, Any]]] = None,
+) -> pd.DataFrame:
+    """Monta o DataFrame do relatório com as linhas de gerar_linhas_notas."""
+    return pd.DataFrame(list(gerar_linhas_notas(notas, modo_json_nota, notas_json)))
+
+
+def montar_dataframe_json_notas(notas_json: List[Dict[str, Any]]) -> pd.DataFrame:
+    """Monta a aba com o JSON de cada nota (uma linha por nota, chave "ID Nota")."""
+    return pd.DataFrame(notas_json, columns=["ID Nota", "Numero Nota", "JSON da nota"])
+
+
+def gravar_relatorio_streaming(notas: Iterable[Dict[str, Any]], caminho: str, modo_json_nota: str) -> int:
+    """Gera as linhas do relatório e grava cada uma no Excel assim que é produzida. Retorna o total de linhas."""
+    print(f"\n2. Gerando e salvando relatorio em: {caminho}")
+    notas_json = []
+    with EscritorXlsx(caminho) as escritor:
+        aba = ABA_RELATORIO if modo_json_nota == 'aba' else ABA_PADRAO
+        total = escritor.escrever_dicts(aba, gerar_linhas_notas(notas, modo_json_nota, notas_json))
+        if modo_json_nota == 'aba':
+            escritor.escrever_dataframe(ABA_JSON_NOTAS, montar_dataframe_json_notas(notas_json))
+    print(f"   OK - {total} linhas gravadas")
+    return total
+
+
+def montar_relatorio(
+    arquivo_json: str,
+    modo_json_nota: str = 'linha',
+    notas_json: Optional[List[Dict[str, Any]]] = None,
+    vetorizado: bool = False,
+) -> pd.DataFrame:
+    """
+    Lê a saída do processador e monta o DataFrame do relatório, já com as
+    colunas categóricas do esquema (o mesmo usado no agrupamento de cenários).
+    """
+    if vetorizado:
+        import relatorio_vetorizado
+        if modo_json_nota == 'omitir' and arquivo_json.endswith('.parquet'):
+            df = relatorio_vetorizado.montar_dataframe_parquet(arquivo_json)
+        else:
+            df = relatorio_vetorizado.montar_dataframe_notas_vetorizado(ler_notas(arquivo_json), modo_json_nota, notas_json)
+    else:
+        df = montar_dataframe_notas(ler_notas(arquivo_json), modo_json_nota, notas_json)
     
-    return pd.DataFrame(dados)
+    return aplicar_esquema(df)
+
+
+def salvar_relatorio(
+    df: pd.DataFrame,
+    caminho: str,
+    modo_json_nota: str = 'linha',
+    notas_json: Optional[List[Dict[str, Any]]] = None,
+    streaming: bool = True,
+):
+    """Grava o relatório no Excel (em 'aba', com a aba do JSON das notas)."""
+    if modo_json_nota == 'aba':
+        abas = {ABA_RELATORIO: df, ABA_JSON_NOTAS: montar_dataframe_json_notas(notas_json or [])}
+    else:
+        abas = {ABA_PADRAO: df}
+    if streaming:
+        salvar_xlsx(caminho, abas)
+    else:
+        with pd.ExcelWriter(caminho) as writer:
+            for nome, df_aba in abas.items():
+                df_aba.to_excel(writer, sheet_name=nome, index=False)
 
 
 # ==============================================================================
 # MAIN
 # ==============================================================================
 
-def main():
+def _cabecalho():
     print("="*80)
     print("GERADOR DE RELATÓRIO CUSTOMIZADO V2")
     print("="*80)
     
     # 1. Carregar dados
     print(f"\n1. Carregando dados de: {ARQUIVO_JSON}")
-    with open(ARQUIVO_JSON, 'r', encoding='utf-8') as f:
-        notas = json.load(f)
-    print(f"   OK - {len(notas)} notas carregadas")
+
+
+def main_streaming() -> int:
+    """Grava as linhas direto no Excel, sem montar o DataFrame. Retorna o total de linhas."""
+    _cabecalho()
+    return gravar_relatorio_streaming(ler_notas(ARQUIVO_JSON), ARQUIVO_EXCEL, MODO_JSON_NOTA)
+
+
+def main() -> pd.DataFrame:
+    _cabecalho()
     
     # 2. Montar DataFrame
     print("\n2. Montando DataFrame...")
-    df = montar_dataframe_notas(notas)
+    notas_json = []
+    df = montar_relatorio(ARQUIVO_JSON, MODO_JSON_NOTA, notas_json, MONTAGEM_VETORIZADA)
     print(f"   OK - {len(df)} linhas criadas")
     
     # 3. Salvar em Excel
     print(f"\n3. Salvando relatorio em: {ARQUIVO_EXCEL}")
-    df.to_excel(ARQUIVO_EXCEL, index=False)
+    salvar_relatorio(df, ARQUIVO_EXCEL, MODO_JSON_NOTA, notas_json, EXCEL_STREAMING)
     print("   OK - Relatorio salvo com sucesso!")
     
     
     return df
 
 if __name__ == '__main__':
-    df = main()
+    # Streaming: as linhas vão direto para o Excel, sem montar o DataFrame
+    if EXCEL_STREAMING and not MONTAGEM_VETORIZADA:
+        main_streaming()
+    else:
+        df = main()
@@ -0,0 +1,152 @@
+import re
+from lxml import etree
+
+# ==============================================================================
+# CONFIGURAÇÕES
+# ==============================================================================
+
+NAMESPACE_NFE = 'http://www.portalfiscal.inf.br/nfe'
+
+# Elementos que delimitam uma nota dentro do arquivo (em qualquer namespace)
+TAGS_NOTA = ('{*}infNFe', '{*}infCte')
+
+# Tamanho do bloco lido do disco a cada chamada
+TAMANHO_BLOCO = 1 << 16
+
+# Declarações <?xml ...?> (com BOM opcional) removidas ao juntar documentos concatenados
+_DECLARACAO_XML = re.compile(rb'(?:\xef\xbb\xbf)?<\?xml[^>]*\?>')
+_ENCODING_DECLARADO = re.compile(rb'encoding=["\']([A-Za-z0-9._-]+)["\']')
+
+# ==============================================================================
+# FUNÇÕES
+# ==============================================================================
+
+class _FluxoLote:
+    """
+    Arquivo-like que entrega ao iterparse um ou vários documentos XML
+    concatenados (exportações em lote) sob um único elemento <lote>.
+
+    As declarações <?xml ...?> de cada documento são removidas; o encoding
+    da primeira declaração é mantido no cabeçalho do lote.
+    """
+
+    def __init__(self, arquivo, tamanho_bloco=TAMANHO_BLOCO):
+        self._arquivo = arquivo
+        self._tamanho_bloco = tamanho_bloco
+        self._pendente = b''
+        self._iniciado = False
+        self._finalizado = False
+
+    def _filtrar(self, dados, final):
+        """Remove declarações completas e guarda o trecho que pode ser uma declaração partida"""
+        dados = self._pendente + dados
+        self._pendente = b''
+
+        if not final:
+            # Declaração aberta e ainda não fechada neste bloco
+            inicio = dados.rfind(b'<?')
+            if inicio != -1 and b'?>' not in dados[inicio:]:
+                self._pendente = dados[inicio:]
+                dados = dados[:inicio]
+            else:
+                # Bloco termina com o começo de '<?xml' (ou de um BOM)
+                for tamanho in range(4, 0, -1):
+                    if dados.endswith(b'<?xml'[:tamanho]) or dados.endswith(b'\xef\xbb\xbf'[:tamanho]):
+                        self._pendente = dados[-tamanho:]
+                        dados = dados[:-tamanho]
+                        break
+
+        return _DECLARACAO_XML.sub(b'', dados)
+
+    def read(self, tamanho=-1):
+        if self._finalizado:
+            return b''
+
+        if not self._iniciado:
+            self._iniciado = True
+            dados = self._arquivo.read(self._tamanho_bloco)
+            cabecalho = b''
+            declaracao = _DECLARACAO_XML.search(dados[:1024])
+            if declaracao:
+                encoding = _ENCODING_DECLARADO.search(declaracao.group(0))
+                if encoding:
+                    cabecalho = b'<?xml version="1.0" encoding="' + encoding.group(1) + b'"?>'
+            return cabecalho + b'<lote>' + self._filtrar(dados, final=not dados)
+
+        while True:
+            dados = self._arquivo.read(self._tamanho_bloco)
+            if not dados:
+                self._finalizado = True
+                return self._filtrar(b'', final=True) + b'</lote>'
+
+            saida = self._filtrar(dados, final=False)
+            if saida:
+                return saida
+
+
+def _raiz_documento(elemento):
+    """Retorna o elemento raiz do documento (filho direto do <lote>) que contém o elemento"""
+    raiz = elemento
+    for ancestral in elemento.iterancestors():
+        if ancestral.getparent() is None:
+            break
+        raiz = ancestral
+    return raiz
+
+
+def namespace_do_elemento(elemento):
+    """Extrai o namespace de um elemento (None se não houver)"""
+    if isinstance(elemento.tag, str) and '}' in elemento.tag:
+        return elemento.tag.split('}')[0][1:]
+    return None
+
+
+def nome_local(elemento):
+    """Nome da tag sem namespace (ex: '{...nfe}infNFe' -> 'infNFe')"""
+    return etree.QName(elemento).localname
+
+
+def _liberar(elemento):
+    """Limpa o elemento já processado e descarta os irmãos anteriores dele e dos ancestrais"""
+    elemento.clear()
+    for ancestral in elemento.iterancestors():
+        while ancestral.getprevious() is not None:
+            del ancestral.getparent()[0]
+
+
+def iterar_notas(caminho_xml):
+    """
+    Lê o arquivo em streaming e gera uma nota por vez, como (elemento, namespace_raiz).
+
+    - elemento: <infNFe> ou <infCte> (com namespace), válido apenas até a próxima iteração
+    - namespace_raiz: namespace do documento que contém a nota (ex: o do <nfeProc>)
+
+    Suporta arquivo com uma nota, bundles nfeProc e exportações com vários
+    documentos concatenados. Cada nota é descartada da memória após ser
+    consumida, então o uso de memória não cresce com o número de notas.
+
+    Se o arquivo não tiver infNFe/infCte (ex: NFSe), gera a raiz de cada
+    documento, para que o chamador aplique suas próprias regras.
+    """
+    encontrou_nota = False
+
+    with open(caminho_xml, 'rb') as arquivo:
+        contexto = etree.iterparse(
+            _FluxoLote(arquivo),
+            events=('end',),
+            tag=TAGS_NOTA,
+            remove_comments=True,
+            remove_pis=True,
+            huge_tree=True,
+        )
+
+        for _, elemento in contexto:
+            encontrou_nota = True
+            yield elemento, namespace_do_elemento(_raiz_documento(elemento))
+            _liberar(elemento)
+
+        if not encontrou_nota:
+            lote = contexto.root
+            if lote is not None:
+                for documento in lote:
+                    yield documento, namespace_do_elemento(documento)
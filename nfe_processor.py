@@ -1,10 +1,12 @@
 
 import os
 import pandas as pd
-import xml.etree.ElementTree as ET
+from lxml import etree
 from typing import List, Dict, Any
 import re
 
+from leitor_nfe import iterar_notas, nome_local
+
 # ==============================================================================
 # 1. CONFIGURAÇÕES CONTROLADAS POR VARIÁVEIS
 # ==============================================================================
@@ -100,7 +102,7 @@ class NFeMapper:
         
         return 'Não encontrado no InfCpl'
 
-    def extract_value(self, element: ET.Element, xpath: str) -> str:
+    def extract_value(self, element: etree._Element, xpath: str) -> str:
         """Extrai valor usando XPath relativo/caminho, tratando tags simples e caminhos, com namespace."""
         if not xpath:
             return ''
@@ -127,27 +129,34 @@ class NFeMapper:
 
     def process_xml_file(self, file_path: str) -> List[Dict[str, Any]]:
         """
-        Processa um único arquivo XML, extraindo os dados de cada item (det)
+        Processa um arquivo XML, extraindo os dados de cada item (det)
         e os dados de cabeçalho, considerando o novo mapeamento XPath relativo.
+
+        O arquivo é lido em streaming (uma <infNFe> por vez), então bundles
+        nfeProc e exportações com várias notas concatenadas também são aceitos.
         """
+        items_list: List[Dict[str, Any]] = []
+        encontrou_nota = False
         try:
-            tree = ET.parse(file_path)
-            root = tree.getroot()
-        except ET.ParseError:
+            for infnfe_node, _ in iterar_notas(file_path):
+                if nome_local(infnfe_node) != 'infNFe':
+                    continue
+                encontrou_nota = True
+                items_list.extend(self._process_infnfe(infnfe_node, file_path))
+        except etree.XMLSyntaxError:
             print(f"ERRO: Não foi possível analisar o XML: {file_path}")
             return []
         except FileNotFoundError:
             print(f"ERRO: Arquivo não encontrado: {file_path}")
             return []
 
-        # Busca <infNFe> dentro de <NFe> usando namespace
-        infnfe_node = root.find('.//{http://www.portalfiscal.inf.br/nfe}NFe/{http://www.portalfiscal.inf.br/nfe}infNFe')
-        if infnfe_node is None:
-            infnfe_node = root.find('.//{http://www.portalfiscal.inf.br/nfe}infNFe')
-        if infnfe_node is None:
+        if not encontrou_nota:
             print(f"ERRO: Não encontrado <infNFe> em {file_path}")
-            return []
 
+        return items_list
+
+    def _process_infnfe(self, infnfe_node: etree._Element, file_path: str) -> List[Dict[str, Any]]:
+        """Extrai cabeçalho e itens de uma única <infNFe>."""
         # 1. Extrai dados de cabeçalho
         header_data: Dict[str, str] = {}
         # Extrai todos os campos do mapping de forma dinâmica
@@ -0,0 +1,339 @@
+import argparse
+import hashlib
+import json
+import os
+import time
+
+import gerar_relatorio_customizado_v3 as relatorio
+import processador_notas_v2 as processador
+from formatos_notas import EXTENSOES, caminho_saida
+from gerar_relatorio_cenarios import agrupar_cenarios_nfs
+
+# ==============================================================================
+# CONFIGURAÇÃO
+# ==============================================================================
+
+# Saída do processador_notas_v2 e arquivos gerados
+ARQUIVO_NOTAS = relatorio.ARQUIVO_JSON
+ARQUIVO_AGRUPADO = 'output/relatorio_agrupado_moet.xlsx'
+
+# Relatório customizado em Excel: só um artefato opcional (None = não grava);
+# o agrupamento recebe o DataFrame direto, sem reler o Excel
+ARQUIVO_RELATORIO = None
+
+# JSON das notas no relatório (ver relatorio.MODOS_JSON_NOTA). O agrupamento
+# não usa o JSON, então 'omitir' é o mais rápido quando o Excel não é gravado.
+MODO_JSON_NOTA = 'omitir'
+
+# CLI: uma subpasta de XMLs por cliente e os arquivos de saída com o nome dele
+PASTA_CLIENTES = 'reading_notes'
+PASTA_SAIDA = 'output'
+
+# Impressão digital das entradas de cada etapa já executada, por cliente
+PASTA_ESTADO = os.path.join(PASTA_SAIDA, '.pipeline')
+
+# Incrementar quando a lógica de alguma etapa mudar, para refazer todas
+VERSAO_PIPELINE = 1
+
+ETAPAS = ('notas', 'relatorio', 'cenarios')
+
+# ==============================================================================
+# PIPELINE
+# ==============================================================================
+
+def executar_pipeline(
+    arquivo_notas=ARQUIVO_NOTAS,
+    arquivo_agrupado=ARQUIVO_AGRUPADO,
+    arquivo_relatorio=ARQUIVO_RELATORIO,
+    modo_json_nota=MODO_JSON_NOTA,
+):
+    """
+    Monta o relatório customizado a partir das notas e agrupa os cenários
+    no mesmo processo, passando o DataFrame de uma etapa para a outra.
+
+    O resultado do agrupamento é o mesmo de gerar o Excel com
+    gerar_relatorio_customizado_v3 e lê-lo em gerar_relatorio_cenarios.
+    Retorna o DataFrame agrupado.
+    """
+    print("=" * 80)
+    print("PIPELINE: RELATÓRIO CUSTOMIZADO -> CENÁRIOS")
+    print("=" * 80)
+
+    # 1. Relatório customizado
+    inicio = time.perf_counter()
+    print(f"\n1. Montando relatorio a partir de: {arquivo_notas}")
+    notas_json = []
+    df = relatorio.montar_relatorio(arquivo_notas, modo_json_nota, notas_json, relatorio.MONTAGEM_VETORIZADA)
+    print(f"   OK - {len(df)} linhas em {time.perf_counter() - inicio:.1f}s")
+
+    # 2. Excel do relatório (opcional)
+    if arquivo_relatorio:
+        inicio = time.perf_counter()
+        print(f"\n2. Salvando relatorio em: {arquivo_relatorio}")
+        relatorio.salvar_relatorio(df, arquivo_relatorio, modo_json_nota, notas_json, relatorio.EXCEL_STREAMING)
+        print(f"   OK - {time.perf_counter() - inicio:.1f}s")
+
+    # 3. Agrupamento de cenários
+    inicio = time.perf_counter()
+    print(f"\n3. Agrupando cenarios em: {arquivo_agrupado}")
+    df_agrupado = agrupar_cenarios_nfs(df, arquivo_agrupado)
+    print(f"   OK - {time.perf_counter() - inicio:.1f}s")
+    return df_agrupado
+
+# ==============================================================================
+# ETAPAS POR CLIENTE
+# ==============================================================================
+
+def caminhos_cliente(cliente, formato=processador.FORMATO_SAIDA):
+    """Pasta de XMLs e arquivos de saída de um cliente (ex: moet -> output/resposta_notas_moet.json)"""
+    return {
+        'xmls': os.path.join(PASTA_CLIENTES, cliente),
+        'notas': caminho_saida(os.path.join(PASTA_SAIDA, f'resposta_notas_{cliente}.json'), formato),
+        'relatorio': os.path.join(PASTA_SAIDA, f'relatorio_customizado_{cliente}.xlsx'),
+        'agrupado': os.path.join(PASTA_SAIDA, f'relatorio_agrupado_{cliente}.xlsx'),
+    }
+
+
+def _arquivos(caminho):
+    """Arquivos de um caminho (o próprio arquivo ou o conteúdo da pasta), em ordem"""
+    if os.path.isdir(caminho):
+        for raiz, pastas, nomes in os.walk(caminho):
+            pastas.sort()
+            for nome in sorted(nomes):
+                yield os.path.join(raiz, nome)
+    else:
+        yield caminho
+
+
+def impressao_digital(caminhos, **parametros):
+    """
+    Hash das entradas de uma etapa: nome, tamanho e mtime de cada arquivo
+    (pastas são percorridas) junto com os parâmetros da etapa.
+    """
+    resumo = hashlib.sha256(json.dumps([VERSAO_PIPELINE, parametros], sort_keys=True).encode('utf-8'))
+    for caminho in caminhos:
+        for arquivo in _arquivos(caminho):
+            try:
+                estado = os.stat(arquivo)
+                marca = f'{arquivo}\0{estado.st_size}\0{estado.st_mtime_ns}\n'
+            except OSError:
+                marca = f'{arquivo}\0ausente\n'
+            resumo.update(marca.encode('utf-8'))
+    return resumo.hexdigest()[:16]
+
+
+def _arquivo_estado(cliente):
+    return os.path.join(PASTA_ESTADO, f'{cliente}.json')
+
+
+def ler_estado(cliente):
+    """Impressões digitais das etapas já executadas para o cliente ({etapa: hash})"""
+    try:
+        with open(_arquivo_estado(cliente), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def gravar_estado(cliente, estado):
+    """Grava as impressões digitais do cliente (escrita atômica)"""
+    os.makedirs(PASTA_ESTADO, exist_ok=True)
+    destino = _arquivo_estado(cliente)
+    temporario = f'{destino}.{os.getpid()}.tmp'
+    with open(temporario, 'w', encoding='utf-8') as f:
+        json.dump(estado, f, indent=2)
+    os.replace(temporario, destino)
+
+
+def _executar_etapa(cliente, estado, etapa, digital, saidas, forcar, funcao):
+    """
+    Executa a etapa, a menos que as entradas não tenham mudado desde a última
+    execução e as saídas existam. Retorna o tempo gasto (None se pulada).
+
+    funcao retorna a lista de falhas ({'arquivo': ..., 'erro': ...}, já
+    exibidas por quem as gerou); com falhas a etapa não é marcada como
+    concluída e roda de novo na próxima execução.
+    """
+    if not forcar and estado.get(etapa) == digital and all(os.path.exists(saida) for saida in saidas):
+        print(f"\n[{cliente}] {etapa}: entradas sem alteração, etapa pulada")
+        return None
+
+    print(f"\n[{cliente}] {etapa}")
+    inicio = time.perf_counter()
+    falhas = funcao()
+    tempo = time.perf_counter() - inicio
+
+    if falhas:
+        print(f"\n[{cliente}] {etapa}: {len(falhas)} falha(s), etapa será refeita na próxima execução")
+        return tempo
+
+    # Gravado a cada etapa: uma falha adiante não obriga a refazer esta
+    estado[etapa] = digital
+    gravar_estado(cliente, estado)
+    return tempo
+
+
+def executar_cliente(cliente, etapas=ETAPAS, forcar=False, workers=processador.WORKERS,
+                     formato=processador.FORMATO_SAIDA, modo_json_nota=relatorio.MODO_JSON_NOTA):
+    """
+    Executa as etapas pedidas para um cliente, na ordem XMLs -> notas ->
+    relatório -> cenários (Excel, JSON e TOON). O DataFrame do relatório é
+    montado uma vez e passado direto ao agrupamento.
+
+    Retorna {etapa: segundos ou None se pulada}.
+    """
+    caminhos = caminhos_cliente(cliente, formato)
+    if 'notas' in etapas and not os.path.isdir(caminhos['xmls']):
+        raise FileNotFoundError(f"Pasta de XMLs não encontrada: {caminhos['xmls']}")
+
+    estado = ler_estado(cliente)
+    tempos = {}
+    montado = {}
+
+    def dataframe_relatorio(modo):
+        # Montado uma única vez (com o JSON das notas se o relatório for gravado)
+        if 'df' not in montado:
+            montado['notas_json'] = []
+            montado['df'] = relatorio.montar_relatorio(
+                caminhos['notas'], modo, montado['notas_json'], relatorio.MONTAGEM_VETORIZADA
+            )
+            montado['modo'] = modo
+        return montado['df']
+
+    # 1. XMLs -> notas
+    if 'notas' in etapas:
+        xmls = sorted(
+            os.path.join(caminhos['xmls'], arquivo)
+            for arquivo in os.listdir(caminhos['xmls']) if arquivo.endswith('.xml')
+        )
+        tempos['notas'] = _executar_etapa(
+            cliente, estado, 'notas',
+            impressao_digital(xmls + [processador.ARQUIVO_MAPEAMENTO], formato=formato),
+            [caminhos['notas']], forcar,
+            lambda: processador.processar_pasta(caminhos['xmls'], caminhos['notas'], workers, formato=formato)['erros'],
+        )
+
+    # As etapas seguintes dependem do arquivo de notas e da base CFOP
+    entradas_relatorio = [caminhos['notas'], relatorio.ARQUIVO_BASE_CFOP]
+
+    # 2. Notas -> relatório customizado (Excel)
+    if 'relatorio' in etapas:
+        def gravar_relatorio():
+            df = dataframe_relatorio(modo_json_nota)
+            relatorio.salvar_relatorio(
+                df, caminhos['relatorio'], montado['modo'], montado['notas_json'], relatorio.EXCEL_STREAMING
+            )
+            return []
+        tempos['relatorio'] = _executar_etapa(
+            cliente, estado, 'relatorio',
+            impressao_digital(entradas_relatorio, modo_json_nota=modo_json_nota),
+            [caminhos['relatorio']], forcar, gravar_relatorio,
+        )
+
+    # 3. Relatório -> cenários (Excel, JSON e TOON)
+    if 'cenarios' in etapas:
+        base = os.path.splitext(caminhos['agrupado'])[0]
+        def agrupar_cenarios():
+            agrupar_cenarios_nfs(dataframe_relatorio('omitir'), caminhos['agrupado'])
+            return []
+        tempos['cenarios'] = _executar_etapa(
+            cliente, estado, 'cenarios',
+            impressao_digital(entradas_relatorio),
+            [caminhos['agrupado'], base + '.json', base + '.toon'], forcar, agrupar_cenarios,
+        )
+    return tempos
+
+
+def imprimir_tempos(tempos_por_cliente):
+    """Resumo dos tempos de cada etapa por cliente"""
+    print("\n" + "=" * 80)
+    print("TEMPOS POR ETAPA")
+    print("=" * 80)
+    for cliente, tempos in tempos_por_cliente.items():
+        if isinstance(tempos, Exception):
+            print(f"{cliente:<24} ERRO: {tempos}")
+            continue
+        colunas = [
+            f"{etapa}: {'pulada' if tempo is None else f'{tempo:.1f}s'}"
+            for etapa, tempo in tempos.items()
+        ]
+        total = sum(tempo for tempo in tempos.values() if tempo is not None)
+        print(f"{cliente:<24} " + ' | '.join(colunas) + f" | total: {total:.1f}s")
+
+# ==============================================================================
+# CLI
+# ==============================================================================
+
+def _clientes(args):
+    """Clientes pedidos na linha de comando (--todos = todas as pastas de PASTA_CLIENTES)"""
+    if args.todos:
+        return sorted(
+            nome for nome in os.listdir(PASTA_CLIENTES)
+            if os.path.isdir(os.path.join(PASTA_CLIENTES, nome))
+        )
+    if not args.clientes:
+        raise SystemExit("Informe ao menos um cliente ou use --todos")
+    return args.clientes
+
+
+def criar_parser():
+    parser = argparse.ArgumentParser(
+        description="Pipeline XMLs -> notas -> relatório customizado -> cenários (Excel, JSON e TOON)",
+    )
+    subparsers = parser.add_subparsers(dest='comando', required=True)
+
+    comandos = {
+        'notas': "Extrai as notas dos XMLs do cliente",
+        'relatorio': "Gera o relatório customizado (Excel) a partir das notas",
+        'cenarios': "Agrupa os cenários a partir das notas (Excel, JSON e TOON)",
+        'run-all': "Executa todas as etapas, pulando as que estão em dia",
+    }
+    for comando, ajuda in comandos.items():
+        sub = subparsers.add_parser(comando, help=ajuda, description=ajuda)
+        sub.add_argument('clientes', nargs='*', help=f"Nome da pasta do cliente em {PASTA_CLIENTES}/ (ex: moet)")
+        sub.add_argument('--todos', action='store_true', help=f"Todos os clientes de {PASTA_CLIENTES}/")
+        sub.add_argument('--forcar', action='store_true', help="Executa mesmo sem alteração nas entradas")
+        sub.add_argument('--formato', choices=list(EXTENSOES), default=processador.FORMATO_SAIDA,
+                         help="Formato do arquivo de notas")
+        if comando in ('notas', 'run-all'):
+            sub.add_argument('--workers', type=int, default=processador.WORKERS,
+                             help="Processos para extrair os XMLs (0 = todos os núcleos)")
+        if comando in ('relatorio', 'run-all'):
+            sub.add_argument('--modo-json', choices=relatorio.MODOS_JSON_NOTA, default=relatorio.MODO_JSON_NOTA,
+                             help="JSON das notas no relatório")
+        if comando == 'run-all':
+            sub.add_argument('--sem-relatorio', action='store_true',
+                             help="Não grava o Excel do relatório customizado")
+    return parser
+
+
+def main(argv=None):
+    args = criar_parser().parse_args(argv)
+
+    if args.comando == 'run-all':
+        etapas = tuple(etapa for etapa in ETAPAS if not (args.sem_relatorio and etapa == 'relatorio'))
+    else:
+        etapas = (args.comando,)
+
+    tempos_por_cliente = {}
+    for cliente in _clientes(args):
+        try:
+            tempos_por_cliente[cliente] = executar_cliente(
+                cliente,
+                etapas,
+                forcar=args.forcar,
+                workers=getattr(args, 'workers', processador.WORKERS) or None,
+                formato=args.formato,
+                modo_json_nota=getattr(args, 'modo_json', relatorio.MODO_JSON_NOTA),
+            )
+        except Exception as e:
+            # Um cliente com problema não interrompe os demais
+            print(f"\n[{cliente}] ERRO: {e}")
+            tempos_por_cliente[cliente] = e
+
+    imprimir_tempos(tempos_por_cliente)
+    return 1 if any(isinstance(tempos, Exception) for tempos in tempos_por_cliente.values()) else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
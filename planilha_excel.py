@@ -0,0 +1,188 @@
+import os
+from itertools import chain
+
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook, load_workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Font, Side
+
+# ==============================================================================
+# CONFIGURAÇÕES
+# ==============================================================================
+
+# Limite de linhas de uma aba do Excel (cabeçalho incluído)
+LIMITE_LINHAS_ABA = 1_048_576
+
+# Nome usado pelo pandas quando não se informa a aba
+ABA_PADRAO = 'Sheet1'
+
+# Tamanho máximo do nome de uma aba
+TAMANHO_NOME_ABA = 31
+
+# ==============================================================================
+# ESCRITOR
+# ==============================================================================
+
+_BORDA = Side(style='thin')
+
+
+def _valor_celula(valor):
+    """Converte o valor para o que o openpyxl grava (NaN/NaT viram célula vazia, como no to_excel)"""
+    if isinstance(valor, np.generic):
+        valor = valor.item()
+    if valor is None or (pd.api.types.is_scalar(valor) and pd.isna(valor)):
+        return None
+    return valor
+
+
+class EscritorXlsx:
+    """
+    Grava um .xlsx linha a linha (openpyxl em modo write_only), sem montar
+    a planilha inteira em memória.
+
+    Cada aba recebe um cabeçalho no mesmo estilo do DataFrame.to_excel. Ao
+    atingir limite_linhas a aba continua em outra, "<nome> (2)", "<nome> (3)"...,
+    com o cabeçalho repetido.
+    """
+
+    def __init__(self, caminho, limite_linhas=LIMITE_LINHAS_ABA):
+        self.caminho = caminho
+        self.limite_linhas = limite_linhas
+        self.total = 0
+        self._livro = None
+        self._aba = None
+        self._nome = None
+        self._colunas = None
+        self._partes = 0
+        self._linhas_aba = 0
+
+    def __enter__(self):
+        pasta = os.path.dirname(self.caminho)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+        self._livro = Workbook(write_only=True)
+        return self
+
+    def _cabecalho(self):
+        celulas = []
+        for coluna in self._colunas:
+            celula = WriteOnlyCell(self._aba, value=coluna)
+            celula.font = Font(bold=True)
+            celula.border = Border(left=_BORDA, right=_BORDA, top=_BORDA, bottom=_BORDA)
+            celula.alignment = Alignment(horizontal='center', vertical='top')
+            celulas.append(celula)
+        return celulas
+
+    def _abrir_parte(self):
+        """Cria a próxima aba do nome atual e grava o cabeçalho"""
+        self._partes += 1
+        titulo = self._nome
+        if self._partes > 1:
+            sufixo = f' ({self._partes})'
+            titulo = titulo[:TAMANHO_NOME_ABA - len(sufixo)] + sufixo
+        self._aba = self._livro.create_sheet(titulo)
+        self._linhas_aba = 0
+        if self._colunas:
+            self._aba.append(self._cabecalho())
+            self._linhas_aba = 1
+
+    def nova_aba(self, nome, colunas):
+        """Começa uma aba com as colunas informadas"""
+        self._nome = nome[:TAMANHO_NOME_ABA]
+        self._colunas = list(colunas)
+        self._partes = 0
+        self._abrir_parte()
+
+    def escrever(self, linha):
+        """Acrescenta uma linha (sequência na ordem das colunas) à aba atual"""
+        if self._linhas_aba >= self.limite_linhas:
+            self._abrir_parte()
+        self._aba.append([_valor_celula(valor) for valor in linha])
+        self._linhas_aba += 1
+        self.total += 1
+
+    def escrever_dicts(self, nome, linhas, colunas=None):
+        """
+        Grava uma aba a partir de dicts (ex: um gerador de linhas).
+
+        Sem colunas, usa as chaves da primeira linha; chaves ausentes ficam vazias.
+        Retorna o número de linhas gravadas.
+        """
+        linhas = iter(linhas)
+        if colunas is None:
+            primeira = next(linhas, None)
+            colunas = list(primeira) if primeira is not None else []
+            if primeira is not None:
+                linhas = chain([primeira], linhas)
+        inicio = self.total
+        self.nova_aba(nome, colunas)
+        for linha in linhas:
+            self.escrever([linha.get(coluna) for coluna in colunas])
+        return self.total - inicio
+
+    def escrever_dataframe(self, nome, df):
+        """Grava um DataFrame numa aba (sem índice, como to_excel(index=False))"""
+        inicio = self.total
+        self.nova_aba(nome, [str(coluna) for coluna in df.columns])
+        for linha in df.itertuples(index=False, name=None):
+            self.escrever(linha)
+        return self.total - inicio
+
+    def fechar(self):
+        """Grava o arquivo"""
+        if self._livro is None:
+            return
+        if not self._livro.worksheets:
+            self._livro.create_sheet(ABA_PADRAO)
+        self._livro.save(self.caminho)
+        self._livro = None
+
+    def __exit__(self, tipo_erro, *exc):
+        if tipo_erro is None:
+            self.fechar()
+        return False
+
+
+def salvar_xlsx(caminho, abas, limite_linhas=LIMITE_LINHAS_ABA):
+    """
+    Grava DataFrames em abas de um .xlsx via EscritorXlsx.
+
+    abas: DataFrame (gravado em ABA_PADRAO) ou dict {nome da aba: DataFrame}.
+    """
+    if not isinstance(abas, dict):
+        abas = {ABA_PADRAO: abas}
+    with EscritorXlsx(caminho, limite_linhas) as escritor:
+        for nome, df in abas.items():
+            escritor.escrever_dataframe(nome, df)
+    return escritor.total
+
+
+def abas_continuacao(nomes, aba):
+    """Nomes da aba e das continuações criadas pelo EscritorXlsx ("<aba> (2)", ...), em ordem"""
+    encontradas = [aba]
+    while True:
+        sufixo = f' ({len(encontradas) + 1})'
+        proxima = aba[:TAMANHO_NOME_ABA - len(sufixo)] + sufixo
+        if proxima not in nomes:
+            return encontradas
+        encontradas.append(proxima)
+
+
+def ler_xlsx(caminho, aba=None):
+    """
+    Lê uma aba de um .xlsx como DataFrame, juntando as continuações gravadas
+    pelo EscritorXlsx quando ela passou do limite de linhas.
+
+    Sem aba, lê a primeira (como pd.read_excel).
+    """
+    livro = load_workbook(caminho, read_only=True)
+    try:
+        nomes = livro.sheetnames
+    finally:
+        livro.close()
+    partes = abas_continuacao(nomes, aba if aba is not None else nomes[0])
+    if len(partes) == 1:
+        return pd.read_excel(caminho, sheet_name=partes[0])
+    dfs = pd.read_excel(caminho, sheet_name=partes)
+    return pd.concat([dfs[parte] for parte in partes], ignore_index=True)
@@ -1,7 +1,14 @@
 import json
 import os
+import re
+from functools import lru_cache
+from multiprocessing import Pool
 from lxml import etree
 
+from cache_notas import PASTA_CACHE, CacheNotas
+from formatos_notas import FORMATO_PADRAO, caminho_saida, criar_escritor
+from leitor_nfe import NAMESPACE_NFE, iterar_notas, namespace_do_elemento, nome_local
+
 # ==============================================================================
 # CONFIGURAÇÕES
 # ==============================================================================
@@ -9,13 +16,69 @@ from lxml import etree
 PASTA_XMLS = 'reading_notes/moet'
 ARQUIVO_MAPEAMENTO = 'mapping_config.json'
 ARQUIVO_SAIDA = 'output/resposta_notas_moet.json'
+# Formato da saída: 'json' (array indentado), 'ndjson' (uma nota por linha,
+# gravada assim que extraída) ou 'parquet' (pasta .parquet com tabelas de
+# notas e de itens; requer pyarrow)
+FORMATO_SAIDA = FORMATO_PADRAO
+
+# Processamento paralelo: 1 = sequencial, None = todos os núcleos da máquina
+WORKERS = 1
+# Quantidade de arquivos enviada a cada worker por vez
+CHUNKSIZE = 16
+
+# Reaproveita as notas já extraídas de arquivos que não mudaram (ver cache_notas.py)
+USAR_CACHE = True
+
+# Campos do mapeamento calculados por funções próprias (não por XPath)
+CAMPOS_ESPECIAIS = {
+    'NAMESPACE_RAIZ',
+    'TIPO_DOCUMENTO',
+    'CHAVE_ACESSO',
+    'ITEM_OUTROS_IMPOSTOS',
+    'ITEM_TODOS_IMPOSTOS',
+    'ITEM_TEM_DIFAL',
+}
+
+# Prefixos dos caminhos no mapeamento: campos da nota são avaliados relativos
+# ao <infNFe> e campos de item relativos a cada <det>
+PREFIXO_NOTA = 'infNFe'
+PREFIXO_ITEM = 'infNFe/det'
+
+# Impostos convencionais (os demais entram em ITEM_OUTROS_IMPOSTOS)
+IMPOSTOS_PADRAO = {'ICMS', 'IPI', 'PIS', 'COFINS', 'ISSQN'}
+
+# Caminhos fixos usados nas regras (relativos ao <infNFe>, ou ao <det> nos de item)
+CAMINHO_MODELO = 'ide/mod'
+CAMINHO_NCM = 'det/prod/NCM'
+CAMINHO_ISSQN = 'det/imposto/ISSQN'
+CAMINHO_ITENS = 'det'
+CAMINHO_IND_FINAL = 'ide/indFinal'
+CAMINHO_UF_EMITENTE = 'emit/enderEmit/UF'
+CAMINHO_UF_DESTINATARIO = 'dest/enderDest/UF'
+CAMINHO_IND_IE_DEST = 'dest/indIEDest'
+CAMINHO_IMPOSTOS_ITEM = 'imposto/*'
+CAMINHO_ICMS_UFDEST_ITEM = './/ICMSUFDest'
+
+# Chave de acesso no atributo Id da nota (ex: 'NFe3525...')
+_CHAVE_NO_ID = re.compile(r'(\d{44})$')
+
+# Prefixo ligado ao namespace da nota nos XPaths compilados
+PREFIXO_NS = 'nfe'
+
+# Passo de caminho que é só um nome de elemento (recebe o prefixo do namespace)
+_PASSO_SIMPLES = re.compile(r'^[A-Za-z_][\w.-]*$')
 
 # ==============================================================================
 # FUNÇÕES
 # ==============================================================================
 
 def remover_namespace(elemento):
-    """Remove namespace de um elemento e seus filhos"""
+    """
+    Remove namespace de um elemento e seus filhos
+    
+    Não é mais usada na extração (os XPaths são compilados com o namespace
+    da nota); mantida para quem precisa da árvore sem namespaces.
+    """
     for elem in elemento.iter():
         if isinstance(elem.tag, str) and '}' in elem.tag:
             elem.tag = elem.tag.split('}', 1)[1]
@@ -31,10 +94,34 @@ def extrair_namespace_raiz(tree):
     return None
 
 
+def _localizar_infnfe(raiz):
+    """Aceita a raiz do documento ou o próprio <infNFe> e retorna o <infNFe> (ou None)"""
+    return next(raiz.iter('{*}infNFe'), None)
+
+
+def extrair_chave_acesso(nota):
+    """Chave de acesso (44 dígitos) do atributo Id do <infNFe>, sem o prefixo 'NFe'"""
+    encontrada = _CHAVE_NO_ID.search(nota.get('Id') or '')
+    return encontrada.group(1) if encontrada else None
+
+
+@lru_cache(maxsize=None)
+def _xpath_regra(caminho, namespace):
+    """XPath fixo de regra compilado para o namespace da nota"""
+    return _compilar(caminho, namespace)
+
+
+def _regra(elemento, caminho):
+    """Avalia um caminho fixo de regra no namespace do próprio elemento"""
+    return _xpath_regra(caminho, namespace_do_elemento(elemento))(elemento)
+
+
 def extrair_tipo_documento(raiz, namespace):
     """
     Determina o tipo de documento: mercadoria, serviço ou CT-e
     
+    Recebe a raiz do documento ou o <infNFe> da nota.
+    
     Regras:
     1. Se namespace != http://www.portalfiscal.inf.br/nfe → serviço (NFSe)
     2. Se mod = 55 ou 65 → mercadoria
@@ -43,11 +130,15 @@ def extrair_tipo_documento(raiz, namespace):
     5. Se tem ISSQN e não tem NCM → serviço
     """
     # Regra 1: Verifica namespace
-    if namespace and namespace != 'http://www.portalfiscal.inf.br/nfe':
+    if namespace and namespace != NAMESPACE_NFE:
         return 'serviço'
     
+    nota = _localizar_infnfe(raiz)
+    if nota is None:
+        return None
+    
     # Extrai modelo
-    modelo = extrair_valor(raiz, 'infNFe/ide/mod')
+    modelo = _valor_regra(nota, CAMINHO_MODELO)
     
     # Regra 2: Modelos 55 e 65
     if modelo in ['55', '65']:
@@ -58,37 +149,174 @@ def extrair_tipo_documento(raiz, namespace):
         return 'CT-e'
     
     # Regra 4: Verifica presença de NCM
-    tem_ncm = raiz.xpath('//infNFe/det/prod/NCM')
+    tem_ncm = _regra(nota, CAMINHO_NCM)
     if tem_ncm:
         return 'mercadoria'
     
     # Regra 5: Verifica presença de ISSQN (sem NCM)
-    tem_issqn = raiz.xpath('//infNFe/det/imposto/ISSQN')
+    tem_issqn = _regra(nota, CAMINHO_ISSQN)
     if tem_issqn:
         return 'serviço'
     
     return None
 
 
-def extrair_valor(raiz, xpath, retornar_elemento=False):
-    """Extrai valor de um XPath, tentando múltiplas alternativas separadas por ' ou '"""
-    if not xpath:
+def _alternativas(xpath):
+    """Separa as alternativas de um caminho_xml (' ou '), ignorando descrições textuais"""
+    for caminho in (xpath or '').split(' ou '):
+        caminho = caminho.strip()
+        if caminho and not (' ' in caminho and '/' not in caminho):
+            yield caminho
+
+
+def _qualificar(expressao):
+    """Prefixa os nomes de elemento de um caminho simples ('ide/mod' -> 'nfe:ide/nfe:mod')"""
+    return '/'.join(
+        f'{PREFIXO_NS}:{passo}' if _PASSO_SIMPLES.match(passo) else passo
+        for passo in expressao.split('/')
+    )
+
+
+def _compilar(expressao, namespace=None):
+    """
+    Compila uma expressão XPath, retornando None se ela for inválida.
+    
+    Com namespace, os nomes de elemento do caminho são qualificados com ele,
+    para avaliar direto na árvore original (sem remover_namespace). Passos com
+    predicados ou eixos explícitos não são qualificados.
+    """
+    try:
+        if namespace:
+            return etree.XPath(_qualificar(expressao), namespaces={PREFIXO_NS: namespace})
+        return etree.XPath(expressao)
+    except etree.XPathSyntaxError:
         return None
+
+
+def compilar_caminho(xpath, prefixo=None, namespace=None):
+    """
+    Compila as alternativas de um caminho_xml (separadas por ' ou ') em objetos etree.XPath.
     
-    # Tenta cada XPath alternativo
-    for caminho in xpath.split(' ou '):
-        caminho = caminho.strip()
-        
-        # Ignora descrições textuais
-        if ' ' in caminho and '/' not in caminho:
-            continue
-        
+    Sem prefixo, os caminhos são buscados no documento todo ('//' + caminho).
+    Com prefixo (ex: 'infNFe'), os caminhos sob ele ficam relativos ao elemento
+    do prefixo ('infNFe/ide/mod' -> 'ide/mod') e os demais são buscados dentro dele.
+    Com namespace, os XPaths são compilados para a árvore com esse namespace.
+    
+    Retorna a lista de XPaths compilados; descrições textuais e expressões
+    inválidas são descartadas (lista vazia = caminho apenas descritivo).
+    """
+    compilados = []
+    for caminho in _alternativas(xpath):
         # Normaliza xpath
-        if not caminho.startswith('/'):
-            caminho = '//' + caminho
+        if caminho.startswith('/'):
+            expressao = caminho
+        elif prefixo is None:
+            expressao = '//' + caminho
+        elif caminho == prefixo:
+            expressao = '.'
+        elif caminho.startswith(prefixo + '/'):
+            expressao = caminho[len(prefixo) + 1:]
+        else:
+            expressao = './/' + caminho
         
+        compilado = _compilar(expressao, namespace)
+        if compilado is not None:
+            compilados.append(compilado)
+    
+    return compilados
+
+
+def compilar_caminho_relativo(xpath, prefixo, namespace=None):
+    """
+    Compila as alternativas de um caminho_xml relativas ao elemento do prefixo.
+    
+    Ex: 'infNFe/det/prod/NCM' com prefixo 'infNFe/det' vira o XPath 'prod/NCM',
+    avaliado a partir de cada <det>. Retorna None se alguma alternativa não
+    estiver sob o prefixo (o campo precisa então ser avaliado na nota toda).
+    """
+    for caminho in _alternativas(xpath):
+        if caminho != prefixo and not caminho.startswith(prefixo + '/'):
+            # Descrição textual com '/' é ignorada também no modo nota
+            if _compilar('//' + caminho) is not None:
+                return None
+    
+    return compilar_caminho(xpath, prefixo, namespace)
+
+
+def compilar_mapeamento(mapeamento):
+    """
+    Monta o plano de extração a partir do mapping_config.json (uma única vez por execução).
+    
+    Cada entrada do plano é um dict com:
+        campo: nome do campo no mapeamento
+        tipo: 'especial' (tratado por função própria), 'xpath' ou 'descricao'
+              (caminho_xml apenas textual, ex: "filhos de infNFe/det/imposto/*")
+        caminho_xml: caminho original do mapeamento
+        xpaths: {namespace: lista de etree.XPath relativos ao <infNFe>}
+        xpaths_item: {namespace: XPaths relativos ao <det>} (campos ITEM_ sob
+                     infNFe/det), ou None quando o campo precisa ser avaliado na nota toda
+        bloco: True para campos _BLOCO (retornam o elemento)
+        item: True para campos ITEM_
+    
+    Os XPaths já saem compilados para o namespace da NF-e e para árvores sem
+    namespace; outros namespaces são compilados no primeiro uso (_xpaths_da_entrada).
+    """
+    plano = []
+    for campo, config in mapeamento.items():
+        caminho_xml = config.get('caminho_xml', '')
+        xpaths = {}
+        xpaths_item = None
+        if campo in CAMPOS_ESPECIAIS:
+            tipo = 'especial'
+        else:
+            for namespace in (NAMESPACE_NFE, None):
+                xpaths[namespace] = compilar_caminho(caminho_xml, PREFIXO_NOTA, namespace)
+            tipo = 'xpath' if xpaths[NAMESPACE_NFE] else 'descricao'
+            if tipo == 'xpath' and campo.startswith('ITEM_'):
+                if compilar_caminho_relativo(caminho_xml, PREFIXO_ITEM) is not None:
+                    xpaths_item = {
+                        namespace: compilar_caminho(caminho_xml, PREFIXO_ITEM, namespace)
+                        for namespace in (NAMESPACE_NFE, None)
+                    }
+        
+        plano.append({
+            'campo': campo,
+            'tipo': tipo,
+            'caminho_xml': caminho_xml,
+            'xpaths': xpaths,
+            'xpaths_item': xpaths_item,
+            'bloco': campo.endswith('_BLOCO'),
+            'item': campo.startswith('ITEM_'),
+        })
+    
+    return plano
+
+
+def _xpaths_da_entrada(entrada, namespace, chave='xpaths'):
+    """XPaths de uma entrada do plano para o namespace da nota (compilados no primeiro uso)"""
+    compilados = entrada[chave]
+    if namespace not in compilados:
+        prefixo = PREFIXO_ITEM if chave == 'xpaths_item' else PREFIXO_NOTA
+        compilados[namespace] = compilar_caminho(entrada['caminho_xml'], prefixo, namespace)
+    return compilados[namespace]
+
+
+def ler_mapeamento(caminho_mapeamento=ARQUIVO_MAPEAMENTO):
+    """Lê o mapping_config.json"""
+    with open(caminho_mapeamento, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def carregar_plano(caminho_mapeamento=ARQUIVO_MAPEAMENTO):
+    """Lê o mapping_config.json e retorna o plano de extração compilado"""
+    return compilar_mapeamento(ler_mapeamento(caminho_mapeamento))
+
+
+def avaliar_xpaths(raiz, xpaths, retornar_elemento=False):
+    """Avalia XPaths compilados em ordem, retornando o primeiro resultado encontrado"""
+    for xpath in xpaths:
         try:
-            elementos = raiz.xpath(caminho)
+            elementos = xpath(raiz)
             if elementos:
                 # Se for atributo ou texto
                 if isinstance(elementos[0], str):
@@ -105,7 +333,7 @@ def extrair_valor(raiz, xpath, retornar_elemento=False):
                     if elementos[0].text:
                         valores = [e.text.strip() for e in elementos if e.text]
                         return valores if len(valores) > 1 else (valores[0] if valores else None)
-        except:
+        except etree.XPathEvalError:
             continue
     
     return None
@@ -120,263 +348,348 @@ def elemento_para_dict(elemento):
     if isinstance(elemento, list):
         return [elemento_para_dict(e) for e in elemento]
     
-    # Retorna o nome da tag do primeiro filho (ex: ICMS61, ICMS00, etc)
+    # Retorna o nome da tag do primeiro filho, sem namespace (ex: ICMS61, ICMS00, etc)
     if len(elemento) > 0:
-        return elemento[0].tag
+        return nome_local(elemento[0])
     
     return None
 
 
-def extrair_todos_impostos(raiz):
-    """Extrai todos os impostos presentes no item"""
-    # Busca todos os itens da nota
-    itens = raiz.xpath('//infNFe/det')
-    
-    if not itens:
-        return None
-    
-    # Para cada item, verifica os impostos
-    resultados_por_item = []
-    for item in itens:
-        impostos = item.xpath('imposto/*')
-        impostos_do_item = []
-        
-        for imposto in impostos:
-            tag = imposto.tag
-            impostos_do_item.append(tag)
-        
-        # Adiciona resultado do item (None se não houver impostos)
-        resultados_por_item.append(', '.join(impostos_do_item) if impostos_do_item else None)
-    
-    # Retorna lista se múltiplos itens, ou valor único se apenas um item
-    return resultados_por_item if len(resultados_por_item) > 1 else (resultados_por_item[0] if resultados_por_item else None)
+def _valor_regra(elemento, caminho):
+    """Valor (texto) de um caminho fixo de regra, com a mesma semântica de avaliar_xpaths"""
+    return avaliar_xpaths(elemento, [_xpath_regra(caminho, namespace_do_elemento(elemento))])
 
 
-def extrair_outros_impostos(raiz):
-    """Extrai impostos não convencionais do item (diferentes de ICMS, IPI, PIS, COFINS, ISSQN)"""
-    impostos_padrao = {'ICMS', 'IPI', 'PIS', 'COFINS', 'ISSQN'}
-    # impostos_padrao = {}
-    
-    # Busca todos os itens da nota
-    itens = raiz.xpath('//infNFe/det')
-    
-    if not itens:
-        return None
+def _impostos_do_item(det, apenas_outros=False):
+    """Lista as tags de imposto de um <det> (opcionalmente só as não convencionais)"""
+    tags = (nome_local(imposto) for imposto in _regra(det, CAMINHO_IMPOSTOS_ITEM))
+    impostos = [tag for tag in tags if not apenas_outros or tag not in IMPOSTOS_PADRAO]
+    return ', '.join(impostos) if impostos else None
+
+
+def _item_tem_icms_ufdest(det):
+    """REGRA 1 do DIFAL: existe ICMSUFDest em qualquer ponto do item"""
+    return bool(_regra(det, CAMINHO_ICMS_UFDEST_ITEM))
+
+
+def _dados_regra2_difal(nota):
+    """Extrai os dados do nível da nota (<infNFe>) usados na REGRA 2 do DIFAL"""
+    return {
+        'ind_final': _valor_regra(nota, CAMINHO_IND_FINAL),
+        'uf_emitente': _valor_regra(nota, CAMINHO_UF_EMITENTE),
+        'uf_destinatario': _valor_regra(nota, CAMINHO_UF_DESTINATARIO),
+        'ind_ie_dest': _valor_regra(nota, CAMINHO_IND_IE_DEST),
+    }
+
+
+def _condicoes_regra2_difal(dados):
+    """Avalia as condições da REGRA 2 do DIFAL (aplica-se a todos os itens da nota)"""
+    return {
+        'cond1': dados['ind_final'] == '1',
+        'cond2': dados['uf_emitente'] is not None,
+        'cond3': dados['uf_destinatario'] is not None,
+        'cond4': dados['uf_emitente'] != dados['uf_destinatario'],
+        'cond5': dados['ind_ie_dest'] == '9',
+    }
+
+
+def _regra2_difal(nota, debug=False):
+    """Calcula a REGRA 2 do DIFAL uma vez por nota (<infNFe>), imprimindo os dados se debug"""
+    dados = _dados_regra2_difal(nota)
+    condicoes = _condicoes_regra2_difal(dados)
     
-    # Para cada item, verifica os impostos
-    resultados_por_item = []
-    for item in itens:
-        impostos = item.xpath('imposto/*')
-        outros_do_item = []
-        
-        for imposto in impostos:
-            tag = imposto.tag
-            if tag not in impostos_padrao:
-                outros_do_item.append(tag)
-        
-        # Adiciona resultado do item (None se não houver outros impostos)
-        resultados_por_item.append(', '.join(outros_do_item) if outros_do_item else None)
+    if debug:
+        print(f"  [DIFAL] indFinal={dados['ind_final']}, UF_Emit={dados['uf_emitente']}, UF_Dest={dados['uf_destinatario']}, indIEDest={dados['ind_ie_dest']}")
+        print(f"  [DIFAL] Condições: indFinal=='1':{condicoes['cond1']}, UF_emit!=None:{condicoes['cond2']}, UF_dest!=None:{condicoes['cond3']}, UFs_diferentes:{condicoes['cond4']}, indIEDest=='9':{condicoes['cond5']}")
     
-    # Retorna lista se múltiplos itens, ou valor único se apenas um item
-    return resultados_por_item if len(resultados_por_item) > 1 else (resultados_por_item[0] if resultados_por_item else None)
+    return all(condicoes.values())
 
 
-def verificar_difal(raiz, debug=False):
+def extrair_itens(nota, plano, debug_difal=False):
     """
-    Verifica se incide DIFAL (Diferencial de Alíquota) por item.
-    
-    REGRA 1: Se existe tag ICMSUFDest no item → incide DIFAL
-    REGRA 2: Se cumprir os 3 requisitos simultaneamente:
-        - Destinatário = consumidor final (indFinal = 1)
-        - Operação interestadual (UF emitente != UF destinatário)
-        - Destinatário não contribuinte do ICMS (indIEDest = 9)
+    Extrai os campos ITEM_ percorrendo cada <det> do <infNFe> uma única vez.
     
-    Retorna lista de '1' (incide) ou '0' (não incide) para cada item
+    Cada campo é avaliado no próprio subtree do item, então um item sem a tag
+    (ex: sem IPI/*/CST) fica com None em vez de deslocar os valores dos demais.
+    Campos ITEM_ fora de infNFe/det são avaliados na nota e distribuídos
+    por posição, como antes.
     """
-    print(f"  [DIFAL DEBUG] Função chamada, debug={debug}")
-    
-    # Busca todos os itens da nota
-    itens = raiz.xpath('//infNFe/det')
-    
-    if not itens:
-        print(f"  [DIFAL DEBUG] Nenhum item encontrado!")
+    entradas = [entrada for entrada in plano if entrada['item']]
+    if not entradas:
         return None
     
-    print(f"  [DIFAL DEBUG] {len(itens)} itens encontrados")
-    
-    # Extrai dados do nível da nota para REGRA 2
-    ind_final = extrair_valor(raiz, 'infNFe/ide/indFinal')
-    uf_emitente = extrair_valor(raiz, 'infNFe/emit/enderEmit/UF')
-    uf_destinatario = extrair_valor(raiz, 'infNFe/dest/enderDest/UF')
-    ind_ie_dest = extrair_valor(raiz, 'infNFe/dest/indIEDest')
-    
-    print(f"  [DIFAL] indFinal={ind_final}, UF_Emit={uf_emitente}, UF_Dest={uf_destinatario}, indIEDest={ind_ie_dest}")
-    
-    # Verifica REGRA 2 (aplica-se a todos os itens da nota)
-    cond1 = ind_final == '1'
-    cond2 = uf_emitente is not None
-    cond3 = uf_destinatario is not None
-    cond4 = uf_emitente != uf_destinatario
-    cond5 = ind_ie_dest == '9'
-    
-    print(f"  [DIFAL] Condições: indFinal=='1':{cond1}, UF_emit!=None:{cond2}, UF_dest!=None:{cond3}, UFs_diferentes:{cond4}, indIEDest=='9':{cond5}")
-    
-    regra2_atendida = cond1 and cond2 and cond3 and cond4 and cond5
-    
-    if debug:
-        print(f"  [DIFAL] REGRA 2 atendida: {regra2_atendida}")
-    
-    # Para cada item, verifica REGRA 1 ou REGRA 2
-    resultados_por_item = []
-    for idx, item in enumerate(itens, 1):
-        # REGRA 1: Verifica se existe ICMSUFDest no item
-        # Testa todos os caminhos possíveis
-        tem_icms_ufdest = bool(
-            item.xpath('imposto/ICMSUFDest') or 
-            item.xpath('.//ICMSUFDest') or
-            item.xpath('imposto/ICMS/ICMSUFDest') or
-            item.xpath('imposto/ICMS/*/ICMSUFDest')
-        )
-        
-        if debug and tem_icms_ufdest:
-            print(f"  [DIFAL] Item {idx}: Encontrou ICMSUFDest")
-        
-        if tem_icms_ufdest or regra2_atendida:
-            resultados_por_item.append('1')  # Incide DIFAL
-        else:
-            resultados_por_item.append('0')  # Não incide DIFAL
-    
-    if debug:
-        print(f"  [DIFAL] Resultado: {resultados_por_item}")
+    namespace = namespace_do_elemento(nota)
+    dets = _regra(nota, CAMINHO_ITENS)
+    
+    # REGRA 2 do DIFAL é da nota: calcula uma vez só
+    regra2_difal = False
+    if dets and any(entrada['campo'] == 'ITEM_TEM_DIFAL' for entrada in entradas):
+        regra2_difal = _regra2_difal(nota, debug=debug_difal)
+    
+    # Campos de item que não estão sob infNFe/det: avaliados na nota toda
+    valores_documento = {}
+    for entrada in entradas:
+        if entrada['tipo'] == 'xpath' and entrada['xpaths_item'] is None:
+            xpaths = _xpaths_da_entrada(entrada, namespace)
+            valor = avaliar_xpaths(nota, xpaths, retornar_elemento=entrada['bloco'])
+            if entrada['bloco'] and valor is not None:
+                valor = elemento_para_dict(valor)
+            valores_documento[entrada['campo']] = valor
+    
+    # Nota sem <det>: mantém um item vazio, como no layout anterior
+    itens = []
+    for i, det in enumerate(dets or [None]):
+        item = {}
+        for entrada in entradas:
+            campo = entrada['campo']
+            nome_limpo = campo[5:]  # Remove 'ITEM_'
+            
+            if campo in valores_documento:
+                valor = valores_documento[campo]
+                if isinstance(valor, list):
+                    valor = valor[i] if i < len(valor) else None
+            elif det is None or entrada['tipo'] == 'descricao':
+                valor = None
+            elif campo == 'ITEM_TODOS_IMPOSTOS':
+                valor = _impostos_do_item(det)
+            elif campo == 'ITEM_OUTROS_IMPOSTOS':
+                valor = _impostos_do_item(det, apenas_outros=True)
+            elif campo == 'ITEM_TEM_DIFAL':
+                tem_icms_ufdest = _item_tem_icms_ufdest(det)
+                if debug_difal and tem_icms_ufdest:
+                    print(f"  [DIFAL] Item {i + 1}: Encontrou ICMSUFDest")
+                valor = '1' if tem_icms_ufdest or regra2_difal else '0'
+            elif entrada['tipo'] == 'especial':
+                valor = None
+            else:
+                xpaths = _xpaths_da_entrada(entrada, namespace, 'xpaths_item')
+                valor = avaliar_xpaths(det, xpaths, retornar_elemento=entrada['bloco'])
+                # Converte elemento XML em dict se for bloco
+                if entrada['bloco'] and valor is not None:
+                    valor = elemento_para_dict(valor)
+            
+            item[nome_limpo] = valor
+        itens.append(item)
     
-    # Retorna lista se múltiplos itens, ou valor único se apenas um item
-    return resultados_por_item if len(resultados_por_item) > 1 else (resultados_por_item[0] if resultados_por_item else None)
+    return itens
 
 
-def processar_xml(caminho_xml, mapeamento, debug_difal=True):
-    """Processa um XML e extrai dados conforme mapeamento"""
-    tree = etree.parse(caminho_xml)
-    
-    # Extrai namespace antes de remover
-    namespace = extrair_namespace_raiz(tree)
-    
-    # Remove namespaces para facilitar XPath
-    raiz = remover_namespace(tree.getroot())
+def processar_nota(elemento, namespace, plano, debug_difal=True):
+    """
+    Extrai os dados de uma nota conforme o plano de extração.
     
+    elemento: <infNFe> gerado por iterar_notas (ou a raiz de um documento sem
+    infNFe, ex: NFSe); namespace: namespace da raiz do documento.
+    Retorna None para CT-e.
+    """
     # [NOVO] Verifica se é CT-e e pula se for
-    if raiz.xpath('//infCte'):
+    if nome_local(elemento) == 'infCte':
         print("  [INFO] Arquivo identificado como CT-e -> Pulando...")
         return None
     
+    # Os XPaths do plano são avaliados direto na árvore com namespace
+    nota = elemento
+    namespace_nota = namespace_do_elemento(nota)
+    
     # Extrai tipo de documento (passa namespace para análise)
-    tipo_documento = extrair_tipo_documento(raiz, namespace)
+    tipo_documento = extrair_tipo_documento(nota, namespace)
     
     dados_nota = {}
-    campos_item = {}
     
-    # Extrai cada campo do mapeamento
-    for campo, config in mapeamento.items():
-        # Campos especiais tratados separadamente
-        if campo == 'NAMESPACE_RAIZ':
-            dados_nota[campo] = namespace
-            continue
-        elif campo == 'TIPO_DOCUMENTO':
-            dados_nota[campo] = tipo_documento
-            continue
-        elif campo == 'ITEM_OUTROS_IMPOSTOS':
-            # Função especial para extrair outros impostos
-            valor = extrair_outros_impostos(raiz)
-            campos_item[campo] = valor
-            continue
-        elif campo == 'ITEM_TODOS_IMPOSTOS':
-            # Função especial para extrair todos impostos
-            valor = extrair_todos_impostos(raiz)
-            campos_item[campo] = valor
-            continue        
-        elif campo == 'ITEM_TEM_DIFAL':
-            # Função especial para verificar DIFAL por item
-            valor = verificar_difal(raiz, debug=debug_difal)
-            campos_item[campo] = valor
+    # Executa cada entrada do plano no nível da nota
+    for entrada in plano:
+        campo = entrada['campo']
+        
+        # Campos de item são extraídos por extrair_itens
+        if entrada['item']:
             continue
         
-        xpath = config.get('caminho_xml', '')
+        # Campos especiais tratados separadamente
+        if entrada['tipo'] == 'especial':
+            if campo == 'NAMESPACE_RAIZ':
+                dados_nota[campo] = namespace
+            elif campo == 'TIPO_DOCUMENTO':
+                dados_nota[campo] = tipo_documento
+            elif campo == 'CHAVE_ACESSO':
+                dados_nota[campo] = extrair_chave_acesso(nota)
+            continue
         
-        # Verifica se é campo BLOCO (precisa retornar estrutura completa)
-        eh_bloco = campo.endswith('_BLOCO')
-        valor = extrair_valor(raiz, xpath, retornar_elemento=eh_bloco)
+        # Campos apenas descritivos não têm XPath a executar
+        if entrada['tipo'] == 'descricao':
+            valor = None
+        else:
+            # Campo BLOCO precisa retornar estrutura completa
+            xpaths = _xpaths_da_entrada(entrada, namespace_nota)
+            valor = avaliar_xpaths(nota, xpaths, retornar_elemento=entrada['bloco'])
         
         # Converte elemento XML em dict se for bloco
-        if eh_bloco and valor is not None:
+        if entrada['bloco'] and valor is not None:
             valor = elemento_para_dict(valor)
         
-        # Separa campos de item dos campos de nota
-        if campo.startswith('ITEM_'):
-            campos_item[campo] = valor
-        else:
-            dados_nota[campo] = valor
-    
-    # Organiza itens em lista
-    if campos_item:
-        # Descobre quantos itens
-        num_itens = 1
-        for valor in campos_item.values():
-            if isinstance(valor, list):
-                num_itens = max(num_itens, len(valor))
-        
-        # Monta lista de itens
-        itens = []
-        for i in range(num_itens):
-            item = {}
-            for nome_campo, valor in campos_item.items():
-                nome_limpo = nome_campo[5:]  # Remove 'ITEM_'
-                
-                if isinstance(valor, list):
-                    item[nome_limpo] = valor[i] if i < len(valor) else None
-                else:
-                    item[nome_limpo] = valor
-            
-            itens.append(item)
-        
+        dados_nota[campo] = valor
+    
+    # Organiza itens em lista (um dict por <det>)
+    itens = extrair_itens(nota, plano, debug_difal=debug_difal)
+    if itens is not None:
         dados_nota['ITEMS'] = itens
     
     return dados_nota
 
 
-def processar_pasta():
-    """Processa todos XMLs da pasta e gera JSON final"""
-    # Carrega mapeamento
-    with open(ARQUIVO_MAPEAMENTO, 'r', encoding='utf-8') as f:
-        mapeamento = json.load(f)
+def _preparar_plano(plano):
+    """Aceita o plano compilado ou o dict do mapeamento (compilado na hora)"""
+    if isinstance(plano, dict):
+        return compilar_mapeamento(plano)
+    return plano
+
+
+def processar_arquivo(caminho_xml, plano, debug_difal=True):
+    """
+    Gera os dados de cada nota do arquivo, lendo o XML em streaming.
+    
+    Um arquivo pode ter uma nota, um bundle nfeProc ou vários documentos
+    concatenados; CT-e são pulados.
+    """
+    plano = _preparar_plano(plano)
+    for elemento, namespace in iterar_notas(caminho_xml):
+        dados = processar_nota(elemento, namespace, plano, debug_difal=debug_difal)
+        if dados is not None:
+            yield dados
+
+
+def processar_xml(caminho_xml, plano, debug_difal=True):
+    """
+    Processa um XML e extrai dados conforme o plano de extração.
+    
+    Retorna os dados da primeira nota do arquivo (None se for CT-e).
+    Para arquivos com várias notas, use processar_arquivo.
+    """
+    plano = _preparar_plano(plano)
+    for elemento, namespace in iterar_notas(caminho_xml):
+        return processar_nota(elemento, namespace, plano, debug_difal=debug_difal)
+    return None
+
+
+# Plano de extração de cada processo worker (carregado uma vez no initializer)
+_PLANO_WORKER = None
+
+
+def _inicializar_worker(caminho_mapeamento):
+    """Carrega e compila o mapeamento uma única vez por processo worker"""
+    global _PLANO_WORKER
+    _PLANO_WORKER = carregar_plano(caminho_mapeamento)
+
+
+def _processar_arquivo_worker(tarefa):
+    """
+    Processa um arquivo inteiro dentro do worker.
     
+    Retorna (notas, erro): as notas do arquivo, ou a mensagem de erro
+    (nesse caso nenhuma nota do arquivo é aproveitada).
+    """
+    caminho, _, debug_difal = tarefa
+    try:
+        return list(processar_arquivo(caminho, _PLANO_WORKER, debug_difal=debug_difal)), None
+    except Exception as e:
+        return [], str(e)
+
+
+def processar_pasta(pasta=PASTA_XMLS, arquivo_saida=ARQUIVO_SAIDA, workers=WORKERS, chunksize=CHUNKSIZE,
+                    usar_cache=USAR_CACHE, pasta_cache=PASTA_CACHE, formato=FORMATO_SAIDA):
+    """
+    Processa todos XMLs da pasta e gera o arquivo final (JSON, NDJSON ou Parquet)
+    
+    Com workers != 1 os arquivos são distribuídos num pool de processos
+    (em lotes de chunksize); as notas são gravadas na ordem dos arquivos.
+    Com usar_cache, arquivos já extraídos com o mesmo conteúdo e o mesmo
+    mapeamento são lidos do cache e só os novos ou alterados são processados.
+    A extensão de arquivo_saida segue o formato (ex: .parquet com formato='parquet').
+    Retorna {'total_notas': int, 'erros': [{'arquivo': ..., 'erro': ...}],
+    'em_cache': int}.
+    """
     # Lista XMLs
-    arquivos = [f for f in os.listdir(PASTA_XMLS) if f.endswith('.xml')]
+    arquivos = [f for f in os.listdir(pasta) if f.endswith('.xml')]
     print(f"Processando {len(arquivos)} XMLs")
     
-    # Processa cada XML
-    notas = []
-    for i, arquivo in enumerate(arquivos, 1):
-        caminho = os.path.join(PASTA_XMLS, arquivo)
-        print(f"[{i}/{len(arquivos)}] {arquivo}")
+    # Ativa debug apenas na primeira nota
+    tarefas = [
+        (os.path.join(pasta, arquivo), arquivo, i == 1)
+        for i, arquivo in enumerate(arquivos, 1)
+    ]
+    erros = []
+    
+    mapeamento = ler_mapeamento(ARQUIVO_MAPEAMENTO)
+    cache = CacheNotas(mapeamento, pasta_cache) if usar_cache else None
+    
+    # Consulta o cache antes de processar: (identificação, notas ou None) por arquivo
+    consultas = []
+    for caminho, _, _ in tarefas:
+        identificacao = notas = None
+        if cache is not None:
+            try:
+                identificacao = cache.identificar(caminho)
+                notas = cache.ler(identificacao)
+            except OSError:
+                # Arquivo ilegível: o erro é registrado ao processá-lo
+                pass
+        consultas.append((identificacao, notas))
+    
+    pendentes = [tarefa for tarefa, (_, notas) in zip(tarefas, consultas) if notas is None]
+    
+    # Processa os XMLs pendentes, gravando as notas na ordem dos arquivos
+    arquivo_saida = caminho_saida(arquivo_saida, formato)
+    with criar_escritor(arquivo_saida, formato) as escritor:
+        if workers == 1:
+            # Compila o plano de extração uma única vez
+            plano = compilar_mapeamento(mapeamento)
+            
+            def executar(tarefa):
+                try:
+                    return list(processar_arquivo(tarefa[0], plano, debug_difal=tarefa[2])), None
+                except Exception as e:
+                    return [], str(e)
+            
+            resultados = map(executar, pendentes)
+            pool = None
+        else:
+            pool = Pool(
+                processes=workers,
+                initializer=_inicializar_worker,
+                initargs=(ARQUIVO_MAPEAMENTO,),
+            )
+            # imap devolve os resultados na mesma ordem das tarefas
+            resultados = pool.imap(_processar_arquivo_worker, pendentes, chunksize=chunksize)
         
         try:
-            # Ativa debug apenas na primeira nota
-            debug_difal = (i == 1)
-            dados = processar_xml(caminho, mapeamento, debug_difal=debug_difal)
-            
-            if dados is None:
-                continue
+            for i, ((_, arquivo, _), (identificacao, notas)) in enumerate(zip(tarefas, consultas), 1):
+                if notas is not None:
+                    print(f"[{i}/{len(arquivos)}] {arquivo} (cache)")
+                else:
+                    print(f"[{i}/{len(arquivos)}] {arquivo}")
+                    notas, erro = next(resultados)
+                    if erro is not None:
+                        erros.append({'arquivo': arquivo, 'erro': erro})
+                        continue
+                    if identificacao is not None:
+                        cache.gravar(identificacao, notas)
                 
-            dados['xml_filename'] = arquivo
-            notas.append(dados)
-        except Exception as e:
-            print(f"  Erro: {e}")
-    
-    # Salva resultado
-    os.makedirs('output', exist_ok=True)
-    with open(ARQUIVO_SAIDA, 'w', encoding='utf-8') as f:
-        json.dump(notas, f, indent=4, ensure_ascii=False)
-    
-    print(f"\nConcluído: {len(notas)} notas salvas em {ARQUIVO_SAIDA}")
+                for dados in notas:
+                    dados['xml_filename'] = arquivo
+                    escritor.escrever(dados)
+        finally:
+            if pool is not None:
+                pool.terminate()
+    
+    em_cache = cache.acertos if cache is not None else 0
+    print(f"\nConcluído: {escritor.total} notas salvas em {arquivo_saida}")
+    if em_cache:
+        print(f"  {em_cache} arquivo(s) lidos do cache")
+    if erros:
+        print(f"  {len(erros)} arquivo(s) com erro:")
+        for erro in erros:
+            print(f"    {erro['arquivo']}: {erro['erro']}")
+    
+    return {'total_notas': escritor.total, 'erros': erros, 'em_cache': em_cache}
 
 
 # ==============================================================================
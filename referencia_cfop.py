@@ -0,0 +1,109 @@
+import os
+import pickle
+
+import pandas as pd
+from typing import Any, Dict, Iterable, Optional
+
+# ==============================================================================
+# CONFIGURAÇÃO
+# ==============================================================================
+
+ARQUIVO_BASE_CFOP = 'base/base_cfop.xlsx'
+ARQUIVO_RELATORIO_CFOP = 'base/relatorio_cfop.xlsx'
+
+COLUNA_CODIGO = 'Codigo CFOP'
+COLUNA_DESCRICAO = 'Descricao'
+
+# Cache binário (pickle) gravado ao lado da planilha: .<nome>.cache.pkl
+SUFIXO_CACHE = '.cache.pkl'
+
+# ==============================================================================
+# FUNÇÕES
+# ==============================================================================
+
+def chave_cfop(cfop: Any) -> str:
+    """Normaliza o código para busca (mesma comparação usada na planilha: str + strip)."""
+    return str(cfop).strip()
+
+
+def caminho_cache(caminho: str) -> str:
+    """Caminho do cache binário de uma planilha (ex: base/.base_cfop.xlsx.cache.pkl)."""
+    pasta, nome = os.path.split(caminho)
+    return os.path.join(pasta, '.' + nome + SUFIXO_CACHE)
+
+
+def ler_planilha_cfop(caminho: str = ARQUIVO_BASE_CFOP) -> pd.DataFrame:
+    """
+    Lê a planilha de CFOP, usando o cache binário quando ele está em dia.
+
+    O cache guarda o mtime e o tamanho da planilha; se a planilha mudar (ou
+    o cache estiver ilegível), ela é lida de novo com pd.read_excel e o cache
+    é regravado. Sem permissão de escrita, segue sem cache.
+    """
+    estado = os.stat(caminho)
+    marca = (estado.st_mtime_ns, estado.st_size)
+    arquivo_cache = caminho_cache(caminho)
+
+    try:
+        with open(arquivo_cache, 'rb') as f:
+            marca_cache, df = pickle.load(f)
+        if marca_cache == marca:
+            return df
+    except Exception:
+        # Cache ausente, corrompido ou de outra versão do pandas
+        pass
+
+    df = pd.read_excel(caminho)
+    temporario = f'{arquivo_cache}.{os.getpid()}.tmp'
+    try:
+        with open(temporario, 'wb') as f:
+            pickle.dump((marca, df), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporario, arquivo_cache)
+    except OSError:
+        pass
+    return df
+
+
+def montar_tabela_cfop(df: pd.DataFrame) -> Dict[str, Any]:
+    """
+    Monta o dict {codigo: descricao} a partir de uma planilha de CFOP.
+
+    Se o código aparecer mais de uma vez, vale a primeira linha (como no
+    filtro da planilha com iloc[0]).
+    """
+    chaves = df[COLUNA_CODIGO].astype(str).str.strip()
+    tabela = {}
+    for chave, descricao in zip(chaves, df[COLUNA_DESCRICAO]):
+        tabela.setdefault(chave, descricao)
+    return tabela
+
+
+def carregar_tabela_cfop(*caminhos: str) -> Dict[str, Any]:
+    """
+    Lê uma ou mais planilhas de CFOP (base_cfop.xlsx, relatorio_cfop.xlsx)
+    e retorna o dict {codigo: descricao}.
+
+    Com várias planilhas, as primeiras têm prioridade e as seguintes só
+    completam os códigos que faltam. Sem argumentos, lê ARQUIVO_BASE_CFOP.
+    """
+    tabela: Dict[str, Any] = {}
+    for caminho in caminhos or (ARQUIVO_BASE_CFOP,):
+        for chave, descricao in montar_tabela_cfop(ler_planilha_cfop(caminho)).items():
+            tabela.setdefault(chave, descricao)
+    return tabela
+
+
+def descricao_cfop(tabela: Dict[str, Any], cfop: Any, padrao: Optional[Any] = None) -> Any:
+    """Descrição de um CFOP (padrao se não estiver na tabela)."""
+    return tabela.get(chave_cfop(cfop), padrao)
+
+
+def descricoes_cfop(tabela: Dict[str, Any], cfops: Iterable[Any]) -> pd.Series:
+    """
+    Busca em lote: descrição de cada CFOP de uma coluna (Series ou iterável).
+
+    Códigos não encontrados ficam como NaN; o índice da Series original é mantido.
+    """
+    if not isinstance(cfops, pd.Series):
+        cfops = pd.Series(list(cfops), dtype=object)
+    return cfops.map(chave_cfop).map(tabela)
@@ -0,0 +1,429 @@
+import json
+import numpy as np
+import pandas as pd
+from typing import Any, Dict, Iterable, List, Optional
+
+import gerar_relatorio_customizado_v3 as relatorio
+from formatos_notas import COLUNA_QTD_ITENS, ler_tabelas_parquet
+from referencia_cfop import chave_cfop
+
+# ==============================================================================
+# CONFIGURAÇÃO
+# ==============================================================================
+
+# Separador das partes de "Cenario" e "Infos Adicionais"
+SEPARADOR = ' | '
+
+# Campos lidos pelo relatório (as únicas colunas carregadas de uma saída Parquet)
+CAMPOS_NOTA = [
+    'NUMERO_NF', 'TIPO_NF', 'IND_FINAL', 'MODELO', 'TRANSP_MOD_FRETE', 'TIPO_DOCUMENTO',
+    'NATUREZA_OPERACAO', 'INF_CPL', 'INF_COMPLEMENTARES', 'INF_FISCO', 'CONSUMIDOR_FINAL',
+    'DEST_IND_IE_DEST', 'DIFAL_EMIT_UF', 'DIFAL_DEST_UF', 'EMIT_CNPJ', 'EMIT_CPF',
+    'EMIT_RAZAO_SOCIAL', 'EMIT_UF', 'DEST_CNPJ', 'DEST_CPF', 'DEST_RAZAO_SOCIAL', 'DEST_UF',
+]
+CAMPOS_ITEM = [
+    'NUMERO', 'NCM', 'XPROD', 'CFOP', 'ICMS_CST', 'ICMS_CSOSN', 'ICMS_PICMS', 'ICMS_VBC',
+    'IPI_CST', 'IPI_BLOCO', 'IPI_VIPI', 'PIS_CST', 'PIS_PPIS', 'COFINS_CST', 'COFINS_PCOFINS',
+    'ISSQN_BLOCO', 'TEM_ISSQN', 'DIFAL_UFDEST_BLOCO', 'TEM_DIFAL', 'OUTROS_IMPOSTOS',
+    'TODOS_IMPOSTOS', 'INFO_ADICIONAL',
+]
+
+# Classificação do ICMS no cenário (mesma ordem de teste de gerar_cenario)
+CST_ICMS_ST = ['10', '60', '70']
+CST_ICMS_ISENTO = ['40', '41', '50']
+
+# ==============================================================================
+# FUNÇÕES AUXILIARES
+# ==============================================================================
+
+class _Registros:
+    """
+    Lista de dicts (notas ou itens) com acesso por coluna.
+
+    Quando todos os registros têm as mesmas chaves (o normal na saída do
+    processador), as colunas saem de um único DataFrame.from_records; senão,
+    cada coluna é lida com registro.get(chave, padrao).
+    """
+
+    def __init__(self, registros: List[Dict[str, Any]], tabela: Optional[pd.DataFrame] = None):
+        self.registros = registros
+        self.tabela = tabela
+        if tabela is None and registros:
+            chaves = registros[0].keys()
+            if all(registro.keys() == chaves for registro in registros):
+                self.tabela = pd.DataFrame.from_records(registros, columns=list(chaves))
+
+    @classmethod
+    def de_tabela(cls, tabela: pd.DataFrame) -> '_Registros':
+        """Registros já em colunas (ex: tabela Parquet); colunas ausentes valem o padrão."""
+        return cls([], tabela.reset_index(drop=True))
+
+    def __len__(self) -> int:
+        return len(self.tabela) if self.tabela is not None else len(self.registros)
+
+
+def _coluna(registros: _Registros, chave: str, padrao: Any = None) -> pd.Series:
+    """Equivalente a registro.get(chave, padrao) para todos os registros (dtype object)."""
+    if registros.tabela is None:
+        return pd.Series([registro.get(chave, padrao) for registro in registros.registros], dtype=object)
+    if chave not in registros.tabela:
+        return pd.Series([padrao] * len(registros), dtype=object)
+    # Chave presente em todos: só None vira NaN no from_records, então volta para None
+    serie = registros.tabela[chave].astype(object)
+    return serie.where(serie.notna(), None).reset_index(drop=True)
+
+
+def _verdadeiro(serie: pd.Series) -> np.ndarray:
+    """bool(valor) elemento a elemento (None e '' são falsos)."""
+    return serie.to_numpy(dtype=object).astype(bool)
+
+
+def _texto(serie: pd.Series) -> pd.Series:
+    """str(valor) elemento a elemento (None vira 'None', como no f-string/str)."""
+    return serie.astype(str)
+
+
+def _de_para(chaves: pd.Series, tabela: Dict[str, str], prefixo: str) -> np.ndarray:
+    """tabela.get(chave, f'{prefixo} {chave}') elemento a elemento."""
+    return np.where(chaves.isin(tabela.keys()), chaves.map(tabela), prefixo + ' ' + chaves)
+
+
+def _juntar(partes: List[np.ndarray]) -> np.ndarray:
+    """Junta as partes não vazias de cada linha com SEPARADOR."""
+    resultado = np.asarray(partes[0], dtype=object)
+    for parte in partes[1:]:
+        parte = np.asarray(parte, dtype=object)
+        resultado = np.where(
+            parte == '',
+            resultado,
+            np.where(resultado == '', parte, resultado + SEPARADOR + parte),
+        )
+    return resultado
+
+
+def _se(condicao: np.ndarray, valor: Any, senao: Any = '') -> np.ndarray:
+    return np.where(condicao, valor, senao).astype(object)
+
+# ==============================================================================
+# COLUNAS DO NÍVEL DA NOTA
+# ==============================================================================
+
+def _colunas_nota(notas: _Registros) -> Dict[str, Any]:
+    """Calcula, uma vez por nota, os valores repetidos em todos os itens dela."""
+    tipo_nf = _coluna(notas, 'TIPO_NF', '')
+    operacao = _se(tipo_nf == '0', 'ENTRADA', 'SAIDA')
+
+    # Consumidor final: IND_FINAL=1 ou modelo 65 (get_consumidor_final)
+    ind_final = _texto(_coluna(notas, 'IND_FINAL', ''))
+    modelo = _texto(_coluna(notas, 'MODELO', '')).str.strip()
+    consumidor_final = _se((ind_final == '1') | (modelo == '65'), 'SIM', 'NAO')
+
+    # Transporte (get_transporte_info)
+    mod_frete = _coluna(notas, 'TRANSP_MOD_FRETE')
+    sem_frete = mod_frete.isna().to_numpy() | (mod_frete == '').to_numpy()
+    transporte = _se(
+        sem_frete,
+        'Não Informado',
+        _de_para(_texto(mod_frete), relatorio.TABELA_MOD_FRETE, 'Modalidade'),
+    )
+
+    emit_cnpj = _coluna(notas, 'EMIT_CNPJ')
+    dest_cnpj = _coluna(notas, 'DEST_CNPJ')
+
+    # Partes do cenário que dependem só da nota (_partes_cenario_nota)
+    tipo_doc = _coluna(notas, 'TIPO_DOCUMENTO', 'N/A')
+    parte_tipo_doc = _se(_verdadeiro(tipo_doc), tipo_doc.where(_verdadeiro(tipo_doc), '').str.upper())
+    serie_transporte = pd.Series(transporte, dtype=object)
+    parte_transporte = np.select(
+        [
+            serie_transporte.str.contains('Emitente', regex=False),
+            serie_transporte.str.contains('Destinatário', regex=False),
+            serie_transporte.str.contains('Terceiro', regex=False),
+            serie_transporte.str.contains('Sem Frete', regex=False),
+        ],
+        ['FRETE-EMIT', 'FRETE-DEST', 'FRETE-3º', 'SEM-FRETE'],
+        '',
+    ).astype(object)
+    natop = _coluna(notas, 'NATUREZA_OPERACAO', '')
+    natop_texto = natop.where(_verdadeiro(natop), '')
+    natop_resumida = _se(natop_texto.str.len() > 25, natop_texto.str.slice(0, 25) + '...', natop_texto)
+    cenario_nota = _juntar([parte_tipo_doc, operacao, parte_transporte, natop_resumida])
+
+    # Informações adicionais da nota (get_info_adicionais, sem a parte do item)
+    inf_cpl = _coluna(notas, 'INF_CPL')
+    info_contrib = inf_cpl.where(_verdadeiro(inf_cpl), _coluna(notas, 'INF_COMPLEMENTARES'))
+    info_fisco = _coluna(notas, 'INF_FISCO')
+    info_nota = _juntar([
+        _se(_verdadeiro(info_contrib), '[CONTRIBUINTE]: ' + _texto(info_contrib)),
+        _se(_verdadeiro(info_fisco), '[FISCO]: ' + _texto(info_fisco)),
+    ])
+
+    return {
+        'Numero Nota': _coluna(notas, 'NUMERO_NF', '').to_numpy(),
+        'Tipo': _coluna(notas, 'TIPO_DOCUMENTO', '').to_numpy(),
+        'CNPJ/CPF Emissor': _se(_verdadeiro(emit_cnpj), emit_cnpj, _coluna(notas, 'EMIT_CPF', '')),
+        'Razão Social Emissor': _coluna(notas, 'EMIT_RAZAO_SOCIAL', '').to_numpy(),
+        'CNPJ/CPF Destinatário': _se(_verdadeiro(dest_cnpj), dest_cnpj, _coluna(notas, 'DEST_CPF', '')),
+        'Razão Social Destinatário': _coluna(notas, 'DEST_RAZAO_SOCIAL', '').to_numpy(),
+        'UF Emissor': _coluna(notas, 'EMIT_UF', '').to_numpy(),
+        'UF Destinatário': _coluna(notas, 'DEST_UF', '').to_numpy(),
+        'Operação': operacao,
+        'Consumidor Final': consumidor_final,
+        'Transporte': transporte,
+        'NATOP': natop.to_numpy(),
+        # Usadas no cálculo do DIFAL e das colunas compostas
+        '_cenario': cenario_nota,
+        '_info_adicionais': info_nota,
+        '_difal_ind_final': _texto(_coluna(notas, 'CONSUMIDOR_FINAL', '0')).to_numpy(),
+        '_difal_ind_ie_dest': _texto(_coluna(notas, 'DEST_IND_IE_DEST', '')).to_numpy(),
+        '_difal_uf_emit': _coluna(notas, 'DIFAL_EMIT_UF').to_numpy(),
+        '_difal_uf_dest': _coluna(notas, 'DIFAL_DEST_UF').to_numpy(),
+    }
+
+# ==============================================================================
+# FUNÇÃO PRINCIPAL
+# ==============================================================================
+
+def montar_dataframe_notas_vetorizado(
+    notas: Iterable[Dict[str, Any]],
+    modo_json_nota: str = 'linha',
+    notas_json: Optional[List[Dict[str, Any]]] = None,
+) -> pd.DataFrame:
+    """
+    Versão vetorizada de gerar_relatorio_customizado_v3.montar_dataframe_notas.
+
+    Achata notas e itens em colunas e calcula as classificações (CST, CFOP,
+    DIFAL, cenário) com operações de pandas/numpy sobre a coluna inteira, em
+    vez de chamar os classificadores item a item. Produz as mesmas colunas,
+    na mesma ordem e com os mesmos valores; os parâmetros são os mesmos.
+    """
+    if modo_json_nota not in relatorio.MODOS_JSON_NOTA:
+        raise ValueError(f"modo_json_nota inválido: {modo_json_nota} (use {', '.join(relatorio.MODOS_JSON_NOTA)})")
+
+    # 1. Achata: uma lista de notas e uma de itens, com a posição da nota de cada item
+    lista_notas = []
+    itens = []
+    itens_por_nota = []
+    jsons = []
+    for idx, nota in enumerate(notas, 1):
+        items = nota.get('ITEMS', [])
+        lista_notas.append(nota)
+        itens.extend(items)
+        itens_por_nota.append(len(items))
+
+        if modo_json_nota == 'linha':
+            jsons.append(json.dumps(nota, ensure_ascii=False, indent=2))
+        elif modo_json_nota == 'aba' and notas_json is not None:
+            notas_json.append({
+                "ID Nota": idx,
+                "Numero Nota": nota.get('NUMERO_NF', ''),
+                "JSON da nota": json.dumps(nota, ensure_ascii=False, indent=2),
+            })
+
+    if not itens:
+        return pd.DataFrame()
+
+    json_por_nota = np.asarray(jsons, dtype=object) if modo_json_nota == 'linha' else None
+    return _montar_relatorio(_Registros(lista_notas), _Registros(itens), np.asarray(itens_por_nota), json_por_nota)
+
+
+def montar_dataframe_parquet(caminho: str) -> pd.DataFrame:
+    """
+    Monta o relatório direto de uma saída Parquet do processador, sem
+    remontar as notas em dicts: só as colunas de CAMPOS_NOTA/CAMPOS_ITEM são
+    lidas e as classificações são feitas sobre as colunas.
+
+    Equivale a montar_dataframe_notas(ler_notas(caminho), 'omitir') (o JSON
+    da nota não existe nas tabelas; para ele, use montar_dataframe_notas_vetorizado).
+    """
+    tabela_notas, tabela_itens = ler_tabelas_parquet(caminho, CAMPOS_NOTA + [COLUNA_QTD_ITENS], CAMPOS_ITEM)
+    itens_por_nota = tabela_notas[COLUNA_QTD_ITENS].fillna(0).to_numpy(dtype=np.int64)
+    if not itens_por_nota.sum():
+        return pd.DataFrame()
+    return _montar_relatorio(
+        _Registros.de_tabela(tabela_notas),
+        _Registros.de_tabela(tabela_itens),
+        itens_por_nota,
+        None,
+    )
+
+
+def _montar_relatorio(
+    notas: _Registros,
+    itens: _Registros,
+    itens_por_nota: np.ndarray,
+    json_por_nota: Optional[np.ndarray],
+) -> pd.DataFrame:
+    """Calcula as colunas do relatório a partir das notas e dos itens já achatados."""
+    posicao_nota = np.repeat(np.arange(len(notas)), itens_por_nota)
+    inicio_da_nota = np.cumsum(itens_por_nota) - itens_por_nota
+    posicao_item = np.arange(len(itens)) - inicio_da_nota[posicao_nota]
+    nota_de = {
+        chave: np.asarray(valores, dtype=object)[posicao_nota]
+        for chave, valores in _colunas_nota(notas).items()
+    }
+
+    # 2. Colunas do item
+    cfop = _coluna(itens, 'CFOP', '')
+    cfop_texto = _texto(cfop)
+    chaves_cfop = cfop.map(chave_cfop)
+    tabela_cfop = relatorio.TABELA_CFOP
+    desc_cfop = np.where(
+        ~_verdadeiro(cfop),
+        'CFOP não informado',
+        np.where(chaves_cfop.isin(tabela_cfop.keys()), chaves_cfop.map(tabela_cfop), 'CFOP ' + cfop_texto),
+    ).astype(object)
+
+    icms_cst = _coluna(itens, 'ICMS_CST')
+    cst_icms = pd.Series(np.where(_verdadeiro(icms_cst), icms_cst, _coluna(itens, 'ICMS_CSOSN', '')), dtype=object)
+    tem_cst_icms = _verdadeiro(cst_icms)
+    cst_icms_texto = _texto(cst_icms)
+    csosn = (cst_icms_texto.str.len() == 3).to_numpy()
+    desc_cst_icms = _se(
+        ~tem_cst_icms,
+        'N/A',
+        np.where(
+            csosn,
+            _de_para(cst_icms_texto, relatorio.TABELA_CSOSN_ICMS, 'CSOSN'),
+            _de_para(cst_icms_texto, relatorio.TABELA_CST_ICMS, 'CST'),
+        ),
+    )
+
+    # IPI (get_ipi_status / get_tipi_aplicavel)
+    cst_ipi = _coluna(itens, 'IPI_CST', '')
+    cst_ipi_texto = _texto(cst_ipi)
+    enquadramento_ipi = np.select(
+        [~_verdadeiro(cst_ipi), cst_ipi_texto.isin(['50', '51']), cst_ipi_texto.isin(['52', '53', '54', '55', '99'])],
+        ['SEM_IPI', 'TRIBUTADO', 'ISENTO'],
+        'OUTROS',
+    ).astype(object)
+    tipi = _se(
+        ~_verdadeiro(_coluna(itens, 'IPI_BLOCO')) | cst_ipi_texto.isin(['52', '53', '54', '55']).to_numpy(),
+        'NAO',
+        'SIM',
+    )
+
+    # PIS/COFINS (get_cofins_status)
+    cst_pis = _coluna(itens, 'PIS_CST', '')
+    cst_cofins = _coluna(itens, 'COFINS_CST', '')
+    cst_cofins_texto = _texto(cst_cofins)
+    tem_cofins = np.select(
+        [
+            ~_verdadeiro(cst_cofins),
+            cst_cofins_texto.isin(['07', '08', '09']),
+            cst_cofins_texto.isin(['01', '02', '03', '04', '05', '06']),
+        ],
+        ['NAO', 'NAO', 'SIM'],
+        'OUTRO',
+    ).astype(object)
+
+    tem_issqn = _se(
+        _coluna(itens, 'ISSQN_BLOCO').notna().to_numpy() | _coluna(itens, 'TEM_ISSQN').notna().to_numpy(),
+        'SIM',
+        'NAO',
+    )
+
+    # 3. DIFAL (identificar_difal): regras em ordem de prioridade com np.select
+    uf_emit = nota_de['_difal_uf_emit']
+    uf_dest = nota_de['_difal_uf_dest']
+    emit_verdadeiro = uf_emit.astype(bool)
+    dest_verdadeiro = uf_dest.astype(bool)
+    # Reproduz "uf_emit and uf_dest and uf_emit != uf_dest" (pode valer None ou '')
+    interestadual = np.where(
+        ~emit_verdadeiro,
+        uf_emit,
+        np.where(~dest_verdadeiro, uf_dest, (uf_emit != uf_dest).astype(object)),
+    ).astype(object)
+    ind_final = nota_de['_difal_ind_final']
+    ind_ie_dest = nota_de['_difal_ind_ie_dest']
+    saida_interestadual_cf = interestadual.astype(bool) & cfop_texto.str.startswith('6').to_numpy() & (ind_final == '1')
+
+    regras = [
+        _verdadeiro(_coluna(itens, 'DIFAL_UFDEST_BLOCO')) | (_coluna(itens, 'TEM_DIFAL') == '1').to_numpy(),
+        saida_interestadual_cf & (ind_ie_dest == '9'),
+        saida_interestadual_cf & (ind_ie_dest == '1'),
+    ]
+    motivos = [
+        'Bloco ICMSUFDest presente no item',
+        'Operação Interestadual, Consumidor Final Não Contribuinte',
+        'DIFAL Contribuinte (Uso/Consumo ou Ativo Imobilizado)',
+    ]
+    tem_difal = regras[0] | regras[1] | regras[2]
+    motivo_difal = np.select(regras, motivos, 'Sem incidência').astype(object)
+
+    # 4. Colunas compostas
+    parte_icms = _se(
+        tem_cst_icms,
+        np.select(
+            [
+                cst_icms_texto.isin(CST_ICMS_ST),
+                cst_icms_texto == '61',
+                cst_icms_texto.isin(CST_ICMS_ISENTO),
+                csosn,
+            ],
+            ['ICMS-ST', 'ICMS-MONO', 'ICMS-ISENTO', 'SIMPLES'],
+            'ICMS-NORMAL',
+        ),
+    )
+    cenario = _juntar([nota_de['_cenario'], parte_icms, _se(tem_difal, 'COM-DIFAL')])
+
+    numero_item = _coluna(itens, 'NUMERO')
+    numero_item = np.where(_verdadeiro(numero_item), numero_item, posicao_item + 1).astype(object)
+    info_item = _coluna(itens, 'INFO_ADICIONAL')
+    parte_info_item = _se(
+        _verdadeiro(info_item),
+        '[ITEM ' + pd.Series(numero_item, dtype=object).astype(str) + ']: ' + _texto(info_item),
+    )
+    infos_adicionais = _juntar([nota_de['_info_adicionais'], parte_info_item])
+
+    # 5. Monta o relatório na mesma ordem de colunas de montar_dataframe_notas
+    if json_por_nota is not None:
+        coluna_json = {'JSON da nota': json_por_nota[posicao_nota]}
+    else:
+        coluna_json = {'ID Nota': posicao_nota + 1}
+
+    colunas = {
+        'ID': np.arange(len(itens)),
+        'Cenario': cenario,
+        'Numero Nota': nota_de['Numero Nota'],
+        **coluna_json,
+        **{nome: nota_de[nome] for nome in [
+            'Tipo', 'CNPJ/CPF Emissor', 'Razão Social Emissor', 'CNPJ/CPF Destinatário',
+            'Razão Social Destinatário', 'UF Emissor', 'UF Destinatário', 'Operação',
+            'Consumidor Final', 'Transporte',
+        ]},
+        'NCM': _coluna(itens, 'NCM', ''),
+        'Classificação/Produto': _coluna(itens, 'XPROD', ''),
+        'NATOP': nota_de['NATOP'],
+        'CFOP': cfop,
+        'DESC CFOP': desc_cfop,
+        'CST ICMS': cst_icms,
+        'DESC CST ICMS': desc_cst_icms,
+        '%ICMS Normal': _coluna(itens, 'ICMS_PICMS', '0'),
+        'ICMS VBC': _coluna(itens, 'ICMS_VBC', '0'),
+        'CST IPI': cst_ipi,
+        'ENQUADRAMENTO IPI': enquadramento_ipi,
+        '%IPI': _coluna(itens, 'IPI_VIPI', '0.00'),
+        'TIPI': tipi,
+        'CST PIS': cst_pis,
+        'DESC CST PIS': _de_para(_texto(cst_pis), relatorio.TABELA_CST_PIS_COFINS, 'CST'),
+        '%PIS': _coluna(itens, 'PIS_PPIS', ''),
+        'CST COFINS': cst_cofins,
+        'DESC CST COFINS': tem_cofins,
+        '%CONFINS': _coluna(itens, 'COFINS_PCOFINS', ''),
+        'Sujeito a ISS?': tem_issqn,
+        'DIFAL': tem_difal,
+        'DIFAL motivo': motivo_difal,
+        'DIFAL interestadual': interestadual,
+        'DIFAL consumidor final': ind_final,
+        'DIFAL ind_ie_dest': ind_ie_dest,
+        'DIFAL cfop': cfop_texto,
+        'Outros Impostos': _coluna(itens, 'OUTROS_IMPOSTOS', ''),
+        'Todos Impostos': _coluna(itens, 'TODOS_IMPOSTOS', ''),
+        'Infos Adicionais': infos_adicionais,
+    }
+
+    # Mesma inferência de tipos de pd.DataFrame(lista de dicts)
+    return pd.DataFrame({
+        nome: np.asarray(valores, dtype=object) for nome, valores in colunas.items()
+    }).infer_objects()
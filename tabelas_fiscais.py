@@ -0,0 +1,78 @@
+# ==============================================================================
+# TABELAS DE DE-PARA
+# ==============================================================================
+# Compartilhadas pelos geradores de relatório e pelo esquema de colunas
+# (esquema_relatorio), sem que um precise importar o outro.
+
+# CST IPI
+TABELA_CST_IPI = {
+    '00': 'Entrada com recuperação de crédito',
+    '01': 'Entrada tributada com alíquota zero',
+    '02': 'Entrada isenta',
+    '03': 'Entrada não-tributada',
+    '04': 'Entrada imune',
+    '05': 'Entrada com suspensão',
+    '49': 'Outras entradas',
+    '50': 'Saída tributada',
+    '51': 'Saída tributada com alíquota zero',
+    '52': 'Saída isenta',
+    '53': 'Saída não-tributada',
+    '54': 'Saída imune',
+    '55': 'Saída com suspensão',
+    '99': 'Outras saídas',
+}
+
+# CST PIS/COFINS
+TABELA_CST_PIS_COFINS = {
+    '01': 'Operação Tributável com Alíquota Básica',
+    '02': 'Operação Tributável com Alíquota Diferenciada',
+    '03': 'Operação Tributável com Alíquota por Unidade de Medida de Produto',
+    '04': 'Operação Tributável Monofásica - Revenda a Alíquota Zero',
+    '05': 'Operação Tributável por Substituição Tributária',
+    '06': 'Operação Tributável a Alíquota Zero',
+    '07': 'Operação Isenta da Contribuição',
+    '08': 'Operação sem Incidência da Contribuição',
+    '09': 'Operação com Suspensão da Contribuição',
+    '49': 'Outras Operações de Saída',
+    '50': 'Operação com Direito a Crédito - Vinculada Exclusivamente a Receita Tributada no Mercado Interno',
+    '99': 'Outras Operações',
+}
+
+# CST ICMS (Regime Normal - NF-e/NFC-e)
+TABELA_CST_ICMS = {
+    '00': 'Tributada integralmente',
+    '10': 'Tributada e com cobrança do ICMS por substituição tributária',
+    '20': 'Com redução da base de cálculo',
+    '30': 'Isenta ou não tributada e com cobrança do ICMS por substituição tributária',
+    '40': 'Isenta',
+    '41': 'Não tributada',
+    '50': 'Suspensão',
+    '51': 'Diferimento',
+    '60': 'ICMS cobrado anteriormente por substituição tributária',
+    '70': 'Com redução de base de cálculo e cobrança do ICMS por substituição tributária',
+    '90': 'Outras',
+}
+
+# CSOSN ICMS (Simples Nacional)
+TABELA_CSOSN_ICMS = {
+    '101': 'Tributada pelo Simples Nacional com permissão de crédito',
+    '102': 'Tributada pelo Simples Nacional sem permissão de crédito',
+    '103': 'Isenção do ICMS no Simples Nacional para faixa de receita bruta',
+    '201': 'Tributada pelo Simples Nacional com permissão de crédito e com cobrança do ICMS por substituição tributária',
+    '202': 'Tributada pelo Simples Nacional sem permissão de crédito e com cobrança do ICMS por substituição tributária',
+    '203': 'Isenção do ICMS no Simples Nacional para faixa de receita bruta e com cobrança do ICMS por substituição tributária',
+    '300': 'Imune',
+    '400': 'Não tributada pelo Simples Nacional',
+    '500': 'ICMS cobrado anteriormente por substituição tributária (substituído) ou por antecipação',
+    '900': 'Outros (a critério da UF)',
+}
+
+# Modalidades de Frete
+TABELA_MOD_FRETE = {
+    '0': 'Por Conta do Emitente',
+    '1': 'Por Conta do Destinatário',
+    '2': 'Por Conta de Terceiro',
+    '3': 'Por Conta de Terceiro (Comodato)',
+    '4': 'Sem Movimento Físico',
+    '9': 'Sem Frete',
+}